@@ -0,0 +1,155 @@
+# api/async_proxy.py
+"""Proxy Valhalla asynchrone (ASGI + httpx), pendant de ValhallaProxyView.
+
+Une requête longue (matrix `sources_to_targets`, isochrone) n'occupe plus un
+worker uWSGI : elle n'est qu'une coroutine en attente dans la boucle d'événements
+d'un process uvicorn, qui peut en gérer des milliers en parallèle. Utilisé à la
+place de la vue synchrone quand settings.VALHALLA_ASYNC_PROXY est actif.
+"""
+
+import asyncio
+import os
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+
+from . import response_cache, singleflight, upstream
+
+
+# Requêtes amont simultanées max par process (toutes routes confondues)
+VALHALLA_ASYNC_PROXY_MAX_CONNECTIONS = int(os.getenv("VALHALLA_ASYNC_PROXY_MAX_CONNECTIONS", "1000"))
+VALHALLA_ASYNC_PROXY_KEEPALIVE = int(os.getenv("VALHALLA_ASYNC_PROXY_KEEPALIVE", "100"))
+
+HOP_BY_HOP = ('host', 'connection', 'keep-alive', 'transfer-encoding')
+
+_client = None
+_client_loop = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Client httpx partagé par la boucle d'événements courante (pool keep-alive)."""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=VALHALLA_ASYNC_PROXY_MAX_CONNECTIONS,
+                max_keepalive_connections=VALHALLA_ASYNC_PROXY_KEEPALIVE,
+            ),
+            timeout=httpx.Timeout(60, connect=5),
+            trust_env=False,
+        )
+        _client_loop = loop
+    return _client
+
+
+async def _resolve(alias: str) -> dict | None:
+    # Chemin rapide sans thread : la route est en cache
+    route = upstream.cached_route(alias)
+    if route is not None:
+        return route
+    return await sync_to_async(upstream.resolve)(alias)
+
+
+async def _stream_and_close(resp: httpx.Response, port: int):
+    """Relaie le corps en streaming puis libère la connexion amont."""
+    try:
+        async for chunk in resp.aiter_raw():
+            yield chunk
+    finally:
+        await resp.aclose()
+        upstream.release(port)
+
+
+async def async_valhalla_proxy(request, graph_alias=None, path=''):
+    """Proxy toutes les requêtes Valhalla vers le conteneur du graph, sans bloquer de worker."""
+    route = await _resolve(graph_alias)
+    if route is None:
+        return JsonResponse({'error': 'Graph non trouvé ou non servi'}, status=404)
+    if not route['ports']:
+        return JsonResponse({'error': 'Aucun port Valhalla pour ce graph'}, status=502)
+
+    action = path
+    query_string = request.META.get('QUERY_STRING', '')
+    if query_string:
+        path += '?' + query_string
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP}
+    body = request.body or None
+
+    # Réponse déjà calculée par ce build (cache opt-in, voir response_cache)
+    def cache_key(route):
+        return response_cache.cache_key(
+            graph_alias, route['build_id'], request.method, action, query_string, body, request.headers
+        )
+    key = cache_key(route)
+    if key is not None:
+        entry = await response_cache.aget(key)
+        if entry is not None:
+            return response_cache.to_response(entry, 'HIT')
+
+    async def forward(route, share):
+        """Appel amont ; retourne (réponse, entrée bufferisée ou None)."""
+        client = _get_client()
+        for attempt in range(2):
+            port = upstream.pick(route)
+            try:
+                req = client.build_request(request.method, upstream.upstream_url(port, path), headers=headers, content=body)
+                resp = await client.send(req, stream=True)
+                break
+            except httpx.ConnectError as e:
+                # Replica arrêté ou remplacé (bascule de release) : l'écarter, relire la route et réessayer une fois
+                upstream.release(port)
+                upstream.eject(port)
+                upstream.invalidate(graph_alias)
+                route = await _resolve(graph_alias) if attempt == 0 else None
+                if route is None or not route['ports']:
+                    return JsonResponse({'error': f'Erreur proxy Valhalla: {str(e)}'}, status=502), None
+            except httpx.HTTPError as e:
+                upstream.release(port)
+                return JsonResponse({'error': f'Erreur proxy Valhalla: {str(e)}'}, status=502), None
+
+        # Réponse de taille raisonnable : la bufferiser pour la mettre en cache / la partager
+        store_key = cache_key(route) if key is not None else None
+        max_bytes = singleflight.VALHALLA_PROXY_COALESCE_MAX_BYTES if share else None
+        if (store_key is not None or share) and response_cache.is_storable(resp.status_code, resp.headers, max_bytes):
+            try:
+                content = b''.join([chunk async for chunk in resp.aiter_raw()])
+            except httpx.HTTPError as e:
+                return JsonResponse({'error': f'Erreur proxy Valhalla: {str(e)}'}, status=502), None
+            finally:
+                await resp.aclose()
+                upstream.release(port)
+            entry = response_cache.make_entry(resp.status_code, resp.headers, content)
+            if store_key is not None:
+                await response_cache.aset(store_key, entry)
+            return response_cache.to_response(entry, 'MISS'), entry
+
+        proxy_response = StreamingHttpResponse(_stream_and_close(resp, port), status=resp.status_code)
+        for k, v in resp.headers.items():
+            if k.lower() not in HOP_BY_HOP:
+                proxy_response[k] = v
+        return proxy_response, None
+
+    # Requête identique déjà en vol dans cette boucle : partager sa réponse (voir singleflight)
+    fkey = singleflight.flight_key(
+        graph_alias, route['build_id'], request.method, action, query_string, body, request.headers
+    )
+    if fkey is None:
+        return (await forward(route, False))[0]
+    flight, leader = singleflight.abegin(fkey)
+    if not leader:
+        entry = await singleflight.await_flight(flight)
+        if entry is not None:
+            return response_cache.to_response(entry, 'COALESCED')
+        return (await forward(route, False))[0]
+    entry = None
+    try:
+        response, entry = await forward(route, True)
+        return response
+    finally:
+        singleflight.aend(fkey, flight, entry)
+
+
+# Équivalent de csrf_exempt (le décorateur n'accepte les coroutines qu'à partir de Django 5)
+async_valhalla_proxy.csrf_exempt = True
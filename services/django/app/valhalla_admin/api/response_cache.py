@@ -0,0 +1,134 @@
+# api/response_cache.py
+"""Cache des réponses Valhalla idempotentes (route, locate, isochrone…) dans Redis.
+
+Opt-in (VALHALLA_PROXY_CACHE=1). Clé = alias + build servi + action + requête
+normalisée (JSON trié, paramètres de query triés) : une reconstruction change
+le build servi et rend donc les anciennes entrées inaccessibles, qui expirent
+ensuite par TTL. La taille est bornée par entrée (VALHALLA_PROXY_CACHE_MAX_ENTRY_BYTES)
+et globalement par Redis (`maxmemory` + `volatile-lru`, voir docker-compose).
+
+Le client peut contourner le cache avec `Cache-Control: no-cache`.
+"""
+
+import hashlib
+import json
+import os
+from urllib.parse import parse_qsl
+
+from django.core.cache import caches
+from django.http import HttpResponse
+
+
+VALHALLA_PROXY_CACHE = os.getenv("VALHALLA_PROXY_CACHE", "0") in ("1", "true", "True")
+VALHALLA_PROXY_CACHE_TTL = int(os.getenv("VALHALLA_PROXY_CACHE_TTL", "3600"))
+VALHALLA_PROXY_CACHE_MAX_ENTRY_BYTES = int(os.getenv("VALHALLA_PROXY_CACHE_MAX_ENTRY_BYTES", str(1024 * 1024)))
+VALHALLA_PROXY_CACHE_ACTIONS = {
+    a.strip() for a in os.getenv("VALHALLA_PROXY_CACHE_ACTIONS", "route,locate,isochrone").split(",") if a.strip()
+}
+
+CACHE_ALIAS = "valhalla_proxy"
+# En-têtes de réponse conservés avec le corps
+STORED_HEADERS = ("content-type", "content-encoding", "access-control-allow-origin")
+
+
+def _normalize_json(raw) -> str | None:
+    try:
+        return json.dumps(json.loads(raw), sort_keys=True, separators=(",", ":"))
+    except (TypeError, ValueError):
+        return None
+
+
+def request_key(alias: str, build_id, method: str, path: str, query_string: str, body: bytes | None, headers) -> str | None:
+    """Empreinte d'une requête Valhalla (indépendante de l'ordre des clés JSON), None si non normalisable."""
+    if method not in ("GET", "POST"):
+        return None
+
+    # `?json=` (GET) et corps JSON (POST) désignent la même requête Valhalla
+    params = []
+    payload = None
+    for k, v in parse_qsl(query_string or "", keep_blank_values=True):
+        if k == "json":
+            payload = _normalize_json(v)
+            if payload is None:
+                return None
+        else:
+            params.append((k, v))
+    if body:
+        payload = _normalize_json(body)
+        if payload is None:
+            return None
+
+    gzip = "gzip" in (headers.get("Accept-Encoding") or "").lower()
+    material = json.dumps([path.strip("/"), sorted(params), payload, gzip], separators=(",", ":"))
+    digest = hashlib.sha256(material.encode()).hexdigest()
+    return f"{alias}:{build_id}:{digest}"
+
+
+def cache_key(alias: str, build_id, method: str, path: str, query_string: str, body: bytes | None, headers) -> str | None:
+    """Clé de cache de la requête, None si elle ne doit pas être mise en cache."""
+    if not VALHALLA_PROXY_CACHE or path.strip("/") not in VALHALLA_PROXY_CACHE_ACTIONS:
+        return None
+    if "no-cache" in (headers.get("Cache-Control") or "").lower():
+        return None
+    key = request_key(alias, build_id, method, path, query_string, body, headers)
+    return f"vp:{key}" if key is not None else None
+
+
+def is_storable(status: int, headers, max_bytes: int | None = None) -> bool:
+    """Réponse 200 de taille connue et raisonnable (≤ max_bytes)."""
+    if status != 200:
+        return False
+    try:
+        length = int(headers.get("Content-Length"))
+    except (TypeError, ValueError):
+        return False
+    return length <= (VALHALLA_PROXY_CACHE_MAX_ENTRY_BYTES if max_bytes is None else max_bytes)
+
+
+def make_entry(status: int, headers, body: bytes) -> dict:
+    return {
+        "status": status,
+        "headers": {k: v for k, v in headers.items() if k.lower() in STORED_HEADERS},
+        "body": body,
+    }
+
+
+def to_response(entry: dict, cache_status: str) -> HttpResponse:
+    response = HttpResponse(entry["body"], status=entry["status"])
+    for k, v in entry["headers"].items():
+        response[k] = v
+    response["X-Cache"] = cache_status
+    return response
+
+
+def get(key: str) -> dict | None:
+    # Redis indisponible : le proxy fonctionne sans cache
+    try:
+        return caches[CACHE_ALIAS].get(key)
+    except Exception:
+        return None
+
+
+def set(key: str, entry: dict) -> None:
+    if len(entry["body"]) > VALHALLA_PROXY_CACHE_MAX_ENTRY_BYTES:
+        return
+    try:
+        caches[CACHE_ALIAS].set(key, entry, VALHALLA_PROXY_CACHE_TTL)
+    except Exception:
+        pass
+
+
+async def aget(key: str) -> dict | None:
+    try:
+        return await caches[CACHE_ALIAS].aget(key)
+    except Exception:
+        return None
+
+
+async def aset(key: str, entry: dict) -> None:
+    if len(entry["body"]) > VALHALLA_PROXY_CACHE_MAX_ENTRY_BYTES:
+        return
+    try:
+        await caches[CACHE_ALIAS].aset(key, entry, VALHALLA_PROXY_CACHE_TTL)
+    except Exception:
+        pass
@@ -0,0 +1,77 @@
+# api/singleflight.py
+"""Regroupement des requêtes identiques en vol (single-flight) pour le proxy Valhalla.
+
+Quand plusieurs clients envoient simultanément la même requête lourde
+(`sources_to_targets`, `isochrone`…) au même graph, seule la première (le
+« leader ») est transmise au container ; les suivantes attendent sa réponse,
+bufferisée en mémoire, et la reçoivent telle quelle (`X-Cache: COALESCED`).
+
+Si la réponse du leader n'est pas partageable (erreur, taille inconnue ou
+supérieure à VALHALLA_PROXY_COALESCE_MAX_BYTES) ou n'arrive pas à temps, les
+suivantes font leur propre appel.
+
+Réservé au proxy asynchrone (async_proxy) : le regroupement est local à la boucle
+d'un process uvicorn, où des milliers de requêtes attendent en parallèle. Sous
+uWSGI (processes sans threads), un process ne traite qu'une requête à la fois et
+n'aurait jamais de suiveur ; entre process, le cache de réponses (response_cache)
+prend le relais quand il est actif.
+"""
+
+import asyncio
+import os
+
+from . import response_cache
+
+
+VALHALLA_PROXY_COALESCE = os.getenv("VALHALLA_PROXY_COALESCE", "1") not in ("0", "false", "False")
+VALHALLA_PROXY_COALESCE_ACTIONS = {
+    a.strip() for a in os.getenv(
+        "VALHALLA_PROXY_COALESCE_ACTIONS", "sources_to_targets,isochrone,route,optimized_route"
+    ).split(",") if a.strip()
+}
+VALHALLA_PROXY_COALESCE_MAX_BYTES = int(os.getenv("VALHALLA_PROXY_COALESCE_MAX_BYTES", str(16 * 1024 * 1024)))
+# Attente max d'un suiveur (≥ timeout amont du proxy)
+VALHALLA_PROXY_COALESCE_WAIT = float(os.getenv("VALHALLA_PROXY_COALESCE_WAIT", "65"))
+
+
+class Flight:
+    """Appel amont en cours ; `entry` (voir response_cache.make_entry) une fois terminé, None si non partageable."""
+
+    def __init__(self, event):
+        self.event = event
+        self.entry = None
+
+
+_async_flights: dict[str, Flight] = {}
+
+
+def flight_key(alias: str, build_id, method: str, path: str, query_string: str, body: bytes | None, headers) -> str | None:
+    """Clé de regroupement de la requête, None si elle ne doit pas être regroupée."""
+    if not VALHALLA_PROXY_COALESCE or path.strip("/") not in VALHALLA_PROXY_COALESCE_ACTIONS:
+        return None
+    return response_cache.request_key(alias, build_id, method, path, query_string, body, headers)
+
+
+# Un seul thread par boucle : pas de verrou nécessaire
+
+def abegin(key: str) -> tuple[Flight, bool]:
+    flight = _async_flights.get(key)
+    if flight is not None:
+        return flight, False
+    flight = _async_flights[key] = Flight(asyncio.Event())
+    return flight, True
+
+
+async def await_flight(flight: Flight) -> dict | None:
+    try:
+        await asyncio.wait_for(flight.event.wait(), VALHALLA_PROXY_COALESCE_WAIT)
+    except asyncio.TimeoutError:
+        return None
+    return flight.entry
+
+
+def aend(key: str, flight: Flight, entry: dict | None) -> None:
+    if _async_flights.get(key) is flight:
+        del _async_flights[key]
+    flight.entry = entry
+    flight.event.set()
@@ -0,0 +1,34 @@
+from valhalla_admin.api import response_cache
+
+
+def test_cache_key_normalization(monkeypatch):
+    monkeypatch.setattr(response_cache, "VALHALLA_PROXY_CACHE", True)
+    key = response_cache.cache_key
+    body = b'{"locations": [{"lat": 1, "lon": 2}], "costing": "auto"}'
+    same = b'{"costing":"auto","locations":[{"lon":2,"lat":1}]}'
+
+    k = key("fr", 1, "POST", "route", "", body, {})
+    assert k is not None and k.startswith("vp:fr:1:")
+    # Ordre des clés JSON, GET ?json= équivalent
+    assert key("fr", 1, "POST", "route", "", same, {}) == k
+    assert key("fr", 1, "GET", "route", "json=" + same.decode(), None, {}) == k
+    # Nouveau build, autre encodage accepté, autre requête : autre clé
+    assert key("fr", 2, "POST", "route", "", body, {}) != k
+    assert key("fr", 1, "POST", "route", "", body, {"Accept-Encoding": "gzip"}) != k
+    assert key("fr", 1, "POST", "isochrone", "", body, {}) != k
+
+    # Non cacheables : action exclue, corps invalide, no-cache
+    assert key("fr", 1, "POST", "status", "", body, {}) is None
+    assert key("fr", 1, "POST", "route", "", b"not json", {}) is None
+    assert key("fr", 1, "POST", "route", "", body, {"Cache-Control": "no-cache"}) is None
+
+    monkeypatch.setattr(response_cache, "VALHALLA_PROXY_CACHE", False)
+    assert key("fr", 1, "POST", "route", "", body, {}) is None
+
+
+def test_is_storable():
+    assert response_cache.is_storable(200, {"Content-Length": "10"})
+    assert not response_cache.is_storable(400, {"Content-Length": "10"})
+    assert not response_cache.is_storable(200, {})
+    too_big = str(response_cache.VALHALLA_PROXY_CACHE_MAX_ENTRY_BYTES + 1)
+    assert not response_cache.is_storable(200, {"Content-Length": too_big})
@@ -0,0 +1,37 @@
+import asyncio
+from valhalla_admin.api import singleflight
+
+
+def test_followers_share_leader_entry():
+    key = "fr:1:abc"
+    entry = {"status": 200, "headers": {}, "body": b"{}"}
+
+    async def scenario():
+        flight, leader = singleflight.abegin(key)
+        assert leader
+
+        async def follower():
+            f, is_leader = singleflight.abegin(key)
+            assert not is_leader and f is flight
+            return await singleflight.await_flight(f)
+
+        followers = [asyncio.ensure_future(follower()) for _ in range(5)]
+        await asyncio.sleep(0)
+        singleflight.aend(key, flight, entry)
+        results = await asyncio.gather(*followers)
+
+        # Appel terminé : la requête suivante redevient leader
+        flight2, leader = singleflight.abegin(key)
+        assert leader and flight2 is not flight
+        singleflight.aend(key, flight2, None)
+        return results, await singleflight.await_flight(flight2)
+
+    results, last = asyncio.run(scenario())
+    assert results == [entry] * 5
+    assert last is None
+
+
+def test_flight_key_filters_actions():
+    assert singleflight.flight_key("fr", 1, "POST", "sources_to_targets", "", b'{"a":1}', {}) is not None
+    assert singleflight.flight_key("fr", 1, "POST", "status", "", b'{"a":1}', {}) is None
+    assert singleflight.flight_key("fr", 1, "DELETE", "route", "", b'{"a":1}', {}) is None
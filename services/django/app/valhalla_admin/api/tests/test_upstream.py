@@ -0,0 +1,36 @@
+from valhalla_admin.api import upstream
+
+
+def test_pick_least_outstanding_and_eject():
+    route = {"port": 9001, "ports": [9001, 9002], "build_id": 1}
+    first = upstream.pick(route)
+    second = upstream.pick(route)
+    # Le second appel va sur le replica libre
+    assert {first, second} == {9001, 9002}
+
+    upstream.release(first)
+    assert upstream.pick(route) == first
+    upstream.release(first)
+    upstream.release(first)
+    upstream.release(second)
+
+    # Replica éjecté : évité tant que l'autre est disponible
+    upstream.eject(9001)
+    try:
+        assert all(upstream.pick(route) == 9002 for _ in range(3))
+        for _ in range(3):
+            upstream.release(9002)
+        # Tous éjectés : on tente quand même
+        upstream.eject(9002)
+        port = upstream.pick(route)
+        assert port in (9001, 9002)
+        upstream.release(port)
+    finally:
+        upstream._ejected.clear()
+    assert upstream._outstanding == {}
+
+
+def test_pick_without_ports():
+    assert upstream.pick({"port": None, "ports": [], "build_id": 1}) is None
+    assert upstream.pick({"port": 9003, "build_id": 1}) == 9003
+    upstream.release(9003)
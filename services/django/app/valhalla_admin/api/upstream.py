@@ -0,0 +1,138 @@
+# api/upstream.py
+"""Accès aux containers Valhalla depuis le proxy : sessions HTTP persistantes et routage.
+
+- une `requests.Session` par port (backend), avec un pool keep-alive dimensionné
+  par VALHALLA_PROXY_POOL_SIZE : plus de connexion TCP par requête ;
+- une table de routage alias → {port, ports, build_id} en mémoire du process, avec TTL
+  (VALHALLA_PROXY_ROUTE_TTL) : plus de requête DB par appel ;
+- répartition entre les replicas d'un graph au moins de requêtes en cours, avec
+  éjection passive (VALHALLA_PROXY_EJECT_SECONDS) d'un replica injoignable.
+
+La table est invalidée par les signaux BuildTask du process (voir valhalla_proxy)
+et sur erreur de connexion ; le TTL borne le délai de prise en compte des
+changements faits dans un autre process (worker Celery lors d'un basculement).
+"""
+
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+VALHALLA_UPSTREAM_HOST = os.getenv("VALHALLA_UPSTREAM_HOST", "host.docker.internal")
+VALHALLA_PROXY_POOL_SIZE = int(os.getenv("VALHALLA_PROXY_POOL_SIZE", "16"))
+VALHALLA_PROXY_ROUTE_TTL = float(os.getenv("VALHALLA_PROXY_ROUTE_TTL", "30"))
+VALHALLA_PROXY_EJECT_SECONDS = float(os.getenv("VALHALLA_PROXY_EJECT_SECONDS", "10"))
+
+_lock = threading.Lock()
+_sessions: dict[int, requests.Session] = {}
+_routes: dict[str, tuple[float, dict]] = {}
+_outstanding: dict[int, int] = {}
+_ejected: dict[int, float] = {}
+
+
+def upstream_url(port: int, path: str) -> str:
+    return f"http://{VALHALLA_UPSTREAM_HOST}:{port}/{path}"
+
+
+def get_session(port: int) -> requests.Session:
+    """Session keep-alive dédiée au backend écoutant sur `port` (créée à la demande)."""
+    session = _sessions.get(port)
+    if session is not None:
+        return session
+    with _lock:
+        session = _sessions.get(port)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=VALHALLA_PROXY_POOL_SIZE, max_retries=0)
+            session.mount("http://", adapter)
+            # Les en-têtes viennent du client : pas de cookies/env persistants entre requêtes
+            session.trust_env = False
+            _sessions[port] = session
+    return session
+
+
+def close_session(port: int) -> None:
+    with _lock:
+        session = _sessions.pop(port, None)
+    if session is not None:
+        session.close()
+
+
+def _lookup(alias: str) -> dict | None:
+    from valhalla_admin.graph.models import BuildTask
+
+    row = (
+        BuildTask.objects
+        .filter(name=alias, is_serving=True)
+        .order_by("-created_at")
+        .values("id", "serve_port", "serve_ports")
+        .first()
+    )
+    if row is None:
+        return None
+    ports = [p for p in (row["serve_ports"] or []) if p] or ([row["serve_port"]] if row["serve_port"] else [])
+    return {"port": row["serve_port"], "ports": ports, "build_id": row["id"]}
+
+
+def cached_route(alias: str) -> dict | None:
+    """Route en cache encore valide (sans accès DB), None sinon."""
+    cached = _routes.get(alias)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    return None
+
+
+def resolve(alias: str) -> dict | None:
+    """Backends servant `alias` ({"port", "ports", "build_id"}), None si le graph n'est pas servi."""
+    route = cached_route(alias)
+    if route is not None:
+        return route
+    now = time.monotonic()
+    route = _lookup(alias)
+    if route is not None:
+        _routes[alias] = (now + VALHALLA_PROXY_ROUTE_TTL, route)
+    else:
+        _routes.pop(alias, None)
+    return route
+
+
+def invalidate(alias: str | None = None) -> None:
+    """Oublie la route d'un alias (ou toutes) ; la prochaine requête relit la DB."""
+    if alias is None:
+        _routes.clear()
+    else:
+        _routes.pop(alias, None)
+
+
+def pick(route: dict) -> int | None:
+    """Replica au moins de requêtes en cours (hors éjectés) ; à libérer avec `release`."""
+    ports = route.get("ports") or ([route["port"]] if route.get("port") else [])
+    if not ports:
+        return None
+    now = time.monotonic()
+    # Tous éjectés : tenter quand même plutôt que de refuser la requête
+    candidates = [p for p in ports if _ejected.get(p, 0) <= now] or ports
+    with _lock:
+        least = min(_outstanding.get(p, 0) for p in candidates)
+        # Égalité tirée au hasard : les process du proxy ne partagent pas leurs compteurs
+        port = random.choice([p for p in candidates if _outstanding.get(p, 0) == least])
+        _outstanding[port] = least + 1
+    return port
+
+
+def release(port: int) -> None:
+    with _lock:
+        count = _outstanding.get(port, 0) - 1
+        if count > 0:
+            _outstanding[port] = count
+        else:
+            _outstanding.pop(port, None)
+
+
+def eject(port: int) -> None:
+    """Écarte un replica injoignable pendant VALHALLA_PROXY_EJECT_SECONDS."""
+    _ejected[port] = time.monotonic() + VALHALLA_PROXY_EJECT_SECONDS
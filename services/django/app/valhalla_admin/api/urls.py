@@ -1,12 +1,19 @@
+from django.conf import settings
 from django.urls import path
 from .views import StatusView, BuildTaskListView, BuildTaskStatusView
 from .valhalla_proxy import ValhallaProxyView
 
+# ASGI (uvicorn) : proxy asynchrone ; WSGI (uWSGI) : vue synchrone
+if settings.VALHALLA_ASYNC_PROXY:
+    from .async_proxy import async_valhalla_proxy as proxy_view
+else:
+    proxy_view = ValhallaProxyView.as_view()
+
 urlpatterns = [
 	path("status/", StatusView.as_view()),
 	path("build-tasks/", BuildTaskListView.as_view()),
 	path("build-tasks/<int:task_id>/status", BuildTaskStatusView.as_view()),
     # Proxy catch-all pour Valhalla (doit être en dernier)
     # /valhalla/<alias>/api/<path>
-    path('<path:path>', ValhallaProxyView.as_view()),
+    path('<path:path>', proxy_view),
 ]
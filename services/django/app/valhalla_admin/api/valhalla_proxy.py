@@ -1,10 +1,30 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from valhalla_admin.graph.models import BuildTask
+from . import response_cache, upstream
 import requests
 
+
+@receiver([post_save, post_delete], sender=BuildTask)
+def _invalidate_route(sender, instance, **kwargs):
+    """Changement d'état d'une tâche (service, port, suppression) : oublier sa route."""
+    upstream.invalidate(instance.name)
+
+
+def _stream_and_close(resp, port):
+    """Relaie le corps en streaming puis rend la connexion au pool (fermée si client parti)."""
+    try:
+        for chunk in resp.raw.stream(64 * 1024, decode_content=False):
+            yield chunk
+    finally:
+        resp.close()
+        upstream.release(port)
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class ValhallaProxyView(View):
     """
@@ -12,40 +32,82 @@ class ValhallaProxyView(View):
     """
     def dispatch(self, request, *args, **kwargs):
         graph_alias = kwargs.get('graph_alias')
-        # Chercher le port du conteneur Valhalla pour ce graph
-        try:
-            task = BuildTask.objects.get(name=graph_alias, is_serving=True)
-            port = task.serve_port
-            if not port:
-                return JsonResponse({'error': 'Aucun port Valhalla pour ce graph'}, status=502)
-        except BuildTask.DoesNotExist:
+        # Chercher le port du conteneur Valhalla pour ce graph (table de routage en mémoire)
+        route = upstream.resolve(graph_alias)
+        if route is None:
             return JsonResponse({'error': 'Graph non trouvé ou non servi'}, status=404)
+        if not route['ports']:
+            return JsonResponse({'error': 'Aucun port Valhalla pour ce graph'}, status=502)
+
+        # Reconstituer le chemin cible
+        action = kwargs.get('path', '')
+        query_string = request.META.get('QUERY_STRING', '')
+        path = action + '?' + query_string if query_string else action
+        # En-têtes hop-by-hop non relayés : la connexion amont reste keep-alive
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in ('host', 'connection', 'keep-alive')}
+        body = request.body if request.body else None
 
-        # Reconstituer l'URL cible
-        path = kwargs.get('path', '')
-        url = f"http://host.docker.internal:{port}/{path}"
-        if request.META.get('QUERY_STRING'):
-            url += '?' + request.META['QUERY_STRING']
-
-        # Proxy la requête (GET, POST, etc.)
-        try:
-            resp = requests.request(
-                method=request.method,
-                url=url,
-                headers={k: v for k, v in request.headers.items() if k.lower() != 'host'},
-                data=request.body if request.body else None,
-                stream=True,
-                timeout=60
+        # Réponse déjà calculée par ce build (cache opt-in, voir response_cache)
+        def cache_key(route):
+            return response_cache.cache_key(
+                graph_alias, route['build_id'], request.method, action, query_string, body, request.headers
             )
-        except requests.RequestException as e:
-            return JsonResponse({'error': f'Erreur proxy Valhalla: {str(e)}'}, status=502)
-
-        # Réponse streaming (pour gros résultats)
-        proxy_response = StreamingHttpResponse(
-            resp.raw.stream(decode_content=False),
-            status=resp.status_code
-        )
-        for k, v in resp.headers.items():
-            if k.lower() != 'transfer-encoding':
-                proxy_response[k] = v
-        return proxy_response
+        key = cache_key(route)
+        if key is not None:
+            entry = response_cache.get(key)
+            if entry is not None:
+                return response_cache.to_response(entry, 'HIT')
+
+        def forward(route):
+            """Appel amont (une requête à la fois par process uWSGI : pas de regroupement, voir singleflight)."""
+            # Proxy la requête (GET, POST, etc.) via la session keep-alive du backend
+            for attempt in range(2):
+                port = upstream.pick(route)
+                try:
+                    resp = upstream.get_session(port).request(
+                        method=request.method,
+                        url=upstream.upstream_url(port, path),
+                        headers=headers,
+                        data=body,
+                        stream=True,
+                        timeout=60
+                    )
+                    break
+                except requests.ConnectionError as e:
+                    # Replica arrêté ou remplacé (bascule de release) : l'écarter, relire la route et réessayer une fois
+                    upstream.release(port)
+                    upstream.eject(port)
+                    upstream.close_session(port)
+                    upstream.invalidate(graph_alias)
+                    route = upstream.resolve(graph_alias) if attempt == 0 else None
+                    if route is None or not route['ports']:
+                        return JsonResponse({'error': f'Erreur proxy Valhalla: {str(e)}'}, status=502)
+                except requests.RequestException as e:
+                    upstream.release(port)
+                    return JsonResponse({'error': f'Erreur proxy Valhalla: {str(e)}'}, status=502)
+
+            # Réponse de taille raisonnable : la bufferiser pour la mettre en cache
+            store_key = cache_key(route) if key is not None else None
+            if store_key is not None and response_cache.is_storable(resp.status_code, resp.headers):
+                try:
+                    content = resp.raw.read(decode_content=False)
+                except Exception as e:
+                    return JsonResponse({'error': f'Erreur proxy Valhalla: {str(e)}'}, status=502)
+                finally:
+                    resp.close()
+                    upstream.release(port)
+                entry = response_cache.make_entry(resp.status_code, resp.headers, content)
+                response_cache.set(store_key, entry)
+                return response_cache.to_response(entry, 'MISS')
+
+            # Réponse streaming (pour gros résultats)
+            proxy_response = StreamingHttpResponse(
+                _stream_and_close(resp, port),
+                status=resp.status_code
+            )
+            for k, v in resp.headers.items():
+                if k.lower() not in ('transfer-encoding', 'connection', 'keep-alive'):
+                    proxy_response[k] = v
+            return proxy_response
+
+        return forward(route)
@@ -30,28 +30,44 @@ class BuildTaskListView(APIView):
 
 
 class BuildTaskStatusView(APIView):
-    """Return detailed status for a single BuildTask, including logs preview."""
+    """Return detailed status for a single BuildTask, including logs preview.
+
+    With `?after=<cursor>`, only log lines appended since that cursor are returned.
+    """
     def get(self, request, task_id: int, *args, **kwargs):
         bt = get_object_or_404(BuildTask, id=task_id)
-        logs_text = bt.logs or ""
-        lines = logs_text.splitlines()
-        total = len(lines)
-        head_count = 40
-        tail_count = 40
-        head = lines[:head_count]
-        tail = lines[-tail_count:] if total > tail_count else lines
-        if total > head_count + tail_count:
-            preview_lines = head + ["… (logs tronqués) …"] + tail
-        else:
-            preview_lines = lines
-        preview_text = "\n".join(preview_lines)
-        return Response({
+        data = {
             "id": bt.id,
             "name": bt.name,
             "status": bt.status,
             "ready": bt.is_ready,
             "serving": bt.is_serving,
             "serve_port": bt.serve_port,
+            "last_log_at": bt.last_log_at,
+        }
+        raw_after = request.query_params.get("after")
+        if raw_after is not None:
+            try:
+                after = int(raw_after)
+            except ValueError:
+                after = -1
+            if after < 0:
+                return Response({"error": "after must be a non-negative integer"}, status=400)
+            lines, cursor, more = bt.log_lines_after(after)
+            data.update({"logs_lines": lines, "logs_cursor": cursor, "logs_more": more})
+            return Response(data)
+
+        head_count = 40
+        tail_count = 40
+        head, tail, total = bt.log_preview(head_count, tail_count)
+        if tail:
+            preview_lines = head + ["… (logs tronqués) …"] + tail
+        else:
+            preview_lines = head
+        preview_text = "\n".join(preview_lines)
+        data.update({
             "logs_preview": preview_text,
             "logs_total_lines": total,
-        })
\ No newline at end of file
+            "logs_cursor": bt.log_cursor(),
+        })
+        return Response(data)
@@ -0,0 +1,7 @@
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'valhalla_admin.settings')
+# Servi par uvicorn : active le proxy Valhalla asynchrone (settings.VALHALLA_ASYNC_PROXY)
+os.environ.setdefault('VALHALLA_ASGI', '1')
+application = get_asgi_application()
@@ -0,0 +1,102 @@
+# graph/artifacts.py
+"""Cache partagé des artefacts dérivés du build (/data/sources/artifacts).
+
+`tz.sqlite` ne dépend que de la version de Valhalla, `admin.sqlite` de la
+version et du PBF OSM : ils sont construits une seule fois puis liés
+(hardlink/reflink via stage_file) dans `build/tiles/` de chaque graph.
+
+Organisation : `<stage>/<clé>/<fichier>`, la clé étant le hash des entrées
+listées dans STAGE_ARTIFACTS. Éviction LRU (mtime, rafraîchi à chaque usage)
+au-delà de VALHALLA_ARTIFACT_MAX_BYTES.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+from .downloads import file_lock
+from .staging import stage_file
+
+
+ARTIFACT_DIR = os.getenv("VALHALLA_ARTIFACT_DIR", "/data/sources/artifacts")
+VALHALLA_ARTIFACT_MAX_BYTES = int(os.getenv("VALHALLA_ARTIFACT_MAX_BYTES", str(5 * 1024 ** 3)))
+
+# étape → (fichier produit dans build/tiles/, entrées dont il dépend)
+STAGE_ARTIFACTS = {
+    "timezones": ("tz.sqlite", ["valhalla"]),
+    "admins": ("admin.sqlite", ["valhalla", "osm"]),
+}
+
+
+def artifact_path(stage: str, inputs: dict, cache_dir: str = ARTIFACT_DIR) -> str | None:
+    """Chemin de l'artefact partagé d'une étape, None si l'étape n'est pas partageable.
+
+    Sans version Valhalla connue, rien n'est partagé (un artefact pourrait survivre à une mise à jour).
+    """
+    spec = STAGE_ARTIFACTS.get(stage)
+    if not spec or inputs.get("valhalla") in (None, "", "unknown"):
+        return None
+    filename, deps = spec
+    key = hashlib.sha256(json.dumps({d: inputs[d] for d in deps}, sort_keys=True).encode()).hexdigest()
+    return os.path.join(cache_dir, stage, key, filename)
+
+
+def restore_artifact(stage: str, inputs: dict, build_dir: str, cache_dir: str = ARTIFACT_DIR) -> str | None:
+    """Lie l'artefact partagé dans build/tiles/ ; retourne le mode de staging, None si absent."""
+    path = artifact_path(stage, inputs, cache_dir)
+    if not path or not os.path.exists(path):
+        return None
+    dest = os.path.join(build_dir, "tiles", os.path.basename(path))
+    mode = stage_file(path, dest)
+    try:
+        os.utime(os.path.dirname(path))  # LRU
+    except OSError:
+        pass
+    return mode
+
+
+def publish_artifact(stage: str, inputs: dict, build_dir: str, cache_dir: str = ARTIFACT_DIR, max_bytes: int = VALHALLA_ARTIFACT_MAX_BYTES) -> bool:
+    """Publie dans le cache l'artefact qu'une étape vient de produire (True si ajouté)."""
+    path = artifact_path(stage, inputs, cache_dir)
+    if not path:
+        return False
+    src = os.path.join(build_dir, "tiles", os.path.basename(path))
+    if not os.path.exists(src):
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with file_lock(path):
+        if os.path.exists(path):
+            return False
+        stage_file(src, path)
+    evict_artifacts(cache_dir, max_bytes, keep={os.path.dirname(path)})
+    return True
+
+
+def evict_artifacts(cache_dir: str = ARTIFACT_DIR, max_bytes: int = VALHALLA_ARTIFACT_MAX_BYTES, keep: set | None = None) -> list[str]:
+    """Supprime les artefacts les moins récemment utilisés au-delà de max_bytes."""
+    keep = keep or set()
+    entries = []
+    for stage in STAGE_ARTIFACTS:
+        stage_dir = os.path.join(cache_dir, stage)
+        if not os.path.isdir(stage_dir):
+            continue
+        for name in os.listdir(stage_dir):
+            entry = os.path.join(stage_dir, name)
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+                entries.append((os.stat(entry).st_mtime, entry, size))
+            except OSError:
+                continue
+
+    total = sum(size for _, _, size in entries)
+    removed = []
+    for _, entry, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if entry in keep:
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+        removed.append(entry)
+    return removed
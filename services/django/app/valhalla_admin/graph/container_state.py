@@ -0,0 +1,209 @@
+# graph/container_state.py
+"""Instantané de l'état des containers Valhalla pour les pages et API.
+
+Un seul appel Docker (`containers.list(sparse=True)` filtré sur le label
+`valhalla.managed=true`, sans inspect ni stats par container) donne l'état de
+tous les graphs ; il est gardé en mémoire du process VALHALLA_INVENTORY_TTL
+secondes. Les métriques CPU/mémoire ne sont jamais lues ici.
+
+`apply_state` reporte un état sur une BuildTask ; il est utilisé par les pages
+(synchronisation à l'affichage) et par le watcher d'événements Docker
+(voir events.py), qui tient la DB à jour en continu.
+"""
+
+import os
+import re
+import threading
+import time
+
+
+VALHALLA_INVENTORY_TTL = float(os.getenv("VALHALLA_INVENTORY_TTL", "5"))
+
+CONTAINER_PREFIX = "valhalla-graph-"
+# Statuts d'un build en cours : jamais réécrits d'après l'état des containers
+IN_PROGRESS_STATUSES = ("pending", "preparing", "building")
+# Suffixe d'un replica servi : "" (replica 0) ou "-r<i>" ; exclut "-next" et "-retired-<ts>"
+_REPLICA_SUFFIX_RE = re.compile(r"(?:-r(\d+))?")
+
+_lock = threading.Lock()
+_snapshot: tuple[float, dict] | None = None
+
+
+def _health(status_text: str) -> str:
+    """Santé lue dans le statut court de `docker ps` (« Up 2 hours (healthy) »)."""
+    text = (status_text or "").lower()
+    for health in ("unhealthy", "healthy", "starting"):
+        if f"({health})" in text or f"(health: {health})" in text:
+            return health
+    return "unknown"
+
+
+def _published_port(ports) -> int | None:
+    for p in ports or []:
+        if p.get("PrivatePort") == 8002 and p.get("PublicPort"):
+            return int(p["PublicPort"])
+    return None
+
+
+def states_from_summaries(summaries: list[dict]) -> dict:
+    """Regroupe les résumés `docker ps` par graph : {graph: état agrégé des replicas servis}.
+
+    Les candidats (`-next`) et containers retirés d'un basculement sont ignorés.
+    """
+    states = {}
+    for attrs in summaries:
+        labels = attrs.get("Labels") or {}
+        graph = labels.get("valhalla.graph")
+        name = ((attrs.get("Names") or [""])[0]).lstrip("/")
+        if not graph or not name.startswith(CONTAINER_PREFIX + graph):
+            continue
+        match = _REPLICA_SUFFIX_RE.fullmatch(name[len(CONTAINER_PREFIX + graph):])
+        if not match:
+            continue
+        replica = int(match.group(1) or 0)
+
+        running = attrs.get("State") == "running"
+        state = states.setdefault(graph, {
+            "status": "not_found",
+            "running": False,
+            "port": None,
+            "ports": [],
+            "health": "unknown",
+            "build_id": None,
+            "replicas": 0,
+        })
+        state["replicas"] += 1
+        port = _published_port(attrs.get("Ports"))
+        health = _health(attrs.get("Status"))
+        # Un replica unhealthy n'est plus proposé au proxy
+        if running and port and health != "unhealthy":
+            state["ports"].append(port)
+        if replica == 0:
+            state["status"] = attrs.get("State") or "unknown"
+            state["running"] = running
+            state["port"] = port
+            state["health"] = health
+            state["build_id"] = labels.get("valhalla.build") or None
+    for state in states.values():
+        state["ports"].sort()
+    return states
+
+
+def legacy_owners(states: dict) -> dict:
+    """{graph: id de la dernière tâche prête} pour les graphs servis par un container sans label valhalla.build."""
+    from django.db.models import Max
+    from .models import BuildTask
+
+    names = [graph for graph, state in states.items() if state.get("running") and not state.get("build_id")]
+    if not names:
+        return {}
+    rows = BuildTask.objects.filter(name__in=names, is_ready=True).values("name").annotate(last=Max("id"))
+    return {row["name"]: row["last"] for row in rows}
+
+
+def serves_task(state: dict, task, owners: dict | None = None) -> bool:
+    """True si le container du graph sert la release de `task` (label valhalla.build).
+
+    Les containers créés avant les releases n'ont pas ce label : ils sont attribués à
+    la seule dernière tâche prête du graph (`owners`, voir legacy_owners ; relu en DB
+    si absent).
+    """
+    build_id = state.get("build_id")
+    if build_id:
+        return build_id == str(task.id)
+    if owners is None:
+        owners = legacy_owners({task.name: state})
+    return owners.get(task.name) == task.id
+
+
+def apply_state(task, state: dict, owners: dict | None = None) -> tuple:
+    """Reporte l'état Docker d'un graph sur `task` ; retourne les champs modifiés.
+
+    Ne réécrit jamais le statut d'un build en cours : un container arrêté ne fait
+    que repasser une tâche prête (servie ou en erreur) à « built ».
+    """
+    if task.status in IN_PROGRESS_STATUSES:
+        return ()
+    running = bool(state.get("running")) and serves_task(state, task, owners)
+    fields = ()
+    if task.is_serving != running:
+        task.is_serving = running
+        fields += ("is_serving",)
+    if running:
+        if task.status != "serving":
+            task.status = "serving"
+            fields += ("status",)
+        ports = state.get("ports") or []
+        port = state.get("port") or (ports[0] if ports else None)
+        if port and task.serve_port != port:
+            task.serve_port = port
+            fields += ("serve_port",)
+        if ports and list(task.serve_ports or []) != ports:
+            task.serve_ports = list(ports)
+            fields += ("serve_ports",)
+    elif "is_serving" in fields and task.is_ready and task.status in ("serving", "error"):
+        task.status = "built"
+        fields += ("status",)
+    health = (state.get("health") or "unknown") if running else ""
+    if task.serve_health != health:
+        task.serve_health = health
+        fields += ("serve_health",)
+    return fields
+
+
+def state_from_task(task) -> dict:
+    """État d'un graph tel qu'enregistré en DB (pages servies sans appel Docker)."""
+    return {
+        "status": "running" if task.is_serving else "exited",
+        "running": bool(task.is_serving),
+        "port": task.serve_port if task.is_serving else None,
+        "ports": list(task.serve_ports or []) if task.is_serving else [],
+        "health": task.serve_health or "unknown",
+        "build_id": str(task.id) if task.is_serving else None,
+        "replicas": task.serve_replicas,
+    }
+
+
+def snapshot(manager, max_age: float | None = None) -> dict:
+    """État de tous les graphs gérés, relu au plus toutes les `max_age` secondes."""
+    global _snapshot
+    ttl = VALHALLA_INVENTORY_TTL if max_age is None else max_age
+    cached = _snapshot
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    with _lock:
+        cached = _snapshot
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        containers = manager.client.containers.list(
+            all=True, sparse=True, filters={"label": "valhalla.managed=true"}
+        )
+        states = states_from_summaries([c.attrs for c in containers])
+        _snapshot = (time.monotonic() + ttl, states)
+    return states
+
+
+def graph_state(manager, graph_name: str) -> dict:
+    """État d'un graph tiré de l'instantané (not_found s'il n'a pas de container)."""
+    return snapshot(manager).get(graph_name) or {
+        "status": "not_found", "running": False, "port": None, "ports": [],
+        "health": "unknown", "build_id": None, "replicas": 0,
+    }
+
+
+def system_stats(states: dict) -> dict:
+    """Compteurs du dashboard (un graph = ses replicas comptés ensemble)."""
+    total = len(states)
+    running = sum(1 for s in states.values() if s["running"])
+    return {
+        "total_containers": total,
+        "running_containers": running,
+        "stopped_containers": total - running,
+        "containers": [dict(state, name=graph) for graph, state in sorted(states.items())],
+    }
+
+
+def invalidate() -> None:
+    """Oublie l'instantané (après un start/stop depuis ce process)."""
+    global _snapshot
+    _snapshot = None
@@ -4,29 +4,66 @@ Objectif : créer/démarrer des containers "graph" dans le BON projet Compose (i
 
 Docker Desktop regroupe les containers par label `com.docker.compose.project`.
 Si on crée un container via l'API Docker sans ces labels, il n'apparaît pas dans le "projet".
+
+`get_manager()` fournit un gestionnaire partagé par le process : client Docker,
+projet Compose, montages du worker et présence de l'image sont détectés une
+fois puis gardés VALHALLA_MANAGER_CACHE_TTL secondes (ou jusqu'à `refresh()`).
 """
 
 import docker
 import os
+import threading
+import time
+import requests
 from docker.errors import NotFound, APIError
 from typing import Optional, Dict, List
 
+from .profiles import effective_profile, profile_fingerprint
+
+
+VALHALLA_MANAGER_CACHE_TTL = float(os.getenv("VALHALLA_MANAGER_CACHE_TTL", "300"))
+
 
 class ValhallaDockerManager:
     """Gestionnaire de containers Valhalla"""
 
     CONTAINER_PREFIX = "valhalla-graph-"
+    CANDIDATE_SUFFIX = "-next"
+    REPLICA_SEPARATOR = "-r"
+    # Réservations de ports alignées sur Docker au moins une fois par process
+    _ports_reconciled = False
     
     def __init__(self):
         self.client = docker.from_env()
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self._detect_settings()
 
+    def _detect_settings(self) -> None:
         # Déterminer le "projet" Compose cible.
         self.project_name = self._detect_compose_project_name()
 
         # Valeurs configurables, mais avec des defaults cohérents.
         self.network_name = os.getenv("VALHALLA_NETWORK", f"{self.project_name}_default")
         self.valhalla_image = os.getenv("VALHALLA_IMAGE", f"{self.project_name}-valhalla:latest")
-        self.base_port = int(os.getenv("VALHALLA_BASE_PORT", "8002"))
+        self.detected_at = time.monotonic()
+
+    def refresh(self) -> None:
+        """Oublie les détections en cache (projet, réseau, montages, image)"""
+        with self._cache_lock:
+            self._cache.clear()
+        self._detect_settings()
+
+    def _cached(self, key: str, compute):
+        """Valeur en cache pendant VALHALLA_MANAGER_CACHE_TTL (les erreurs ne sont pas mises en cache)"""
+        now = time.monotonic()
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        value = compute()
+        with self._cache_lock:
+            self._cache[key] = (now + VALHALLA_MANAGER_CACHE_TTL, value)
+        return value
 
     def _detect_compose_project_name(self) -> str:
         """Détecte le projet Compose à utiliser.
@@ -62,124 +99,180 @@ class ValhallaDockerManager:
         """Retourne le nom du container pour un graph"""
         return f"{self.CONTAINER_PREFIX}{graph_name}"
     
-    def get_next_available_port(self) -> int:
-        """Trouve le prochain port disponible en collectant les HostPort des containers Valhalla (label ou préfixe de nom),
-        y compris ceux qui sont arrêtés via HostConfig.PortBindings."""
-        used_ports = set()
+    def get_candidate_name(self, graph_name: str) -> str:
+        """Nom du container candidat (nouvelle release) pendant un basculement blue/green"""
+        return f"{self.CONTAINER_PREFIX}{graph_name}{self.CANDIDATE_SUFFIX}"
 
-        def collect_ports(container) -> None:
-            try:
-                # 1) Ports mappés (containers RUNNING)
-                ports = container.attrs.get("NetworkSettings", {}).get("Ports", {})
-                mappings = ports.get("8002/tcp") or []
-                for m in mappings:
-                    hp = m.get("HostPort")
-                    if hp:
-                        used_ports.add(int(hp))
-                # 2) PortBindings (containers STOPPED conservent la config ici)
-                bindings = container.attrs.get("HostConfig", {}).get("PortBindings", {})
-                bmaps = bindings.get("8002/tcp") or []
-                for b in bmaps:
-                    hp = b.get("HostPort")
-                    if hp:
-                        used_ports.add(int(hp))
-            except Exception:
-                pass
+    def get_replica_name(self, graph_name: str, replica: int = 0, candidate: bool = False) -> str:
+        """Nom du replica `replica` d'un graph (le replica 0 garde le nom historique)"""
+        name = self.get_container_name(graph_name)
+        if replica:
+            name += f"{self.REPLICA_SEPARATOR}{replica}"
+        return name + self.CANDIDATE_SUFFIX if candidate else name
+
+    def _replica_containers(self, graph_name: str, candidate: bool = False) -> Dict:
+        """Containers des replicas d'un graph, indexés par numéro de replica"""
+        base = self.get_container_name(graph_name)
+        found = {}
+        for container in self.client.containers.list(all=True, filters={"label": f"valhalla.graph={graph_name}"}):
+            name = container.name or ""
+            if name.endswith(self.CANDIDATE_SUFFIX) != candidate:
+                continue
+            if candidate:
+                name = name[:-len(self.CANDIDATE_SUFFIX)]
+            if name == base:
+                found[0] = container
+            elif name.startswith(base + self.REPLICA_SEPARATOR):
+                index = name[len(base) + len(self.REPLICA_SEPARATOR):]
+                if index.isdigit():
+                    found[int(index)] = container
+        return found
 
+    def get_next_available_port(self, container_name: str, graph_name: str = "") -> int:
+        """Port hôte réservé au container (table PortReservation, sans inspection Docker)"""
+        from . import ports
+        if not ValhallaDockerManager._ports_reconciled:
+            # Containers créés avant la table (ou hors application) : les enregistrer d'abord
+            ports.reconcile(self.port_inventory())
+            ValhallaDockerManager._ports_reconciled = True
+        return ports.reserve(container_name, graph_name)
+
+    def _release_port(self, container_name: str, renamed_to: Optional[str] = None) -> None:
+        """Libère (ou transfère au nouveau nom) la réservation de port d'un container"""
+        from . import ports
         try:
-            # 1) Containers gérés (label)
-            managed = self.client.containers.list(all=True, filters={"label": "valhalla.managed=true"})
-            for c in managed:
-                collect_ports(c)
-
-            # 2) Fallback: tous les containers dont le nom commence par le préfixe
-            all_containers = self.client.containers.list(all=True)
-            for c in all_containers:
-                try:
-                    name = c.name or ""
-                except Exception:
-                    name = ""
-                if name.startswith(self.CONTAINER_PREFIX):
-                    collect_ports(c)
+            if renamed_to:
+                ports.rename(container_name, renamed_to)
+            else:
+                ports.release(container_name)
         except Exception:
-            # Si l'inspection échoue, on tombera sur BASE_PORT
+            # La réconciliation périodique corrigera la table
             pass
 
-        port = self.base_port
-        while port in used_ports:
-            port += 1
-        return port
-    
+    def port_inventory(self) -> Dict:
+        """{nom: (port hôte, graph)} des containers gérés, pour la réconciliation des réservations.
+
+        Un seul `docker ps` ; seuls les containers arrêtés (port absent du résumé) sont inspectés.
+        """
+        inventory = {}
+        for container in self.client.containers.list(all=True, sparse=True, filters={"label": "valhalla.managed=true"}):
+            attrs = container.attrs
+            name = ((attrs.get("Names") or [""])[0]).lstrip("/")
+            graph = (attrs.get("Labels") or {}).get("valhalla.graph", "")
+            port = None
+            for p in attrs.get("Ports") or []:
+                if p.get("PrivatePort") == 8002 and p.get("PublicPort"):
+                    port = int(p["PublicPort"])
+            if port is None:
+                # Container arrêté : le port reste dans HostConfig.PortBindings
+                try:
+                    container.reload()
+                    bindings = container.attrs.get("HostConfig", {}).get("PortBindings", {}).get("8002/tcp") or []
+                    port = next((int(b["HostPort"]) for b in bindings if b.get("HostPort")), None)
+                except (APIError, NotFound, ValueError):
+                    pass
+            inventory[name] = (port, graph)
+        return inventory
+
     def _get_host_path_from_worker_mount(self, container_path: str) -> str:
         """
         Convertit un chemin container worker vers le chemin hôte réel
         En inspectant les volumes montés du worker
         """
         try:
-            # 1) Si un nom est fourni explicitement, on l'utilise
-            worker_container_name = os.getenv("CELERY_WORKER_CONTAINER")
-
-            # 2) Sinon, on cherche le container par labels compose (robuste, même si container_name change)
-            if not worker_container_name:
-                candidates = self.client.containers.list(
-                    all=True,
-                    filters={
-                        "label": [
-                            f"com.docker.compose.project={self.project_name}",
-                            "com.docker.compose.service=worker",
-                        ]
-                    },
-                )
-                if candidates:
-                    worker_container_name = candidates[0].name
-
-            # 3) Fallback (nom historique)
-            if not worker_container_name:
-                worker_container_name = f"{self.project_name}-celery_worker"
-
-            worker = self.client.containers.get(worker_container_name)
+            mounts = self._cached("worker_mounts", self._worker_mounts)
             
-            # Chercher le mount correspondant à /data/graphs
-            for mount in worker.attrs["Mounts"]:
-                if mount["Destination"] == "/data/graphs":
-                    # Remplacer /data/graphs par le chemin source
-                    source = mount["Source"]
-                    # Convertir le chemin: /data/graphs/aura_2025 -> {source}/aura_2025
-                    relative_path = container_path.replace("/data/graphs/", "")
-                    host_path = f"{source}/{relative_path}".replace("\\", "/")
-                    return host_path
+            # Chercher le mount le plus spécifique contenant le chemin
+            # (/data/graphs, ou /data si le worker monte ../data en un seul volume)
+            best = None
+            for mount in mounts:
+                dest = mount["Destination"].rstrip("/")
+                if container_path == dest or container_path.startswith(dest + "/"):
+                    if best is None or len(dest) > len(best["Destination"].rstrip("/")):
+                        best = mount
+            if best:
+                # Convertir le chemin: /data/graphs/aura_2025 -> {source}/aura_2025
+                dest = best["Destination"].rstrip("/")
+                relative_path = container_path[len(dest):].lstrip("/")
+                host_path = f"{best['Source'].rstrip('/')}/{relative_path}".replace("\\", "/")
+                return host_path
             
             # Si pas trouvé, retourner tel quel
             return container_path
         except Exception as e:
             # En cas d'erreur, retourner tel quel
             return container_path
+
+    def _worker_mounts(self) -> List[Dict]:
+        """Montages du container worker (inspecté une fois, voir _cached)"""
+        # 1) Si un nom est fourni explicitement, on l'utilise
+        worker_container_name = os.getenv("CELERY_WORKER_CONTAINER")
+
+        # 2) Sinon, on cherche le container par labels compose (robuste, même si container_name change)
+        if not worker_container_name:
+            candidates = self.client.containers.list(
+                all=True,
+                filters={
+                    "label": [
+                        f"com.docker.compose.project={self.project_name}",
+                        "com.docker.compose.service=worker",
+                    ]
+                },
+            )
+            if candidates:
+                worker_container_name = candidates[0].name
+
+        # 3) Fallback (nom historique)
+        if not worker_container_name:
+            worker_container_name = f"{self.project_name}-celery_worker"
+
+        return self.client.containers.get(worker_container_name).attrs["Mounts"]
     
     def start_container(
         self,
         graph_name: str,
         graph_path: str,
-        port: Optional[int] = None
+        port: Optional[int] = None,
+        build_id: Optional[str] = None,
+        candidate: bool = False,
+        replica: int = 0,
+        profile: Optional[Dict] = None
     ) -> Dict:
         """
         Démarre un container Valhalla pour un graph
         
         Args:
             graph_name: Nom du graph
-            graph_path: Chemin dans le worker (ex: /data/graphs/aura_2025)
+            graph_path: Chemin dans le worker (ex: /data/graphs/aura_2025/releases/42)
             port: Port à utiliser (auto si None)
+            build_id: Build servi (label `valhalla.build`)
+            candidate: Démarrer le container candidat `<nom>-next` (basculement blue/green)
+            replica: Numéro du replica (`<nom>-r<i>` pour i > 0)
+            profile: Profil de service (threads, cpuset, mem_limit, shm_size), voir profiles.py
         
         Returns:
             Dict avec status, container_id, port
         """
-        container_name = self.get_container_name(graph_name)
+        container_name = self.get_replica_name(graph_name, replica, candidate)
         
         # Convertir le chemin worker vers le chemin hôte
         host_graph_path = self._get_host_path_from_worker_mount(graph_path)
         
+        profile_values = effective_profile(profile)
+        fingerprint = profile_fingerprint(profile)
+
         # Vérifier si le container existe déjà
         try:
             existing = self.client.containers.get(container_name)
+            labels = existing.labels or {}
+            if (
+                candidate
+                or (build_id and labels.get("valhalla.build") != str(build_id))
+                or labels.get("valhalla.profile", profile_fingerprint({})) != fingerprint
+            ):
+                # Candidat d'un basculement avorté, container d'une autre release ou d'un autre profil : recréer
+                existing.remove(force=True)
+                raise NotFound(container_name)
             if existing.status == "running":
                 return {
                     "status": "already_running",
@@ -222,22 +315,28 @@ class ValhallaDockerManager:
         except NotFound:
             pass
         
-        # Attribuer un port
-        if port is None:
-            port = self.get_next_available_port()
-        
-        # Vérifier que l'image existe, sinon la pull
-        try:
-            self.client.images.get(self.valhalla_image)
-        except NotFound:
+        # Attribuer un port (réservation atomique, réutilisée si le container est recréé)
+        reserved = port is None
+        if reserved:
             try:
-                self.client.images.pull(self.valhalla_image)
-            except APIError as e:
+                port = self.get_next_available_port(container_name, graph_name)
+            except Exception as e:
                 return {
                     "status": "error",
-                    "message": f"Impossible de télécharger l'image Valhalla: {str(e)}"
+                    "message": f"Aucun port disponible: {str(e)}"
                 }
         
+        # Vérifier que l'image existe, sinon la pull
+        try:
+            self._cached("image", self._ensure_image)
+        except APIError as e:
+            if reserved:
+                self._release_port(container_name)
+            return {
+                "status": "error",
+                "message": f"Impossible de télécharger l'image Valhalla: {str(e)}"
+            }
+        
         # Créer et démarrer le container
         try:
             # Valhalla a besoin d'un fichier JSON de configuration.
@@ -249,21 +348,34 @@ class ValhallaDockerManager:
                 "elif [ -f /data/valhalla/valhalla.json ]; then CFG=/data/valhalla/valhalla.json; "
                 "else echo 'Missing Valhalla config: valhalla_serve.json or valhalla.json' >&2; "
                 "ls -la /data/valhalla >&2; exit 2; fi; "
-                "exec valhalla_service \"$CFG\" 1"
+                f"exec valhalla_service \"$CFG\" {int(profile_values['threads'])}"
             )
 
+            # Limites de ressources du profil (non définies : pas de limite)
+            resources = {}
+            if profile_values["cpuset"]:
+                resources["cpuset_cpus"] = profile_values["cpuset"]
+            if profile_values["mem_limit"]:
+                resources["mem_limit"] = profile_values["mem_limit"]
+            if profile_values["shm_size"]:
+                resources["shm_size"] = profile_values["shm_size"]
+
             container = self.client.containers.run(
                 image=self.valhalla_image,
                 name=container_name,
                 detach=True,
                 command=["bash", "-lc", start_cmd],
                 ports={"8002/tcp": port},
+                # Lecture seule : les replicas partagent le même tile extract
                 volumes={
-                    host_graph_path: {"bind": "/data/valhalla", "mode": "rw"}
+                    host_graph_path: {"bind": "/data/valhalla", "mode": "ro"}
                 },
                 labels={
                     "valhalla.graph": graph_name,
                     "valhalla.managed": "true",
+                    "valhalla.build": str(build_id or ""),
+                    "valhalla.replica": str(replica),
+                    "valhalla.profile": fingerprint,
 
                     # Pour que Docker Desktop groupe ce container dans le bon "projet"
                     "com.docker.compose.project": self.project_name,
@@ -276,7 +388,8 @@ class ValhallaDockerManager:
                     "interval": 30000000000,  # 30s en nanosecondes
                     "timeout": 10000000000,    # 10s
                     "retries": 3
-                }
+                },
+                **resources
             )
             
             return {
@@ -287,27 +400,164 @@ class ValhallaDockerManager:
             }
             
         except APIError as e:
+            if reserved:
+                self._release_port(container_name)
             return {
                 "status": "error",
                 "message": f"Erreur Docker: {str(e)}"
             }
     
+    def start_replicas(
+        self,
+        graph_name: str,
+        graph_path: str,
+        replicas: int = 1,
+        build_id: Optional[str] = None,
+        candidate: bool = False,
+        profile: Optional[Dict] = None
+    ) -> Dict:
+        """
+        Démarre les `replicas` containers d'un graph (même release, ports distincts)
+        et supprime les replicas en surnombre.
+
+        Returns:
+            Dict avec status/message du replica 0 et `ports` (un par replica)
+        """
+        replicas = max(1, int(replicas or 1))
+        results = []
+        for i in range(replicas):
+            result = self.start_container(
+                graph_name, graph_path, build_id=build_id, candidate=candidate, replica=i, profile=profile
+            )
+            if result["status"] not in ("started", "restarted", "already_running"):
+                result["ports"] = [r["port"] for r in results]
+                return result
+            results.append(result)
+
+        if not candidate:
+            for i, container in self._replica_containers(graph_name).items():
+                if i >= replicas:
+                    try:
+                        container.remove(force=True)
+                        self._release_port(container.name)
+                    except APIError:
+                        pass
+
+        result = dict(results[0])
+        result["ports"] = [r["port"] for r in results]
+        if replicas > 1:
+            result["message"] = f"{result['message']} ({replicas} replicas, ports {', '.join(map(str, result['ports']))})"
+        return result
+
+    def remove_candidates(self, graph_name: str) -> None:
+        """Supprime les containers candidats d'un basculement avorté"""
+        for container in self._replica_containers(graph_name, candidate=True).values():
+            try:
+                container.remove(force=True)
+                self._release_port(container.name)
+            except APIError:
+                pass
+
+    def _ensure_image(self) -> bool:
+        try:
+            self.client.images.get(self.valhalla_image)
+        except NotFound:
+            self.client.images.pull(self.valhalla_image)
+        return True
+
+    def wait_until_healthy(self, container_name: str, port: Optional[int], timeout: int = 600, interval: int = 3) -> bool:
+        """Attend que `/status` réponde 200 (réseau Docker, puis port publié) ; False si timeout ou arrêt"""
+        urls = [f"http://{container_name}:8002/status"]
+        if port:
+            urls.append(f"http://host.docker.internal:{port}/status")
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                container = self.client.containers.get(container_name)
+                if container.status in ("exited", "dead"):
+                    return False
+            except NotFound:
+                return False
+            for url in urls:
+                try:
+                    if requests.get(url, timeout=5).status_code == 200:
+                        return True
+                except requests.RequestException:
+                    pass
+            time.sleep(interval)
+        return False
+
+    def promote_candidate(self, graph_name: str, drain_seconds: int = 5) -> Dict:
+        """Les candidats `<nom>[-r<i>]-next` deviennent les containers du graph ; les anciens sont arrêtés puis supprimés"""
+        candidates = self._replica_containers(graph_name, candidate=True)
+        if not candidates:
+            return {"status": "not_found", "message": "Container candidat introuvable"}
+
+        olds = list(self._replica_containers(graph_name).values())
+        suffix = f"-retired-{int(time.time())}"
+        # Renommages effectués (container, ancien nom, nouveau nom), annulés en cas d'échec
+        renamed = []
+        for old in olds:
+            try:
+                old.rename(old.name + suffix)
+            except APIError as e:
+                self._undo_renames(renamed)
+                return {"status": "error", "message": f"Renommage impossible de {old.name}: {str(e)} — release en service conservée"}
+            self._release_port(old.name, renamed_to=old.name + suffix)
+            renamed.append((old, old.name, old.name + suffix))
+
+        for i, candidate in sorted(candidates.items()):
+            target = self.get_replica_name(graph_name, i)
+            try:
+                candidate.rename(target)
+            except APIError as e:
+                self._undo_renames(renamed)
+                return {"status": "error", "message": f"Renommage impossible: {str(e)} — release en service rétablie"}
+            self._release_port(candidate.name, renamed_to=target)
+            renamed.append((candidate, candidate.name, target))
+
+        if olds:
+            # Laisser les requêtes en cours sur les anciens ports se terminer
+            time.sleep(drain_seconds)
+            for old in olds:
+                try:
+                    old.stop(timeout=10)
+                    old.remove()
+                    self._release_port(old.name + suffix)
+                except APIError:
+                    pass
+
+        return {
+            "status": "promoted",
+            "container_id": candidates[min(candidates)].id,
+            "retired": [old.name + suffix for old in olds],
+            "message": "Nouvelle release en service"
+        }
+
+    def _undo_renames(self, renamed: List) -> None:
+        """Rend leurs noms d'origine aux containers renommés par un basculement avorté (ordre inverse)"""
+        for container, original, current in reversed(renamed):
+            try:
+                container.rename(original)
+                self._release_port(current, renamed_to=original)
+            except APIError:
+                pass
+
     def stop_container(self, graph_name: str) -> Dict:
-        """Arrête un container"""
-        container_name = self.get_container_name(graph_name)
-        
+        """Arrête les containers (tous les replicas) d'un graph"""
         try:
-            container = self.client.containers.get(container_name)
-            container.stop(timeout=10)
+            containers = self._replica_containers(graph_name)
+            if not containers:
+                return {
+                    "status": "not_found",
+                    "message": "Container introuvable"
+                }
+            for container in containers.values():
+                container.stop(timeout=10)
             return {
                 "status": "stopped",
                 "message": "Container arrêté"
             }
-        except NotFound:
-            return {
-                "status": "not_found",
-                "message": "Container introuvable"
-            }
         except APIError as e:
             return {
                 "status": "error",
@@ -315,18 +565,25 @@ class ValhallaDockerManager:
             }
     
     def restart_container(self, graph_name: str) -> Dict:
-        """Redémarre un container"""
-        container_name = self.get_container_name(graph_name)
-        
+        """Redémarre les containers (tous les replicas) d'un graph"""
         try:
-            container = self.client.containers.get(container_name)
+            containers = self._replica_containers(graph_name)
+        except APIError as e:
+            return {
+                "status": "error",
+                "message": f"Erreur: {str(e)}"
+            }
+        if not containers:
+            return {
+                "status": "not_found",
+                "message": "Container introuvable"
+            }
+
+        ports = []
+        healed = False
+        for _, container in sorted(containers.items()):
             try:
                 container.restart(timeout=10)
-                return {
-                    "status": "restarted",
-                    "port": self._get_container_port(container),
-                    "message": "Container redémarré"
-                }
             except APIError as e:
                 msg = str(e)
                 if "network" in msg and "not found" in msg:
@@ -334,53 +591,62 @@ class ValhallaDockerManager:
                     try:
                         self._heal_network(container.name)
                         container.start()
-                        return {
-                            "status": "restarted",
-                            "port": self._get_container_port(container),
-                            "message": "Container redémarré après réparation réseau"
-                        }
+                        healed = True
                     except Exception as heal_err:
                         return {
                             "status": "error",
                             "message": f"Réparation réseau impossible: {heal_err}"
                         }
-                return {
-                    "status": "error",
-                    "message": f"Erreur Docker: {msg}"
-                }
-        except NotFound:
-            return {
-                "status": "not_found",
-                "message": "Container introuvable"
-            }
-        except APIError as e:
-            return {
-                "status": "error",
-                "message": f"Erreur: {str(e)}"
-            }
+                else:
+                    return {
+                        "status": "error",
+                        "message": f"Erreur Docker: {msg}"
+                    }
+            ports.append(self._get_container_port(container))
+
+        return {
+            "status": "restarted",
+            "port": ports[0],
+            "ports": ports,
+            "message": "Container redémarré après réparation réseau" if healed else "Container redémarré"
+        }
     
     def remove_container(self, graph_name: str, force: bool = False) -> Dict:
-        """Supprime un container"""
-        container_name = self.get_container_name(graph_name)
-        
+        """Supprime les containers (tous les replicas) d'un graph"""
         try:
-            container = self.client.containers.get(container_name)
-            container.remove(force=force)
+            containers = self._replica_containers(graph_name)
+            if not containers:
+                return {
+                    "status": "not_found",
+                    "message": "Container introuvable"
+                }
+            for container in containers.values():
+                container.remove(force=force)
+                self._release_port(container.name)
             return {
                 "status": "removed",
                 "message": "Container supprimé"
             }
-        except NotFound:
-            return {
-                "status": "not_found",
-                "message": "Container introuvable"
-            }
         except APIError as e:
             return {
                 "status": "error",
                 "message": f"Erreur: {str(e)}"
             }
     
+    def get_container_state(self, graph_name: str) -> Dict:
+        """État du container d'un graph sans appel stats (rapide) : running, port, build_id"""
+        try:
+            container = self.client.containers.get(self.get_container_name(graph_name))
+        except NotFound:
+            return {"status": "not_found", "running": False, "port": None, "build_id": None}
+        return {
+            "status": container.status,
+            "running": container.status == "running",
+            "port": self._get_container_port(container),
+            "build_id": (container.labels or {}).get("valhalla.build") or None,
+            "profile": (container.labels or {}).get("valhalla.profile") or None,
+        }
+
     def get_container_status(self, graph_name: str) -> Dict:
         """Récupère le statut d'un container"""
         container_name = self.get_container_name(graph_name)
@@ -408,6 +674,7 @@ class ValhallaDockerManager:
                 "running": container.status == "running",
                 "port": self._get_container_port(container),
                 "health": container.attrs.get("State", {}).get("Health", {}).get("Status", "unknown"),
+                "build_id": (container.labels or {}).get("valhalla.build") or None,
                 "cpu_percent": round(cpu_percent, 2),
                 "memory_mb": round(mem_usage / (1024 * 1024), 2),
                 "memory_percent": round(mem_percent, 2),
@@ -485,3 +752,20 @@ class ValhallaDockerManager:
             "stopped_containers": stopped,
             "containers": containers
         }
+
+
+_manager = None
+_manager_pid = None
+_manager_lock = threading.Lock()
+
+
+def get_manager() -> ValhallaDockerManager:
+    """Gestionnaire partagé par le process (recréé après un fork ou au-delà du TTL des détections)"""
+    global _manager, _manager_pid
+    with _manager_lock:
+        if _manager is None or _manager_pid != os.getpid():
+            _manager = ValhallaDockerManager()
+            _manager_pid = os.getpid()
+        elif time.monotonic() - _manager.detected_at > VALHALLA_MANAGER_CACHE_TTL:
+            _manager.refresh()
+    return _manager
@@ -0,0 +1,271 @@
+# graph/downloads.py
+"""Helpers HTTP partagés par le pipeline de build (retry/backoff, téléchargement sur disque,
+téléchargement segmenté par plages pour les gros PBF)."""
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import requests
+
+
+CHUNK_SIZE = 1024 * 1024
+
+
+@contextmanager
+def file_lock(path: str):
+    """Verrou exclusif inter-processus associé à `path` (fichier `<path>.lock`)."""
+    with open(f"{path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def fetch_with_retry(url: str, timeout: int = 300, stream: bool = False, max_retries: int = 3, backoff_seconds: int = 2, headers: dict | None = None):
+    """Simple HTTP GET with retry/backoff for transient network errors.
+
+    `headers` permet les requêtes conditionnelles (If-None-Match / If-Modified-Since) :
+    une réponse 304 n'est pas une erreur et est retournée telle quelle.
+    """
+    last_exc = None
+    for attempt in range(1, max_retries + 1):
+        try:
+            r = requests.get(url, timeout=timeout, stream=stream, headers=headers)
+            r.raise_for_status()
+            return r
+        except Exception as e:
+            last_exc = e
+            if attempt < max_retries:
+                time.sleep(backoff_seconds * attempt)
+            else:
+                raise
+
+
+def fetch_to_file(url: str, dest: str, timeout: int = 300, headers: dict | None = None, max_retries: int = 3, backoff_seconds: int = 2):
+    """Télécharge `url` en streaming vers `dest` sans garder le corps en mémoire.
+
+    - écrit dans `<dest>.part` en calculant le sha256 au fil de l'eau ;
+    - en cas de coupure, reprend avec `Range: bytes=<n>-` (+ `If-Range` si ETag/Last-Modified),
+      ou repart de zéro si le serveur renvoie 200 ;
+    - renomme atomiquement vers `dest` une fois complet.
+
+    Returns (response, sha256, size). Sur 304 (requête conditionnelle), rien n'est écrit
+    et (response, None, 0) est retourné.
+    """
+    part = f"{dest}.part.{os.getpid()}.{threading.get_ident()}"
+    os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+    hasher = hashlib.sha256()
+    written = 0
+    validator = None
+    first = None
+
+    try:
+        with open(part, "wb") as f:
+            for attempt in range(1, max_retries + 1):
+                req_headers = dict(headers or {})
+                if written:
+                    req_headers.pop("If-None-Match", None)
+                    req_headers.pop("If-Modified-Since", None)
+                    req_headers["Range"] = f"bytes={written}-"
+                    if validator:
+                        req_headers["If-Range"] = validator
+                try:
+                    r = requests.get(url, timeout=timeout, stream=True, headers=req_headers or None)
+                    r.raise_for_status()
+                    if first is None:
+                        first = r
+                        if r.status_code == 304:
+                            r.close()
+                            return r, None, 0
+                        validator = r.headers.get("ETag") or r.headers.get("Last-Modified")
+                    if written and r.status_code != 206:
+                        # Reprise refusée (ou ressource modifiée) : on repart de zéro
+                        f.seek(0)
+                        f.truncate()
+                        hasher = hashlib.sha256()
+                        written = 0
+                    for chunk in r.iter_content(CHUNK_SIZE):
+                        if not chunk:
+                            continue
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        written += len(chunk)
+                    break
+                except Exception:
+                    if attempt < max_retries:
+                        time.sleep(backoff_seconds * attempt)
+                    else:
+                        raise
+        os.replace(part, dest)
+    finally:
+        if os.path.exists(part):
+            try:
+                os.remove(part)
+            except OSError:
+                pass
+
+    return first, hasher.hexdigest(), written
+
+
+def _file_md5(path: str) -> str:
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def fetch_published_md5(md5_url: str, timeout: int = 60) -> str | None:
+    """Lit un fichier `.md5` publié (format `<hash>  <fichier>`), None si absent."""
+    try:
+        r = requests.get(md5_url, timeout=timeout)
+        if r.status_code != 200:
+            return None
+        value = (r.text or "").strip().split()
+        if value and len(value[0]) == 32:
+            return value[0].lower()
+    except Exception:
+        pass
+    return None
+
+
+def split_ranges(size: int, segments: int) -> list[tuple[int, int]]:
+    """Découpe [0, size) en `segments` plages HTTP inclusives (start, end)."""
+    segments = max(1, min(segments, size)) if size > 0 else 1
+    step = -(-size // segments)
+    return [(start, min(start + step, size) - 1) for start in range(0, size, step)] or [(0, -1)]
+
+
+def download_segmented(url: str, dest: str, segments: int = 4, timeout: int = 900, md5_url: str | None = None, min_segment_bytes: int = 64 * 1024 * 1024, max_retries: int = 5, backoff_seconds: int = 2, if_missing: bool = False) -> dict:
+    """Télécharge un gros fichier en plusieurs plages HTTP parallèles, avec reprise.
+
+    Chaque plage est écrite dans `<dest>.part<i>` ; l'état (url, taille, ETag) est
+    conservé dans `<dest>.parts.json` pour reprendre après un redémarrage du worker.
+    Le fichier assemblé est vérifié contre le `.md5` publié (si disponible) puis
+    renommé atomiquement. Retombe sur fetch_to_file si le serveur ne gère pas Range.
+
+    `if_missing` : ne rien faire si `dest` existe une fois le verrou obtenu (un autre
+    worker vient de le télécharger) ; mode "existing" dans le résultat.
+
+    Returns un dict {"mode", "segments", "resumed_bytes", "md5"}.
+    """
+    os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+
+    # Un seul téléchargement par fichier à la fois (plusieurs workers possibles)
+    with file_lock(dest):
+        if if_missing and os.path.exists(dest):
+            return {"mode": "existing", "segments": 0, "resumed_bytes": 0, "md5": "absent"}
+        expected_md5 = fetch_published_md5(md5_url) if md5_url else None
+        try:
+            head = requests.head(url, timeout=60, allow_redirects=True)
+            head.raise_for_status()
+            size = int(head.headers.get("Content-Length") or 0)
+            ranges_ok = head.headers.get("Accept-Ranges", "").lower() == "bytes"
+            validator = head.headers.get("ETag") or head.headers.get("Last-Modified")
+        except Exception:
+            size, ranges_ok, validator = 0, False, None
+
+        if not ranges_ok or size < min_segment_bytes:
+            fetch_to_file(url, dest, timeout=timeout, max_retries=max_retries, backoff_seconds=backoff_seconds)
+            result = {"mode": "single", "segments": 1, "resumed_bytes": 0, "md5": "absent"}
+            if expected_md5:
+                _verify_md5(dest, _file_md5(dest), expected_md5)
+                result["md5"] = "ok"
+            return result
+
+        state_path = f"{dest}.parts.json"
+        plan = {"url": url, "size": size, "validator": validator, "ranges": split_ranges(size, segments)}
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                previous = json.load(f)
+        except Exception:
+            previous = None
+        if previous and all(previous.get(k) == plan[k] for k in ("url", "size", "validator")):
+            plan["ranges"] = [tuple(r) for r in previous["ranges"]]
+        else:
+            for name in os.listdir(os.path.dirname(dest) or "."):
+                if name.startswith(os.path.basename(dest) + ".part"):
+                    try:
+                        os.remove(os.path.join(os.path.dirname(dest) or ".", name))
+                    except OSError:
+                        pass
+            with open(state_path, "w", encoding="utf-8") as f:
+                json.dump(plan, f)
+
+        parts = [f"{dest}.part{i}" for i in range(len(plan["ranges"]))]
+        resumed = sum(os.path.getsize(p) for p in parts if os.path.exists(p))
+
+        def fetch_range(index: int) -> None:
+            start, end = plan["ranges"][index]
+            expected = end - start + 1
+            path = parts[index]
+            for attempt in range(1, max_retries + 1):
+                have = os.path.getsize(path) if os.path.exists(path) else 0
+                if have == expected:
+                    return
+                if have > expected:
+                    os.remove(path)
+                    have = 0
+                headers = {"Range": f"bytes={start + have}-{end}"}
+                if validator:
+                    headers["If-Range"] = validator
+                try:
+                    r = requests.get(url, timeout=timeout, stream=True, headers=headers)
+                    r.raise_for_status()
+                    if r.status_code != 206:
+                        raise RuntimeError(f"Plage refusée par le serveur (HTTP {r.status_code})")
+                    with open(path, "ab") as f:
+                        for chunk in r.iter_content(CHUNK_SIZE):
+                            if chunk:
+                                f.write(chunk)
+                except Exception:
+                    if attempt < max_retries:
+                        time.sleep(backoff_seconds * attempt)
+                    else:
+                        raise
+            if os.path.getsize(path) != expected:
+                raise RuntimeError(f"Segment {index} incomplet après {max_retries} tentatives")
+
+        with ThreadPoolExecutor(max_workers=len(parts), thread_name_prefix="osm-range") as pool:
+            for fut in [pool.submit(fetch_range, i) for i in range(len(parts))]:
+                fut.result()
+
+        # Assemblage + md5 au fil de l'eau
+        md5 = hashlib.md5()
+        tmp = f"{dest}.assembling"
+        with open(tmp, "wb") as out:
+            for path in parts:
+                with open(path, "rb") as f:
+                    for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                        out.write(chunk)
+                        md5.update(chunk)
+        try:
+            if expected_md5:
+                _verify_md5(tmp, md5.hexdigest(), expected_md5)
+        finally:
+            # Un md5 faux invalide les segments : on repartira de zéro
+            for path in parts + [state_path]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        os.replace(tmp, dest)
+        return {
+            "mode": "ranges",
+            "segments": len(parts),
+            "resumed_bytes": resumed,
+            "md5": "ok" if expected_md5 else "absent",
+        }
+
+
+def _verify_md5(path: str, actual: str, expected: str) -> None:
+    if actual != expected:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        raise RuntimeError(f"Checksum MD5 invalide pour {os.path.basename(path)} ({actual} ≠ {expected})")
@@ -0,0 +1,105 @@
+# graph/events.py
+"""État des containers Valhalla tenu à jour par le flux d'événements Docker.
+
+Le watcher (`manage.py watch_docker_events`, service compose `events`) s'abonne
+aux événements des containers `valhalla.managed=true` (démarrage, arrêt, santé,
+suppression, renommage) et reporte aussitôt l'état du graph concerné sur ses
+BuildTask (is_serving, statut, ports, santé) : une liste Docker filtrée sur le
+graph par événement, puis un UPDATE des seuls champs modifiés.
+
+Avec VALHALLA_EVENTS_WATCHER=1, les pages lisent alors l'état en DB sans appel
+Docker, et le proxy cesse de router vers un container mort dès le prochain
+rafraîchissement de sa table de routage (VALHALLA_PROXY_ROUTE_TTL).
+"""
+
+import os
+import time
+
+
+VALHALLA_EVENTS_WATCHER = os.getenv("VALHALLA_EVENTS_WATCHER", "0") == "1"
+# Attente max (s) avant de se réabonner après une coupure du flux
+VALHALLA_EVENTS_MAX_BACKOFF = float(os.getenv("VALHALLA_EVENTS_MAX_BACKOFF", "30"))
+
+# Les événements exec_* des healthchecks sont exclus du filtre (un par intervalle et par container)
+WATCHED_ACTIONS = ("start", "restart", "die", "stop", "kill", "oom", "pause", "unpause", "destroy", "rename", "health_status")
+EVENT_FILTERS = {"type": "container", "label": "valhalla.managed=true", "event": list(WATCHED_ACTIONS)}
+
+
+def event_graph(event: dict) -> str | None:
+    """Graph concerné par un événement Docker décodé, None s'il est sans effet sur l'état."""
+    if event.get("Type") != "container":
+        return None
+    action = (event.get("Action") or event.get("status") or "").split(":", 1)[0]
+    if action not in WATCHED_ACTIONS:
+        return None
+    attributes = (event.get("Actor") or {}).get("Attributes") or {}
+    return attributes.get("valhalla.graph") or None
+
+
+def sync_graphs(states: dict, names=None) -> int:
+    """Reporte `states` ({graph: état}) sur les BuildTask ; retourne le nombre de tâches modifiées.
+
+    `names` : graphs à synchroniser (tous si None) ; un graph absent de `states` n'a plus de container.
+    """
+    from .models import BuildTask
+    from . import container_state
+
+    tasks = BuildTask.objects.all()
+    if names is not None:
+        tasks = tasks.filter(name__in=list(names))
+    owners = container_state.legacy_owners(states)
+    changed = {}
+    for task in tasks:
+        fields = container_state.apply_state(task, states.get(task.name) or {}, owners)
+        if fields:
+            changed.setdefault(fields, []).append(task)
+    for fields, rows in changed.items():
+        BuildTask.objects.bulk_update(rows, list(fields))
+    return sum(len(rows) for rows in changed.values())
+
+
+def sync_graph(manager, graph_name: str) -> int:
+    """Relit les containers d'un graph (un appel Docker) et met sa DB à jour."""
+    from . import container_state
+
+    containers = manager.client.containers.list(
+        all=True, sparse=True, filters={"label": ["valhalla.managed=true", f"valhalla.graph={graph_name}"]}
+    )
+    states = container_state.states_from_summaries([c.attrs for c in containers])
+    return sync_graphs(states, names=[graph_name])
+
+
+def sync_all(manager) -> int:
+    """Resynchronise tous les graphs (démarrage du watcher et reprise après coupure)."""
+    from . import container_state
+
+    return sync_graphs(container_state.snapshot(manager, max_age=0))
+
+
+def watch(log=print) -> None:
+    """Boucle du watcher : abonnement, resynchronisation complète, puis un graph par événement."""
+    from django.db import close_old_connections
+    from .docker_manager import get_manager
+
+    backoff = 1.0
+    while True:
+        manager = get_manager()
+        try:
+            # S'abonner avant la resynchronisation : aucun événement perdu entre les deux
+            stream = manager.client.events(decode=True, filters=EVENT_FILTERS)
+            close_old_connections()
+            log(f"🔄 {sync_all(manager)} tâche(s) resynchronisée(s), écoute des événements Docker")
+            backoff = 1.0
+            for event in stream:
+                graph = event_graph(event)
+                if not graph:
+                    continue
+                close_old_connections()
+                if sync_graph(manager, graph):
+                    log(f"📡 {graph}: {event.get('Action')}")
+        except Exception as e:
+            log(f"⚠️ Flux d'événements Docker interrompu ({type(e).__name__}: {e}), reprise dans {backoff:.0f}s")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, VALHALLA_EVENTS_MAX_BACKOFF)
+            # Le démon a pu redémarrer (nouveau réseau/projet) : redétecter
+            manager.refresh()
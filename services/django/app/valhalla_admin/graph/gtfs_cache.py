@@ -0,0 +1,200 @@
+# graph/gtfs_cache.py
+"""Cache partagé des archives GTFS, adressé par contenu.
+
+Organisation sous GTFS_CACHE_DIR :
+  blobs/<sha256>.zip      une archive par contenu distinct (partagée entre sources)
+  index/<source_id>.json  url, etag, last_modified, sha256, size, last_used
+
+Chaque build revalide les sources avec If-None-Match / If-Modified-Since :
+un 304 réutilise l'archive en cache sans retélécharger. Les téléchargements
+sont écrits en streaming sur disque (sha256 calculé au fil de l'eau). L'espace disque est
+borné par GTFS_CACHE_MAX_BYTES (éviction LRU sur last_used).
+"""
+
+import json
+import os
+import re
+import threading
+import time
+
+from .downloads import fetch_to_file
+
+
+GTFS_CACHE_DIR = os.getenv("GTFS_CACHE_DIR", "/data/sources/gtfs")
+GTFS_CACHE_MAX_BYTES = int(os.getenv("GTFS_CACHE_MAX_BYTES", str(20 * 1024 ** 3)))
+
+# Un blob fraîchement écrit peut ne pas encore être indexé (téléchargements parallèles)
+ORPHAN_GRACE_SECONDS = 600
+
+# États retournés par fetch_gtfs
+STATE_DOWNLOADED = "downloaded"      # nouveau contenu téléchargé
+STATE_UNCHANGED = "unchanged"        # 200 mais contenu identique (même sha256)
+STATE_NOT_MODIFIED = "not_modified"  # 304, archive en cache réutilisée
+STATE_STALE = "stale"                # source injoignable, archive en cache réutilisée
+
+
+def _safe_name(source_id: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]", "_", str(source_id)) or "_"
+
+
+def _index_path(cache_dir: str, source_id: str) -> str:
+    return os.path.join(cache_dir, "index", f"{_safe_name(source_id)}.json")
+
+
+def _blob_path(cache_dir: str, sha256: str) -> str:
+    return os.path.join(cache_dir, "blobs", f"{sha256}.zip")
+
+
+def _load_meta(path: str) -> dict | None:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def _write_meta(path: str, meta: dict) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, path)
+
+
+def fetch_gtfs(source_id: str, url: str, timeout: int = 300, cache_dir: str = GTFS_CACHE_DIR, max_bytes: int = GTFS_CACHE_MAX_BYTES) -> tuple[str, str]:
+    """Garantit la présence de l'archive GTFS d'une source dans le cache.
+
+    Returns (zip_path, state) ; zip_path appartient au cache et ne doit pas être supprimé.
+    """
+    index_path = _index_path(cache_dir, source_id)
+    meta = _load_meta(index_path)
+
+    cached_blob = None
+    headers = {}
+    if meta and meta.get("url") == url and meta.get("sha256"):
+        candidate = _blob_path(cache_dir, meta["sha256"])
+        if os.path.exists(candidate):
+            cached_blob = candidate
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+    os.makedirs(os.path.join(cache_dir, "blobs"), exist_ok=True)
+    # Propre à ce fetch : deux builds peuvent revalider la même source en parallèle
+    incoming = os.path.join(cache_dir, "blobs", f".incoming-{_safe_name(source_id)}.{os.getpid()}.{threading.get_ident()}.zip")
+    try:
+        r, sha256, size = fetch_to_file(url, incoming, timeout=timeout, headers=headers or None)
+    except Exception:
+        if cached_blob:
+            meta["last_used"] = time.time()
+            _write_meta(index_path, meta)
+            return cached_blob, STATE_STALE
+        raise
+
+    if r.status_code == 304:
+        if cached_blob:
+            meta["last_used"] = time.time()
+            _write_meta(index_path, meta)
+            return cached_blob, STATE_NOT_MODIFIED
+        raise RuntimeError(f"304 inattendu sans archive en cache : {url}")
+
+    blob = _blob_path(cache_dir, sha256)
+    state = STATE_UNCHANGED if (meta and meta.get("sha256") == sha256) else STATE_DOWNLOADED
+    if os.path.exists(blob):
+        try:
+            os.remove(incoming)
+        except FileNotFoundError:
+            pass
+    else:
+        # Contenu identique au blob : un rename concurrent vers la même cible est sans effet
+        os.replace(incoming, blob)
+
+    _write_meta(index_path, {
+        "source_id": source_id,
+        "url": url,
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "sha256": sha256,
+        "size": size,
+        "last_used": time.time(),
+    })
+
+    evict(cache_dir, max_bytes, keep={sha256})
+    return blob, state
+
+
+def evict(cache_dir: str = GTFS_CACHE_DIR, max_bytes: int = GTFS_CACHE_MAX_BYTES, keep: set | None = None) -> int:
+    """Supprime les entrées les moins récemment utilisées jusqu'à tenir dans max_bytes.
+
+    Les blobs orphelins (plus référencés par aucun index) sont supprimés passé
+    ORPHAN_GRACE_SECONDS.
+    Returns le nombre d'octets libérés.
+    """
+    keep = keep or set()
+    index_dir = os.path.join(cache_dir, "index")
+    blobs_dir = os.path.join(cache_dir, "blobs")
+
+    entries = []
+    try:
+        names = os.listdir(index_dir)
+    except Exception:
+        names = []
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(index_dir, name)
+        meta = _load_meta(path)
+        if meta and meta.get("sha256"):
+            entries.append((meta.get("last_used") or 0, path, meta["sha256"]))
+
+    refs = {}
+    for _, _, sha in entries:
+        refs[sha] = refs.get(sha, 0) + 1
+
+    sizes = {}
+    try:
+        blob_names = os.listdir(blobs_dir)
+    except Exception:
+        blob_names = []
+    freed = 0
+    for name in blob_names:
+        if name.startswith(".") or not name.endswith(".zip"):
+            continue
+        sha = name[:-4]
+        path = os.path.join(blobs_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        size = st.st_size
+        if sha not in refs and sha not in keep:
+            if time.time() - st.st_mtime < ORPHAN_GRACE_SECONDS:
+                continue
+            try:
+                os.remove(path)
+                freed += size
+            except OSError:
+                pass
+            continue
+        sizes[sha] = size
+
+    total = sum(sizes.values())
+    for _, path, sha in sorted(entries):
+        if total <= max_bytes:
+            break
+        if sha in keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        refs[sha] -= 1
+        if refs[sha] == 0 and sha in sizes:
+            try:
+                os.remove(_blob_path(cache_dir, sha))
+                total -= sizes[sha]
+                freed += sizes[sha]
+            except OSError:
+                pass
+    return freed
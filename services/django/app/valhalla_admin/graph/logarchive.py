@@ -0,0 +1,276 @@
+# graph/logarchive.py
+"""Sortie complète des builds, archivée en segments gzip indexés.
+
+`<graph>/logs/<task_id>/` contient des segments `000000.log.gz`, … (au plus
+VALHALLA_LOG_SEGMENT_BYTES non compressés chacun, coupés en fin de ligne) et
+`index.json` : pour chaque segment, première ligne, nombre de lignes, offset et
+taille non compressés. Un extrait (lignes ou octets) ne décompresse que les
+segments qui le contiennent, en flux : la fin d'un log de plusieurs centaines de
+Mo se lit sans le charger. Le segment en cours est vidé (Z_SYNC_FLUSH) toutes
+les FLUSH_LINES lignes, donc lisible pendant le build jusqu'au dernier index écrit.
+
+Les builds antérieurs gardent un `<graph>/build.log` en clair, lu en flux.
+"""
+
+import gzip
+import json
+import os
+import shutil
+import zlib
+from collections import deque
+
+
+VALHALLA_LOG_SEGMENT_BYTES = int(os.getenv("VALHALLA_LOG_SEGMENT_BYTES", str(8 * 1024 * 1024)))
+# Archives conservées par graph (les plus anciennes sont supprimées au build suivant)
+VALHALLA_LOG_ARCHIVE_KEEP = int(os.getenv("VALHALLA_LOG_ARCHIVE_KEEP", "10"))
+
+LOGS_DIRNAME = "logs"
+INDEX_FILE = "index.json"
+LEGACY_LOG = "build.log"
+FLUSH_LINES = 1000
+READ_CHUNK = 256 * 1024
+
+
+def archive_dir(graph_dir: str, task_id) -> str:
+    return os.path.join(graph_dir, LOGS_DIRNAME, str(task_id))
+
+
+def read_index(directory: str) -> dict | None:
+    try:
+        with open(os.path.join(directory, INDEX_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_index(directory: str, index: dict) -> None:
+    path = os.path.join(directory, INDEX_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp, path)
+
+
+def totals(index: dict) -> tuple[int, int]:
+    """(lignes, octets non compressés) de l'archive."""
+    segments = index.get("segments") or []
+    return sum(s["lines"] for s in segments), sum(s["bytes"] for s in segments)
+
+
+def prune_archives(graph_dir: str, keep: int = VALHALLA_LOG_ARCHIVE_KEEP) -> list[str]:
+    """Supprime les archives les plus anciennes (id de tâche croissant) au-delà de `keep`."""
+    root = os.path.join(graph_dir, LOGS_DIRNAME)
+    try:
+        names = sorted((n for n in os.listdir(root) if n.isdigit()), key=int)
+    except OSError:
+        return []
+    removed = []
+    for name in names[:max(0, len(names) - keep)]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        removed.append(name)
+    return removed
+
+
+class ArchiveWriter:
+    """Fichier texte en écriture (`write`) qui produit les segments gzip et l'index.
+
+    Réouvrir une archive existante (build relancé) ajoute de nouveaux segments.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = VALHALLA_LOG_SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.index = read_index(directory) or {"version": 1, "segments": []}
+        self._raw = None
+        self._gz = None
+        self._segment = None
+        self._pending = 0
+
+    def _open_segment(self) -> None:
+        lines, size = totals(self.index)
+        self._segment = {
+            "file": f"{len(self.index['segments']):06d}.log.gz",
+            "first_line": lines,
+            "lines": 0,
+            "offset": size,
+            "bytes": 0,
+        }
+        self.index["segments"].append(self._segment)
+        self._raw = open(os.path.join(self.directory, self._segment["file"]), "wb")
+        self._gz = gzip.GzipFile(fileobj=self._raw, mode="wb", compresslevel=6)
+
+    def _close_segment(self) -> None:
+        if self._gz is None:
+            return
+        self._gz.close()
+        self._raw.close()
+        self._gz = self._raw = self._segment = None
+        self._pending = 0
+        _save_index(self.directory, self.index)
+
+    def write(self, text: str) -> None:
+        if not text:
+            return
+        if self._gz is None:
+            self._open_segment()
+        data = text.encode("utf-8", errors="replace")
+        self._gz.write(data)
+        newlines = text.count("\n")
+        self._segment["bytes"] += len(data)
+        self._segment["lines"] += newlines
+        self._pending += newlines
+        if self._segment["bytes"] >= self.segment_bytes and text.endswith("\n"):
+            self._close_segment()
+        elif self._pending >= FLUSH_LINES:
+            self.flush()
+
+    def flush(self) -> None:
+        """Rend le segment en cours lisible jusqu'ici et publie l'index."""
+        if self._gz is None:
+            return
+        self._gz.flush()
+        self._pending = 0
+        _save_index(self.directory, self.index)
+
+    def close(self) -> None:
+        self._close_segment()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _segment_bytes(directory: str, segment: dict):
+    """Octets non compressés d'un segment, en flux (tolère un segment en cours d'écriture)."""
+    remaining = segment["bytes"]
+    decompressor = zlib.decompressobj(wbits=31)
+    with open(os.path.join(directory, segment["file"]), "rb") as f:
+        while remaining > 0:
+            chunk = f.read(READ_CHUNK)
+            if not chunk:
+                break
+            data = decompressor.decompress(chunk)
+            if data:
+                data = data[:remaining]
+                remaining -= len(data)
+                yield data
+            if decompressor.eof:
+                break
+
+
+def _segment_lines(directory: str, segment: dict):
+    pending = b""
+    for data in _segment_bytes(directory, segment):
+        pending += data
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8", errors="replace")
+    if pending:
+        yield pending.decode("utf-8", errors="replace")
+
+
+def iter_lines(directory: str, start: int = 0, count: int | None = None):
+    """Lignes [start, start+count) de l'archive ; seuls les segments concernés sont décompressés."""
+    index = read_index(directory) or {"segments": []}
+    end = None if count is None else start + count
+    for segment in index["segments"]:
+        first = segment["first_line"]
+        if first + segment["lines"] <= start:
+            continue
+        if end is not None and first >= end:
+            return
+        for number, line in enumerate(_segment_lines(directory, segment), start=first):
+            if number >= first + segment["lines"] or (end is not None and number >= end):
+                break
+            if number >= start:
+                yield line
+
+
+def tail(directory: str, count: int) -> list[str]:
+    """Dernières `count` lignes : ne décompresse que les derniers segments nécessaires."""
+    segments = (read_index(directory) or {"segments": []})["segments"]
+    needed = []
+    lines = 0
+    for segment in reversed(segments):
+        needed.append(segment)
+        lines += segment["lines"]
+        if lines >= count:
+            break
+    if not needed or not count:
+        return []
+    return list(deque(iter_lines(directory, start=needed[-1]["first_line"]), maxlen=count))
+
+
+def iter_bytes(directory: str, start: int = 0, end: int | None = None):
+    """Octets non compressés [start, end] (bornes incluses, comme un en-tête Range)."""
+    index = read_index(directory) or {"segments": []}
+    for segment in index["segments"]:
+        seg_start = segment["offset"]
+        seg_end = seg_start + segment["bytes"] - 1
+        if seg_end < start:
+            continue
+        if end is not None and seg_start > end:
+            return
+        position = seg_start
+        for data in _segment_bytes(directory, segment):
+            lo = max(start - position, 0)
+            hi = len(data) if end is None else min(len(data), end - position + 1)
+            if lo < hi:
+                yield data[lo:hi]
+            position += len(data)
+            if end is not None and position > end:
+                return
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """Plage unique d'un en-tête `Range: bytes=a-b` / `a-` / `-n`, bornée à `size` ; None si absente ou invalide."""
+    if not header or not header.startswith("bytes=") or "," in header or size <= 0:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first == "":
+            length = int(last)
+            if length <= 0:
+                return None
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+# ─────────────────────────
+# Anciens builds : build.log en clair
+# ─────────────────────────
+
+def iter_legacy_lines(path: str, start: int = 0, count: int | None = None):
+    end = None if count is None else start + count
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for number, line in enumerate(f):
+            if end is not None and number >= end:
+                return
+            if number >= start:
+                yield line.rstrip("\n")
+
+
+def legacy_tail(path: str, count: int) -> list[str]:
+    return list(deque(iter_legacy_lines(path), maxlen=count)) if count else []
+
+
+def iter_legacy_bytes(path: str, start: int = 0, end: int | None = None):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            chunk = f.read(READ_CHUNK if remaining is None else min(READ_CHUNK, remaining))
+            if not chunk:
+                return
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
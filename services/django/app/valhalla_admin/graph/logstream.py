@@ -0,0 +1,109 @@
+# graph/logstream.py
+"""Diffusion en direct du journal des builds (Redis pub/sub → Server-Sent Events).
+
+- Côté worker, chaque INSERT de lignes (BuildTask.add_log_lines) est publié sur
+  le canal `valhalla:buildlog:<task>` : {"cursor": seq de la dernière ligne, "lines": [...]}.
+- Côté navigateur, `graph/task/<id>/logs/stream/` (vue asynchrone, servie par
+  uvicorn) rejoue d'abord les lignes en DB après le curseur (`?after=` ou
+  `Last-Event-ID`), puis relaie les publications ; les lots déjà rejoués sont
+  ignorés grâce au curseur. Chaque événement SSE porte le curseur en `id` :
+  une reconnexion reprend exactement où le flux s'était arrêté.
+
+Redis indisponible : la publication est suspendue quelques secondes et les pages
+retombent sur le polling `?after=` de graph_status.
+"""
+
+import json
+import os
+import time
+
+
+VALHALLA_LOG_STREAM_URL = os.getenv("VALHALLA_LOG_STREAM_URL", "redis://redis:6379/0")
+# Intervalle (s) des commentaires keep-alive et de la relecture du statut de la tâche
+VALHALLA_LOG_STREAM_KEEPALIVE = float(os.getenv("VALHALLA_LOG_STREAM_KEEPALIVE", "15"))
+# Servi par uvicorn (voir asgi.py) : sous uWSGI un flux bloquerait un worker
+SSE_AVAILABLE = os.getenv("VALHALLA_ASGI") == "1"
+
+TERMINAL_STATUSES = ("built", "serving", "error")
+# Pause de la publication après une erreur Redis (le build ne doit pas ralentir)
+_RETRY_AFTER = 10.0
+
+_client = None
+_down_until = 0.0
+
+
+def channel(task_id: int) -> str:
+    return f"valhalla:buildlog:{task_id}"
+
+
+def sse_event(event: str, data, event_id=None) -> str:
+    """Événement SSE sérialisé (data en JSON, sur une ligne)."""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def publish(task_id: int, cursor: int | None, lines: list[str]) -> None:
+    """Publie un lot de lignes (jamais bloquant pour le build : erreurs ignorées)."""
+    global _client, _down_until
+    if not VALHALLA_LOG_STREAM_URL or not lines or time.monotonic() < _down_until:
+        return
+    try:
+        if _client is None:
+            import redis
+
+            _client = redis.Redis.from_url(VALHALLA_LOG_STREAM_URL, socket_connect_timeout=1, socket_timeout=1)
+        _client.publish(channel(task_id), json.dumps({"cursor": cursor, "lines": lines}, ensure_ascii=False))
+    except Exception:
+        _down_until = time.monotonic() + _RETRY_AFTER
+
+
+async def events(task_id: int, after: int):
+    """Flux SSE du journal d'une tâche : rattrapage DB, puis lignes publiées, jusqu'à un statut final."""
+    import redis.asyncio as aioredis
+    from asgiref.sync import sync_to_async
+    from .models import BuildTask
+
+    task = await BuildTask.objects.aget(id=task_id)
+    client = aioredis.Redis.from_url(VALHALLA_LOG_STREAM_URL)
+    pubsub = client.pubsub()
+    try:
+        # S'abonner avant le rattrapage : aucune ligne perdue entre les deux
+        await pubsub.subscribe(channel(task_id))
+        more = True
+        while more:
+            lines, cursor, more = await sync_to_async(task.log_lines_after)(after)
+            if lines:
+                yield sse_event("lines", {"cursor": cursor, "lines": lines}, cursor)
+                after = cursor
+
+        status = task.status
+        yield sse_event("status", {"status": status})
+        if status in TERMINAL_STATUSES:
+            yield sse_event("end", {"status": status})
+            return
+        next_check = time.monotonic() + VALHALLA_LOG_STREAM_KEEPALIVE
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=VALHALLA_LOG_STREAM_KEEPALIVE)
+            if message is not None:
+                batch = json.loads(message["data"])
+                cursor = batch.get("cursor")
+                # Lot déjà envoyé par le rattrapage
+                if cursor is not None and cursor <= after:
+                    continue
+                yield sse_event("lines", batch, cursor)
+                if cursor is not None:
+                    after = cursor
+            if time.monotonic() < next_check:
+                continue
+            next_check = time.monotonic() + VALHALLA_LOG_STREAM_KEEPALIVE
+            current = await BuildTask.objects.filter(id=task_id).values_list("status", flat=True).afirst()
+            if current != status:
+                status = current
+                yield sse_event("status", {"status": status})
+            if status is None or status in TERMINAL_STATUSES:
+                yield sse_event("end", {"status": status})
+                return
+            yield ": keep-alive\n\n"
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
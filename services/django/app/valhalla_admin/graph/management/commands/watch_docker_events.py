@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from valhalla_admin.graph.events import watch
+
+
+class Command(BaseCommand):
+    help = "Tient l'état des graphs (is_serving, ports, santé) à jour depuis le flux d'événements Docker"
+
+    def handle(self, *args, **options):
+        watch(log=lambda message: self.stdout.write(message))
@@ -0,0 +1,81 @@
+# graph/metrics.py
+"""Métriques CPU/mémoire des containers Valhalla, échantillonnées en arrière-plan.
+
+La tâche beat `collect_container_metrics` lit `stats` de chaque container
+`valhalla.managed=true` toutes les VALHALLA_METRICS_INTERVAL secondes et
+enregistre un échantillon dans ContainerMetricSample. La table est un tampon
+circulaire : chaque container dispose de RETENTION/INTERVAL emplacements
+(`slot`), réécrits en place, donc de taille bornée quel que soit l'historique.
+"""
+
+import os
+
+
+VALHALLA_METRICS_INTERVAL = int(os.getenv("VALHALLA_METRICS_INTERVAL", "60"))
+VALHALLA_METRICS_RETENTION_HOURS = int(os.getenv("VALHALLA_METRICS_RETENTION_HOURS", "24"))
+# Requêtes stats simultanées (chacune bloque ~1 s côté Docker)
+VALHALLA_METRICS_WORKERS = int(os.getenv("VALHALLA_METRICS_WORKERS", "8"))
+
+RING_SLOTS = max(1, VALHALLA_METRICS_RETENTION_HOURS * 3600 // VALHALLA_METRICS_INTERVAL)
+
+
+def ring_slot(timestamp: float) -> int:
+    """Emplacement du tampon circulaire pour un instant donné (epoch, s)."""
+    return int(timestamp // VALHALLA_METRICS_INTERVAL) % RING_SLOTS
+
+
+def sample_from_stats(stats: dict) -> dict:
+    """Réduit une réponse `docker stats` (stream=False) aux valeurs stockées."""
+    cpu = stats.get("cpu_stats") or {}
+    precpu = stats.get("precpu_stats") or {}
+    cpu_delta = (cpu.get("cpu_usage") or {}).get("total_usage", 0) - (precpu.get("cpu_usage") or {}).get("total_usage", 0)
+    system_delta = cpu.get("system_cpu_usage", 0) - precpu.get("system_cpu_usage", 0)
+    online = cpu.get("online_cpus") or len((cpu.get("cpu_usage") or {}).get("percpu_usage") or [1])
+    cpu_percent = (cpu_delta / system_delta) * online * 100 if system_delta > 0 and cpu_delta > 0 else 0.0
+
+    memory = stats.get("memory_stats") or {}
+    detail = memory.get("stats") or {}
+    usage = memory.get("usage") or 0
+    # Cache de pages (tuiles mmap) : « cache » en cgroup v1, « file » en v2
+    cache = detail.get("cache", detail.get("file"))
+    limit = memory.get("limit")
+    mb = 1024 * 1024
+    return {
+        "cpu_percent": round(cpu_percent, 2),
+        "memory_mb": round(usage / mb, 2),
+        "memory_limit_mb": round(limit / mb, 2) if limit else None,
+        "cache_mb": round(cache / mb, 2) if cache is not None else None,
+    }
+
+
+def container_fields(attrs: dict) -> dict:
+    """Identité d'un container tirée d'un résultat `containers.list(sparse=True)`.
+
+    En mode sparse, `Container.name` (attrs["Name"]) est absent : le nom vient de `Names`.
+    """
+    labels = attrs.get("Labels") or {}
+    return {
+        "container_name": (attrs.get("Names") or [""])[0].lstrip("/"),
+        "graph_name": labels.get("valhalla.graph", ""),
+        "replica": int(labels.get("valhalla.replica") or 0),
+    }
+
+
+def latest_by_graph(samples) -> dict:
+    """Dernier échantillon de chaque container, sommé par graph (replicas cumulés).
+
+    `samples` : échantillons récents triés du plus récent au plus ancien.
+    """
+    seen = set()
+    result = {}
+    for s in samples:
+        if s.container_name in seen:
+            continue
+        seen.add(s.container_name)
+        entry = result.setdefault(s.graph_name, {
+            "cpu_percent": 0.0, "memory_mb": 0.0, "sampled_at": s.sampled_at, "containers": 0,
+        })
+        entry["cpu_percent"] = round(entry["cpu_percent"] + s.cpu_percent, 2)
+        entry["memory_mb"] = round(entry["memory_mb"] + s.memory_mb, 2)
+        entry["containers"] += 1
+    return result
@@ -0,0 +1,18 @@
+# Generated by Django on 2026-10-18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('graph', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='buildtask',
+            name='release_dir',
+            field=models.CharField(blank=True, max_length=500, null=True),
+        ),
+    ]
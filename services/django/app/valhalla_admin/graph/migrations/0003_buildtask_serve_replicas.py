@@ -0,0 +1,23 @@
+# Generated by Django on 2026-10-18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('graph', '0002_buildtask_release_dir'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='buildtask',
+            name='serve_replicas',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='buildtask',
+            name='serve_ports',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django on 2026-10-18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('graph', '0003_buildtask_serve_replicas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='buildtask',
+            name='serve_profile',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django on 2026-10-18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('graph', '0004_buildtask_serve_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContainerMetricSample',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('container_name', models.CharField(max_length=200)),
+                ('graph_name', models.CharField(max_length=200)),
+                ('replica', models.PositiveSmallIntegerField(default=0)),
+                ('slot', models.PositiveIntegerField()),
+                ('sampled_at', models.DateTimeField()),
+                ('cpu_percent', models.FloatField()),
+                ('memory_mb', models.FloatField()),
+                ('memory_limit_mb', models.FloatField(blank=True, null=True)),
+                ('cache_mb', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['graph_name', 'sampled_at'], name='graph_metric_graph_time'),
+                    models.Index(fields=['sampled_at'], name='graph_metric_time'),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(fields=('container_name', 'slot'), name='graph_metric_container_slot'),
+                ],
+            },
+        ),
+    ]
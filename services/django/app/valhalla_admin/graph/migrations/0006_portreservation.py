@@ -0,0 +1,24 @@
+# Generated by Django on 2026-10-18
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('graph', '0005_containermetricsample'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortReservation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('port', models.PositiveIntegerField(unique=True)),
+                ('container_name', models.CharField(max_length=200, unique=True)),
+                ('graph_name', models.CharField(blank=True, default='', max_length=200)),
+                ('reserved_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
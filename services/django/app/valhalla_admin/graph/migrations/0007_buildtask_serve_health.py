@@ -0,0 +1,18 @@
+# Generated by Django on 2026-10-18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('graph', '0006_portreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='buildtask',
+            name='serve_health',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+    ]
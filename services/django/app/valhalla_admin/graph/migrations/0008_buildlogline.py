@@ -0,0 +1,27 @@
+# Generated by Django on 2026-10-18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('graph', '0007_buildtask_serve_health'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuildLogLine',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('text', models.TextField()),
+                ('task', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='log_lines', to='graph.buildtask')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['task', 'seq'], name='graph_logline_task_seq')],
+            },
+        ),
+    ]
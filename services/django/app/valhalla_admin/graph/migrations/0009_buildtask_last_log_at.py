@@ -0,0 +1,18 @@
+# Generated by Django on 2026-10-18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('graph', '0008_buildlogline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='buildtask',
+            name='last_log_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.utils import timezone
 
+from .logstream import publish
+
 class BuildTask(models.Model):
 
     STATUS_CHOICES = [
@@ -26,34 +28,126 @@ class BuildTask(models.Model):
     started_at = models.DateTimeField(blank=True, null=True)
     finished_at = models.DateTimeField(blank=True, null=True)
     logs = models.TextField(blank=True, default="")
+    # Horodatage de la dernière ligne de journal (détection des builds silencieux)
+    last_log_at = models.DateTimeField(blank=True, null=True, db_index=True)
 
     output_dir = models.CharField(max_length=500, blank=True, null=True)
+    # Release construite par cette tâche (<graph>/releases/<id>) ; vide pour les builds antérieurs
+    release_dir = models.CharField(max_length=500, blank=True, null=True)
 
     is_ready = models.BooleanField(default=False)
     is_serving = models.BooleanField(default=False)
     serve_port = models.IntegerField(null=True, blank=True)
+    # Nombre de containers Valhalla servant le graph (répartition de charge par le proxy)
+    serve_replicas = models.PositiveSmallIntegerField(default=1)
+    # Ports de tous les replicas en service (serve_port = premier replica)
+    serve_ports = models.JSONField(default=list, blank=True)
+    # Santé Docker du container servi (healthy/unhealthy/starting), tenue à jour par le watcher d'événements
+    serve_health = models.CharField(max_length=20, blank=True, default="")
+    # Profil de service (threads, cpuset, mémoire, shm, cache de tuiles), voir profiles.py
+    serve_profile = models.JSONField(default=dict, blank=True)
+
+    @property
+    def serve_dir(self):
+        """Dossier monté dans le conteneur Valhalla (release, ou output_dir pour les anciens builds)."""
+        return self.release_dir or self.output_dir
 
     def add_log(self, text):
-        line = f"\n[{timezone.now()}] {text}"
-        # Append in-memory
-        logs = (self.logs or "") + line
-        # Cap logs to avoid OOM in worker/DB (keep last ~1MB)
-        MAX_SIZE = 2_000_000  # 2 MB hard cap
-        TRIM_TO = 1_000_000   # keep last 1 MB
-        if len(logs) > MAX_SIZE:
-            logs = logs[-TRIM_TO:]
-        self.logs = logs
-        # Try safe update to avoid race conditions / deleted rows
+        self.add_log_lines([(timezone.now(), text)])
+
+    def add_log_lines(self, entries):
+        """Ajoute des lignes [(horodatage, texte)] au journal : un INSERT groupé, sans relire ni réécrire l'existant."""
+        rows = [BuildLogLine(task_id=self.id, created_at=at, text=text) for at, text in entries]
+        if not rows:
+            return
         try:
-            self.save(update_fields=['logs'])
+            BuildLogLine.objects.bulk_create(rows)
+            self.last_log_at = max(row.created_at for row in rows)
+            BuildTask.objects.filter(id=self.id).update(last_log_at=self.last_log_at)
         except Exception:
-            try:
-                fresh = BuildTask.objects.filter(id=self.id).first()
-                if fresh:
-                    fresh.logs = logs
-                    fresh.save(update_fields=['logs'])
-                    # reflect back
-                    self.logs = fresh.logs
-            except Exception:
-                # Swallow logging errors to avoid breaking the build pipeline
-                pass
\ No newline at end of file
+            # Swallow logging errors (ex: tâche supprimée) to avoid breaking the build pipeline
+            return
+        # Diffusion en direct aux pages ouvertes (flux SSE, voir logstream.py)
+        publish(self.id, rows[-1].seq, [row.display() for row in rows])
+
+    def log_preview(self, head: int, tail: int) -> tuple[list[str], list[str], int]:
+        """Premières et dernières lignes du journal, et nombre total de lignes.
+
+        Si le journal tient en head+tail lignes, tout est dans la première liste et la seconde est vide.
+        Les tâches antérieures au journal par lignes gardent leur texte dans `logs`, placé en tête.
+        """
+        legacy = [line for line in (self.logs or "").splitlines() if line]
+        lines = self.log_lines.order_by("seq")
+        count = lines.count()
+        total = len(legacy) + count
+        if total <= head + tail:
+            return legacy + [l.display() for l in lines], [], total
+        first = legacy[:head]
+        first += [l.display() for l in lines[:head - len(first)]] if len(first) < head else []
+        last = [l.display() for l in reversed(lines.order_by("-seq")[:tail])]
+        if count < tail:
+            last = legacy[len(legacy) - (tail - count):] + last
+        return first, last, total
+
+    def log_lines_after(self, after: int, limit: int = 1000) -> tuple[list[str], int, bool]:
+        """Lignes ajoutées après le curseur `after` (seq) : (lignes, nouveau curseur, reste-t-il des lignes)."""
+        rows = list(self.log_lines.filter(seq__gt=after).order_by("seq")[:limit + 1])
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return [row.display() for row in rows], (rows[-1].seq if rows else after), more
+
+    def log_cursor(self) -> int:
+        """Curseur de la dernière ligne du journal (0 si vide)."""
+        return self.log_lines.order_by("-seq").values_list("seq", flat=True).first() or 0
+
+
+class BuildLogLine(models.Model):
+    """Ligne du journal d'une tâche, en ajout seul (numérotée par `seq`, croissant)."""
+
+    seq = models.BigAutoField(primary_key=True)
+    # Index composite (task, seq) ci-dessous : sert aussi les recherches par tâche
+    task = models.ForeignKey(BuildTask, on_delete=models.CASCADE, related_name="log_lines", db_index=False)
+    created_at = models.DateTimeField(default=timezone.now)
+    text = models.TextField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["task", "seq"], name="graph_logline_task_seq"),
+        ]
+
+    def display(self) -> str:
+        return f"[{self.created_at}] {self.text}"
+
+
+class ContainerMetricSample(models.Model):
+    """Échantillon CPU/mémoire d'un container Valhalla (tampon circulaire, voir metrics.py)."""
+
+    container_name = models.CharField(max_length=200)
+    graph_name = models.CharField(max_length=200)
+    replica = models.PositiveSmallIntegerField(default=0)
+    # Emplacement du tampon circulaire, réécrit à chaque tour
+    slot = models.PositiveIntegerField()
+    sampled_at = models.DateTimeField()
+
+    cpu_percent = models.FloatField()
+    memory_mb = models.FloatField()
+    memory_limit_mb = models.FloatField(null=True, blank=True)
+    cache_mb = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["container_name", "slot"], name="graph_metric_container_slot"),
+        ]
+        indexes = [
+            models.Index(fields=["graph_name", "sampled_at"], name="graph_metric_graph_time"),
+            models.Index(fields=["sampled_at"], name="graph_metric_time"),
+        ]
+
+
+class PortReservation(models.Model):
+    """Port hôte réservé à un container Valhalla (allocation atomique, voir ports.py)."""
+
+    port = models.PositiveIntegerField(unique=True)
+    container_name = models.CharField(max_length=200, unique=True)
+    graph_name = models.CharField(max_length=200, blank=True, default="")
+    reserved_at = models.DateTimeField(default=timezone.now)
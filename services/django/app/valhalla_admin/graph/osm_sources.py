@@ -0,0 +1,299 @@
+# graph/osm_sources.py
+"""Gestion des PBF OSM sources (/data/sources/osm) : mise à jour incrémentale
+et cache des fusions multi-régions.
+
+Les extraits Geofabrik publient des diffs quotidiens (`<region>-updates/`) :
+plutôt que de retélécharger tout le PBF, on applique les `.osc.gz` manquants
+avec `osmium apply-changes`. La séquence de réplication de chaque fichier est
+suivie dans `<fichier>.state.json`.
+
+Les fusions `osmium merge` sont conservées sous `merged/<clé>.osm.pbf`, la clé
+étant dérivée des sha256 des fichiers d'entrée : une même combinaison de
+régions est réutilisée d'un build (ou d'un graph) à l'autre.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+
+import requests
+
+from .downloads import fetch_to_file, file_lock
+
+
+# Nombre max de diffs appliqués d'un coup ; au-delà un téléchargement complet est préférable
+OSM_MAX_DIFFS = int(os.getenv("OSM_MAX_DIFFS", "60"))
+# Budget disque du cache des fusions (éviction LRU)
+OSM_MERGE_CACHE_MAX_BYTES = int(os.getenv("OSM_MERGE_CACHE_MAX_BYTES", str(20 * 1024 ** 3)))
+
+
+def updates_url_for(url: str | None) -> str | None:
+    """URL du répertoire de réplication Geofabrik associé à un extrait `-latest.osm.pbf`."""
+    if not url:
+        return None
+    m = re.match(r"^(https?://download\.geofabrik\.de/.+)-latest\.osm\.pbf$", url)
+    return f"{m.group(1)}-updates" if m else None
+
+
+def parse_state(text: str) -> dict:
+    """Parse un state.txt d'osmosis (sequenceNumber, timestamp)."""
+    values = {}
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        k, v = line.split("=", 1)
+        values[k.strip()] = v.strip().replace("\\:", ":")
+    state = {}
+    if values.get("sequenceNumber", "").isdigit():
+        state["sequence"] = int(values["sequenceNumber"])
+    if values.get("timestamp"):
+        state["timestamp"] = values["timestamp"]
+    return state
+
+
+def sequence_path(sequence: int) -> str:
+    """4321 → '000/004/321' (arborescence des diffs de réplication)."""
+    s = f"{sequence:09d}"
+    return f"{s[0:3]}/{s[3:6]}/{s[6:9]}"
+
+
+def state_path(local_path: str) -> str:
+    return f"{local_path}.state.json"
+
+
+def load_state(local_path: str) -> dict | None:
+    try:
+        with open(state_path(local_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def save_state(local_path: str, state: dict) -> None:
+    tmp = f"{state_path(local_path)}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, state_path(local_path))
+
+
+def fetch_remote_state(updates_url: str, sequence: int | None = None, timeout: int = 60) -> dict:
+    """State courant du serveur de réplication (ou celui d'une séquence donnée)."""
+    url = f"{updates_url}/state.txt" if sequence is None else f"{updates_url}/{sequence_path(sequence)}.state.txt"
+    r = requests.get(url, timeout=timeout)
+    r.raise_for_status()
+    state = parse_state(r.text)
+    if "sequence" not in state:
+        raise RuntimeError(f"state.txt invalide : {url}")
+    return state
+
+
+def _osmium() -> str:
+    return shutil.which("osmium") or "/usr/bin/osmium"
+
+
+def read_pbf_sequence(local_path: str) -> dict:
+    """Séquence/horodatage de réplication inscrits dans l'en-tête du PBF (Geofabrik)."""
+    state = {}
+    for key, option in (("sequence", "osmosis_replication_sequence_number"), ("timestamp", "osmosis_replication_timestamp")):
+        try:
+            out = subprocess.run(
+                [_osmium(), "fileinfo", "-g", f"header.option.{option}", local_path],
+                capture_output=True, text=True, timeout=120,
+            ).stdout.strip()
+        except Exception:
+            out = ""
+        if out:
+            state[key] = int(out) if key == "sequence" and out.isdigit() else out
+    return state
+
+
+def init_state(local_path: str, download_url: str | None, fresh: bool = True) -> dict | None:
+    """Initialise le suivi de réplication d'un PBF.
+
+    La séquence vient de l'en-tête du PBF. À défaut, l'état distant n'est adopté que
+    pour un fichier fraîchement téléchargé (`fresh`) : pour un fichier plus ancien il
+    marquerait à tort le PBF comme à jour, None est alors retourné.
+    """
+    updates_url = updates_url_for(download_url)
+    if not updates_url:
+        return None
+    state = read_pbf_sequence(local_path)
+    if "sequence" not in state:
+        if not fresh:
+            return None
+        state = fetch_remote_state(updates_url)
+    state.update({"updates_url": updates_url, "updated_at": time.time()})
+    save_state(local_path, state)
+    return state
+
+
+def update_osm_file(local_path: str, download_url: str | None, max_diffs: int = OSM_MAX_DIFFS) -> dict:
+    """Applique les diffs de réplication manquants au PBF local.
+
+    Returns {"status": "updated"|"up_to_date"|"untracked"|"too_old", "from", "to", "applied"}.
+    """
+    updates_url = updates_url_for(download_url)
+    if not updates_url:
+        return {"status": "untracked", "applied": 0}
+
+    with file_lock(local_path):
+        state = load_state(local_path)
+        if not state or "sequence" not in state:
+            state = init_state(local_path, download_url, fresh=False)
+            if not state:
+                # Âge inconnu : seul un retéléchargement complet garantit des données à jour
+                return {"status": "too_old", "from": None, "to": None, "applied": 0}
+        local_seq = state["sequence"]
+
+        remote = fetch_remote_state(updates_url)
+        remote_seq = remote["sequence"]
+        if remote_seq <= local_seq:
+            return {"status": "up_to_date", "from": local_seq, "to": local_seq, "applied": 0}
+        if remote_seq - local_seq > max_diffs:
+            return {"status": "too_old", "from": local_seq, "to": remote_seq, "applied": 0}
+
+        workdir = tempfile.mkdtemp(prefix="osc-", dir=os.path.dirname(local_path))
+        try:
+            diffs = []
+            for seq in range(local_seq + 1, remote_seq + 1):
+                dest = os.path.join(workdir, f"{seq}.osc.gz")
+                fetch_to_file(f"{updates_url}/{sequence_path(seq)}.osc.gz", dest, timeout=300)
+                diffs.append(dest)
+
+            out_path = os.path.join(workdir, "updated.osm.pbf")
+            cmd = [_osmium(), "apply-changes", local_path] + diffs + [
+                "-o", out_path, "-O",
+                f"--output-header=osmosis_replication_sequence_number={remote_seq}",
+            ]
+            if remote.get("timestamp"):
+                cmd.append(f"--output-header=osmosis_replication_timestamp={remote['timestamp']}")
+            subprocess.run(cmd, check=True, capture_output=True, text=True)
+            os.replace(out_path, local_path)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        save_state(local_path, {
+            "sequence": remote_seq,
+            "timestamp": remote.get("timestamp"),
+            "updates_url": updates_url,
+            "updated_at": time.time(),
+        })
+        return {"status": "updated", "from": local_seq, "to": remote_seq, "applied": remote_seq - local_seq}
+
+
+def catalog_with_freshness(catalog: list[dict], source_dir: str) -> list[dict]:
+    """Copie du catalogue OSM annotée avec l'état local de chaque fichier.
+
+    Ajoute `local` (présent dans source_dir), `sequence`, `timestamp` (données OSM)
+    et `updated_at` (dernière mise à jour appliquée).
+    """
+    entries = []
+    for entry in catalog:
+        e = dict(entry)
+        local_path = os.path.join(source_dir, entry["file"])
+        e["local"] = os.path.exists(local_path)
+        state = load_state(local_path) if e["local"] else None
+        e["sequence"] = (state or {}).get("sequence")
+        e["timestamp"] = (state or {}).get("timestamp")
+        e["updated_at"] = (state or {}).get("updated_at")
+        entries.append(e)
+    return entries
+
+
+# ─────────────────────────
+# Cache des fusions multi-régions
+# ─────────────────────────
+
+def file_sha256(path: str) -> str:
+    """sha256 d'un fichier, mémorisé dans `<path>.sha256.json` tant que taille/mtime sont inchangés."""
+    st = os.stat(path)
+    sidecar = f"{path}.sha256.json"
+    try:
+        with open(sidecar, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("size") == st.st_size and cached.get("mtime_ns") == st.st_mtime_ns:
+            return cached["sha256"]
+    except Exception:
+        pass
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    try:
+        tmp = f"{sidecar}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}, f)
+        os.replace(tmp, sidecar)
+    except OSError:
+        pass
+    return digest
+
+
+def merge_key(paths: list[str]) -> str:
+    """Clé d'une fusion : hash de la liste triée des hash d'entrée (indépendante de l'ordre)."""
+    hashes = sorted(file_sha256(p) for p in paths)
+    return hashlib.sha256("\n".join(hashes).encode()).hexdigest()
+
+
+def merge_cached(paths: list[str], cache_dir: str, max_bytes: int = OSM_MERGE_CACHE_MAX_BYTES) -> tuple[str, bool]:
+    """Fusionne des PBF avec `osmium merge`, en réutilisant une fusion identique déjà en cache.
+
+    Returns (merged_path, cache_hit).
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    merged_path = os.path.join(cache_dir, f"{merge_key(paths)}.osm.pbf")
+
+    with file_lock(merged_path):
+        if os.path.exists(merged_path):
+            os.utime(merged_path)  # LRU : marque comme récemment utilisé
+            return merged_path, True
+
+        tmp = f"{merged_path}.tmp.osm.pbf"
+        subprocess.run([_osmium(), "merge"] + list(paths) + ["-o", tmp, "-O"], check=True)
+        os.replace(tmp, merged_path)
+
+    evict_merged(cache_dir, max_bytes, keep={merged_path})
+    return merged_path, False
+
+
+def evict_merged(cache_dir: str, max_bytes: int = OSM_MERGE_CACHE_MAX_BYTES, keep: set | None = None) -> list[str]:
+    """Supprime les fusions les moins récemment utilisées au-delà de max_bytes."""
+    keep = keep or set()
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".osm.pbf") or ".tmp." in name:
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, path, st.st_size))
+
+    total = sum(size for _, _, size in entries)
+    removed = []
+    for _, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path in keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        for suffix in (".lock", ".sha256.json"):
+            try:
+                os.remove(path + suffix)
+            except OSError:
+                pass
+        total -= size
+        removed.append(path)
+    return removed
@@ -0,0 +1,177 @@
+# graph/pipeline.py
+"""Découpage du build Valhalla en étapes à empreinte (skip-if-unchanged).
+
+Chaque étape de `build_graph.sh <graph> <étape>` reçoit une clé = hash de ses
+entrées (PBF OSM, ensemble des feeds GTFS, config mjolnir) et des clés des
+étapes dont elle dépend. Les clés de la dernière exécution réussie sont
+conservées dans `build/stages.json` : une étape dont la clé est inchangée et
+dont les sorties existent est réutilisée telle quelle.
+
+Ainsi un changement GTFS seul ne relance que `transit`, `graph` et `extract`,
+en repartant des tuiles OSM (`build/stages/osm_base`) et de `admin.sqlite`.
+"""
+
+import hashlib
+import json
+import os
+
+from .osm_sources import file_sha256
+
+
+# À incrémenter si le découpage/les commandes de build_graph.sh changent
+PIPELINE_VERSION = "1"
+
+# Étapes pilotées par run_valhalla_build, dans l'ordre d'exécution
+# ("config" est toujours rejouée en premier : rapide, et la config fait partie des empreintes)
+STAGES = ["timezones", "admins", "transit", "osm_tiles", "graph", "extract"]
+
+# Entrées de chaque étape : "valhalla" / "osm" / "gtfs" / "config" ou nom d'une étape précédente
+STAGE_INPUTS = {
+    "timezones": ["valhalla"],
+    "admins": ["valhalla", "osm", "config"],
+    "transit": ["valhalla", "gtfs", "config"],
+    "osm_tiles": ["valhalla", "osm", "config", "timezones", "admins"],
+    "graph": ["osm_tiles", "transit"],
+    "extract": ["graph"],
+}
+
+# Sorties attendues (relatives au dossier build/) : si absentes, l'étape est rejouée
+STAGE_OUTPUTS = {
+    "timezones": ["tiles/tz.sqlite"],
+    "admins": ["tiles/admin.sqlite"],
+    # transit_dir de valhalla.json (build_graph.sh) ; aucune sortie sans feed GTFS, voir stage_outputs
+    "transit": ["tiles/transit_tiles"],
+    "osm_tiles": ["stages/osm_base"],
+    "graph": ["tiles/valhalla"],
+    "extract": ["tiles/valhalla_tiles.tar"],
+}
+
+MANIFEST_NAME = "stages.json"
+
+
+def _sha256_text(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+def is_gtfs_feed(path: str) -> bool:
+    """Même critère que build_graph.sh : un dossier avec agency.txt ou stops.txt."""
+    return os.path.isdir(path) and (
+        os.path.isfile(os.path.join(path, "agency.txt")) or os.path.isfile(os.path.join(path, "stops.txt"))
+    )
+
+
+def gtfs_fingerprint(gtfs_dir: str) -> str:
+    """Hash du contenu de l'ensemble des feeds GTFS extraits (gtfs/<source_id>/*).
+
+    Les feeds sont ré-extraits à chaque build (mtime différents) : on hash donc le
+    contenu, pas les métadonnées. "none" si aucun feed valide.
+    """
+    if not os.path.isdir(gtfs_dir):
+        return "none"
+    h = hashlib.sha256()
+    feeds = 0
+    for name in sorted(os.listdir(gtfs_dir)):
+        feed_dir = os.path.join(gtfs_dir, name)
+        if not is_gtfs_feed(feed_dir):
+            continue
+        feeds += 1
+        for root, dirs, files in os.walk(feed_dir):
+            dirs.sort()
+            for fname in sorted(files):
+                path = os.path.join(root, fname)
+                h.update(os.path.relpath(path, gtfs_dir).encode() + b"\0")
+                with open(path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        h.update(chunk)
+                h.update(b"\0")
+    return h.hexdigest() if feeds else "none"
+
+
+def config_fingerprint(config_path: str, root: str | None = None) -> str:
+    """Hash de la section mjolnir de valhalla.json.
+
+    `concurrency` n'a pas d'effet sur le résultat, et les chemins transit sont déjà
+    couverts par l'empreinte GTFS : ajouter/retirer des feeds ne doit pas invalider
+    les tuiles OSM. Les chemins sous `root` (dossier de la release) sont rendus
+    relatifs pour que deux releases d'un même graph aient la même empreinte.
+    """
+    with open(config_path, "r", encoding="utf-8") as f:
+        mjolnir = dict(json.load(f).get("mjolnir") or {})
+    for key in ("concurrency", "transit_dir", "transit_feeds_dir"):
+        mjolnir.pop(key, None)
+    if root:
+        prefix = root.rstrip("/") + "/"
+        mjolnir = {
+            k: "<root>/" + v[len(prefix):] if isinstance(v, str) and v.startswith(prefix) else v
+            for k, v in mjolnir.items()
+        }
+    return _sha256_text(mjolnir)
+
+
+def osm_fingerprint(osm_dir: str) -> str:
+    """sha256 du PBF utilisé par build_graph.sh (premier *.pbf du dossier osm/)."""
+    pbfs = sorted(n for n in os.listdir(osm_dir) if n.endswith(".pbf")) if os.path.isdir(osm_dir) else []
+    if not pbfs:
+        raise FileNotFoundError(f"Aucun fichier .pbf dans {osm_dir}")
+    return file_sha256(os.path.join(osm_dir, pbfs[0]))
+
+
+def compute_stage_keys(inputs: dict) -> dict:
+    """Clés des étapes à partir des empreintes d'entrée {"valhalla", "osm", "gtfs", "config"}."""
+    keys = {}
+    for stage in STAGES:
+        deps = {name: inputs[name] if name in inputs else keys[name] for name in STAGE_INPUTS[stage]}
+        keys[stage] = _sha256_text({"stage": stage, "version": PIPELINE_VERSION, "inputs": deps})
+    return keys
+
+
+def graph_inputs(graph_dir: str, valhalla_version: str | None, release_dir: str | None = None) -> dict:
+    """Empreintes d'entrée d'un graph (à calculer après l'étape config).
+
+    Les entrées (osm/, gtfs/) sont dans le dossier du graph, la config dans la release.
+    """
+    out_dir = release_dir or graph_dir
+    return {
+        "valhalla": valhalla_version or "unknown",
+        "osm": osm_fingerprint(os.path.join(graph_dir, "osm")),
+        "gtfs": gtfs_fingerprint(os.path.join(graph_dir, "gtfs")),
+        "config": config_fingerprint(os.path.join(out_dir, "valhalla.json"), root=out_dir),
+    }
+
+
+def load_manifest(build_dir: str) -> dict:
+    try:
+        with open(os.path.join(build_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def save_manifest(build_dir: str, manifest: dict) -> None:
+    os.makedirs(build_dir, exist_ok=True)
+    path = os.path.join(build_dir, MANIFEST_NAME)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def stage_outputs(stage: str, inputs: dict | None = None) -> list:
+    """Sorties attendues d'une étape ; un build sans GTFS (empreinte "none") ne produit pas de tuiles transit."""
+    if stage == "transit" and inputs is not None and inputs.get("gtfs") == "none":
+        return []
+    return STAGE_OUTPUTS[stage]
+
+
+def _output_present(path: str) -> bool:
+    """Fichier présent, ou dossier non vide (build_graph.sh crée les dossiers avant de les remplir)."""
+    if os.path.isdir(path):
+        return bool(os.listdir(path))
+    return os.path.exists(path)
+
+
+def is_fresh(build_dir: str, manifest: dict, stage: str, key: str, inputs: dict | None = None) -> bool:
+    """True si l'étape a déjà été exécutée avec la même clé et que ses sorties existent."""
+    if manifest.get(stage) != key:
+        return False
+    return all(_output_present(os.path.join(build_dir, p)) for p in stage_outputs(stage, inputs))
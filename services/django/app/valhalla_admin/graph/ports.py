@@ -0,0 +1,114 @@
+# graph/ports.py
+"""Allocation des ports hôtes des containers Valhalla via la table PortReservation.
+
+- `reserve` : une requête pour lire les ports pris, puis INSERT protégé par la
+  contrainte d'unicité ; deux démarrages simultanés ne peuvent pas obtenir le
+  même port (le perdant réessaie sur le suivant). Plus d'inspection Docker.
+- `release` / `rename` : suivent la suppression et le renommage des containers.
+  Un port libéré reste en quarantaine VALHALLA_PORT_QUARANTINE_SECONDS : le proxy
+  peut encore le router (table de routage en cache, VALHALLA_PROXY_ROUTE_TTL) et
+  ne doit pas tomber sur le container d'un autre graph.
+- `reconcile` : aligne la table sur Docker (tâche beat), pour les containers
+  créés ou supprimés en dehors de l'application.
+"""
+
+import os
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import PortReservation
+
+
+VALHALLA_BASE_PORT = int(os.getenv("VALHALLA_BASE_PORT", "8002"))
+VALHALLA_MAX_PORT = int(os.getenv("VALHALLA_MAX_PORT", "8999"))
+# Une réservation sans container n'est libérée qu'après ce délai (container en cours de création)
+RESERVATION_GRACE_SECONDS = 300
+MAX_ATTEMPTS = 20
+# Délai avant réattribution d'un port libéré (≥ VALHALLA_PROXY_ROUTE_TTL du proxy)
+VALHALLA_PORT_QUARANTINE_SECONDS = int(os.getenv("VALHALLA_PORT_QUARANTINE_SECONDS", "60"))
+# Réservation d'un port en quarantaine : plus de container, nom propre au port
+QUARANTINE_PREFIX = "~released~"
+
+
+def first_free_port(used, base: int = VALHALLA_BASE_PORT, limit: int = VALHALLA_MAX_PORT) -> int | None:
+    port = base
+    while port in used:
+        port += 1
+    return port if port <= limit else None
+
+
+def reserve(container_name: str, graph_name: str = "") -> int:
+    """Port réservé au container (existant, sinon le premier libre)."""
+    cutoff = timezone.now() - timedelta(seconds=VALHALLA_PORT_QUARANTINE_SECONDS)
+    PortReservation.objects.filter(container_name__startswith=QUARANTINE_PREFIX, reserved_at__lt=cutoff).delete()
+    for _ in range(MAX_ATTEMPTS):
+        existing = PortReservation.objects.filter(container_name=container_name).values_list("port", flat=True).first()
+        if existing is not None:
+            return existing
+        port = first_free_port(set(PortReservation.objects.values_list("port", flat=True)))
+        if port is None:
+            raise RuntimeError(f"Aucun port libre entre {VALHALLA_BASE_PORT} et {VALHALLA_MAX_PORT}")
+        try:
+            with transaction.atomic():
+                PortReservation.objects.create(port=port, container_name=container_name, graph_name=graph_name)
+            return port
+        except IntegrityError:
+            # Port (ou nom) réservé entre-temps par un autre process : recommencer
+            continue
+    raise RuntimeError("Réservation de port impossible (trop de conflits)")
+
+
+def release(container_name: str) -> None:
+    """Le port du container supprimé passe en quarantaine (voir VALHALLA_PORT_QUARANTINE_SECONDS)."""
+    with transaction.atomic():
+        for reservation in PortReservation.objects.select_for_update().filter(container_name=container_name):
+            reservation.container_name = f"{QUARANTINE_PREFIX}{reservation.port}"
+            reservation.reserved_at = timezone.now()
+            reservation.save(update_fields=["container_name", "reserved_at"])
+
+
+def rename(old_name: str, new_name: str) -> None:
+    """Le port suit le container renommé (basculement blue/green)."""
+    with transaction.atomic():
+        PortReservation.objects.filter(container_name=new_name).exclude(container_name=old_name).delete()
+        PortReservation.objects.filter(container_name=old_name).update(container_name=new_name)
+
+
+def reconcile(containers: dict) -> dict:
+    """Aligne la table sur l'état Docker.
+
+    `containers` : {nom: (port hôte ou None, graph)} de tous les containers gérés.
+    Retourne le nombre de réservations ajoutées / corrigées / libérées.
+    """
+    added = fixed = 0
+    with transaction.atomic():
+        reservations = {r.container_name: r for r in PortReservation.objects.select_for_update()}
+        by_port = {r.port: r for r in reservations.values()}
+        for name, (port, graph_name) in containers.items():
+            if port is None:
+                continue
+            current = reservations.get(name)
+            if current is not None and current.port == port:
+                continue
+            # Le port réel fait foi : supprimer les réservations en conflit puis enregistrer
+            for stale in {current, by_port.get(port)} - {None}:
+                stale.delete()
+                reservations.pop(stale.container_name, None)
+                by_port.pop(stale.port, None)
+            reservation = PortReservation.objects.create(port=port, container_name=name, graph_name=graph_name)
+            reservations[name] = by_port[port] = reservation
+            if current is None:
+                added += 1
+            else:
+                fixed += 1
+
+        cutoff = timezone.now() - timedelta(seconds=RESERVATION_GRACE_SECONDS)
+        released, _ = (
+            PortReservation.objects
+            .exclude(container_name__in=list(containers))
+            .filter(reserved_at__lt=cutoff)
+            .delete()
+        )
+    return {"added": added, "fixed": fixed, "released": released}
@@ -0,0 +1,73 @@
+# graph/profiles.py
+"""Profil de service d'un graph : ressources des containers Valhalla.
+
+Stocké sur BuildTask.serve_profile (seules les clés modifiées), complété par
+les valeurs par défaut :
+- threads         : workers de `valhalla_service` (2e argument)
+- cpuset          : CPUs autorisés (`--cpuset-cpus`, ex. "0-15")
+- mem_limit       : limite mémoire (`--memory`, ex. "8g")
+- shm_size        : taille de /dev/shm (`--shm-size`, ex. "1g")
+- max_cache_size  : cache de tuiles en octets (`mjolnir.max_cache_size`)
+"""
+
+import hashlib
+import json
+import os
+import re
+
+
+DEFAULT_PROFILE = {
+    "threads": int(os.getenv("VALHALLA_SERVICE_THREADS", "1")),
+    "cpuset": os.getenv("VALHALLA_SERVICE_CPUSET") or None,
+    "mem_limit": os.getenv("VALHALLA_SERVICE_MEM_LIMIT") or None,
+    "shm_size": os.getenv("VALHALLA_SERVICE_SHM_SIZE") or None,
+    "max_cache_size": int(os.getenv("VALHALLA_SERVICE_MAX_CACHE_SIZE")) if os.getenv("VALHALLA_SERVICE_MAX_CACHE_SIZE") else None,
+}
+
+MAX_THREADS = 256
+_SIZE_RE = re.compile(r"^\d+[bkmg]?$", re.IGNORECASE)
+_CPUSET_RE = re.compile(r"^\d+(-\d+)?(,\d+(-\d+)?)*$")
+
+
+def effective_profile(profile: dict | None) -> dict:
+    """Profil complet : valeurs par défaut surchargées par celles du graph."""
+    merged = dict(DEFAULT_PROFILE)
+    merged.update({k: v for k, v in (profile or {}).items() if k in DEFAULT_PROFILE})
+    return merged
+
+
+def validate_profile(data) -> tuple[dict, str | None]:
+    """Valide un profil saisi ; retourne (profil nettoyé, message d'erreur ou None).
+
+    Une valeur null ou vide revient à la valeur par défaut.
+    """
+    if not isinstance(data, dict):
+        return {}, "Le profil doit être un objet JSON"
+    unknown = set(data) - set(DEFAULT_PROFILE)
+    if unknown:
+        return {}, f"Clés inconnues: {', '.join(sorted(unknown))}"
+
+    profile = {}
+    for key, value in data.items():
+        if value is None or value == "":
+            continue
+        if key == "threads":
+            if not isinstance(value, int) or isinstance(value, bool) or not 1 <= value <= MAX_THREADS:
+                return {}, f"threads doit être un entier entre 1 et {MAX_THREADS}"
+        elif key == "max_cache_size":
+            if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+                return {}, "max_cache_size doit être un entier positif (octets)"
+        elif key == "cpuset":
+            if not isinstance(value, str) or not _CPUSET_RE.match(value):
+                return {}, "cpuset doit être une liste de CPUs (ex: 0-15 ou 0,2,4)"
+        elif key in ("mem_limit", "shm_size"):
+            if not isinstance(value, str) or not _SIZE_RE.match(value):
+                return {}, f"{key} doit être une taille (ex: 512m, 8g)"
+        profile[key] = value
+    return profile, None
+
+
+def profile_fingerprint(profile: dict) -> str:
+    """Empreinte courte du profil effectif (label `valhalla.profile` des containers)."""
+    material = json.dumps(effective_profile(profile), sort_keys=True)
+    return hashlib.sha256(material.encode()).hexdigest()[:12]
@@ -0,0 +1,100 @@
+# graph/releases.py
+"""Versions (releases) des tuiles d'un graph, pour des reconstructions sans coupure.
+
+Chaque build produit `<graph>/releases/<build_id>/` (build/ + valhalla.json +
+valhalla_serve.json) à côté de la version servie. `<graph>/current` est un
+symlink relatif vers la release en service, remplacé atomiquement après le
+basculement du conteneur.
+
+Une nouvelle release est initialisée par hardlinks depuis la release courante
+(ou l'ancien `<graph>/build`) : les étapes inchangées du pipeline sont ainsi
+réutilisées sans copie. C'est sûr car chaque étape de build_graph.sh remplace
+ses sorties (rm/mv) au lieu de les réécrire en place.
+"""
+
+import os
+import shutil
+
+
+RELEASES_DIRNAME = "releases"
+CURRENT_LINK = "current"
+# Nombre de releases conservées en plus de la release courante (retour arrière rapide)
+VALHALLA_KEEP_RELEASES = int(os.getenv("VALHALLA_KEEP_RELEASES", "1"))
+
+
+def release_dir(graph_dir: str, build_id) -> str:
+    return os.path.join(graph_dir, RELEASES_DIRNAME, str(build_id))
+
+
+def current_release(graph_dir: str) -> str | None:
+    """Chemin absolu de la release servie (cible de `current`), None si aucune."""
+    link = os.path.join(graph_dir, CURRENT_LINK)
+    if not os.path.islink(link):
+        return None
+    target = os.path.realpath(link)
+    return target if os.path.isdir(target) else None
+
+
+def seed_release(graph_dir: str, dest_release: str) -> str | None:
+    """Initialise `<release>/build` par hardlinks depuis la release courante (ou l'ancien build/).
+
+    Retourne le dossier source utilisé, None si rien à réutiliser ou si la release existe déjà.
+    """
+    dest_build = os.path.join(dest_release, "build")
+    if os.path.exists(dest_build):
+        return None
+    current = current_release(graph_dir)
+    candidates = [os.path.join(current, "build")] if current else []
+    candidates.append(os.path.join(graph_dir, "build"))  # graphs construits avant les releases
+    for src in candidates:
+        if os.path.realpath(src) == os.path.realpath(dest_build) or not os.path.isdir(src):
+            continue
+        os.makedirs(dest_release, exist_ok=True)
+        tmp = f"{dest_build}.seeding"
+        shutil.rmtree(tmp, ignore_errors=True)
+        try:
+            shutil.copytree(src, tmp, symlinks=True, copy_function=os.link)
+        except (OSError, shutil.Error):
+            shutil.rmtree(tmp, ignore_errors=True)
+            return None
+        os.replace(tmp, dest_build)
+        return src
+    return None
+
+
+def set_current(graph_dir: str, target_release: str) -> None:
+    """Fait pointer `<graph>/current` vers `target_release` (remplacement atomique du symlink)."""
+    link = os.path.join(graph_dir, CURRENT_LINK)
+    tmp = f"{link}.tmp"
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    os.symlink(os.path.relpath(target_release, graph_dir), tmp)
+    os.replace(tmp, link)
+
+
+def prune_releases(graph_dir: str, keep: int = VALHALLA_KEEP_RELEASES, protect: set | None = None) -> list[str]:
+    """Supprime les releases les plus anciennes, en gardant la courante + `keep` autres.
+
+    `protect` : releases à ne jamais supprimer (ex: build en cours).
+    """
+    root = os.path.join(graph_dir, RELEASES_DIRNAME)
+    if not os.path.isdir(root):
+        return []
+    current = current_release(graph_dir)
+    protected = {os.path.realpath(p) for p in (protect or set())}
+    if current:
+        protected.add(current)
+
+    def order(name):
+        return (0, int(name), name) if name.isdigit() else (1, 0, name)
+
+    others = [
+        os.path.join(root, name)
+        for name in sorted(os.listdir(root), key=order, reverse=True)
+        if os.path.isdir(os.path.join(root, name)) and os.path.realpath(os.path.join(root, name)) not in protected
+    ]
+    removed = []
+    for path in others[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append(path)
+    return removed
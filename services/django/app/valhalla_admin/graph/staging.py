@@ -0,0 +1,86 @@
+# graph/staging.py
+"""Mise en place des fichiers sources dans le dossier d'un graph sans copie inutile.
+
+Ordre d'essai : hardlink → reflink (ioctl FICLONE, btrfs/xfs) → symlink (optionnel)
+→ copie. Les hardlinks/reflinks exigent que source et destination soient sur le même
+montage : le worker monte donc `../data` en un seul volume `/data`.
+
+Le symlink n'est utilisé que si `allow_symlink=True` et VALHALLA_STAGE_SYMLINK=1 :
+le fichier doit alors être lisible au même chemin par le conteneur de build, et une
+mise à jour de la source (diffs OSM) devient visible par un build en cours.
+"""
+
+import errno
+import fcntl
+import os
+import shutil
+
+
+FICLONE = 0x40049409  # _IOW(0x94, 9, int)
+
+VALHALLA_STAGE_SYMLINK = os.getenv("VALHALLA_STAGE_SYMLINK", "0") in ("1", "true", "True")
+
+MODE_EXISTING = "existing"
+MODE_HARDLINK = "hardlink"
+MODE_REFLINK = "reflink"
+MODE_SYMLINK = "symlink"
+MODE_COPY = "copy"
+
+
+def is_current(src: str, dest: str) -> bool:
+    """True si `dest` reflète déjà `src` (même inode, symlink vers src, ou copie identique)."""
+    if not os.path.lexists(dest):
+        return False
+    try:
+        if os.path.islink(dest):
+            return os.path.realpath(dest) == os.path.realpath(src)
+        if os.path.samefile(src, dest):
+            return True
+        s, d = os.stat(src), os.stat(dest)
+        return s.st_size == d.st_size and s.st_mtime_ns == d.st_mtime_ns
+    except OSError:
+        return False
+
+
+def _reflink(src: str, dest: str) -> None:
+    with open(src, "rb") as fs, open(dest, "wb") as fd:
+        fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+    shutil.copystat(src, dest)
+
+
+def stage_file(src: str, dest: str, allow_symlink: bool = False) -> str:
+    """Place `src` en `dest` (remplacement atomique) ; retourne le mode utilisé."""
+    if is_current(src, dest):
+        return MODE_EXISTING
+
+    os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+    tmp = f"{dest}.staging"
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+
+    mode = None
+    try:
+        os.link(src, tmp)
+        mode = MODE_HARDLINK
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EACCES):
+            raise
+
+    if mode is None:
+        try:
+            _reflink(src, tmp)
+            mode = MODE_REFLINK
+        except OSError:
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+
+    if mode is None and allow_symlink and VALHALLA_STAGE_SYMLINK:
+        os.symlink(os.path.abspath(src), tmp)
+        mode = MODE_SYMLINK
+
+    if mode is None:
+        shutil.copy2(src, tmp)
+        mode = MODE_COPY
+
+    os.replace(tmp, dest)
+    return mode
@@ -4,19 +4,34 @@ import json
 import zipfile
 import shutil
 import subprocess
-import requests
-import time
 import csv
-from datetime import datetime
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
 
 from celery import shared_task
-from django.db import DatabaseError
+from django.db import DatabaseError, transaction
 from django.utils import timezone
 
-from .models import BuildTask
+from .models import BuildTask, ContainerMetricSample
 from valhalla_admin.gtfs.models import GtfsSource
 from valhalla_admin.gtfs.utils import ensure_calendar_augmented
 from .utils import OSM_CATALOG_FR
+from .downloads import download_segmented
+from .osm_sources import init_state, update_osm_file, merge_cached
+from .staging import stage_file
+from .pipeline import STAGES, graph_inputs, compute_stage_keys, load_manifest, save_manifest, is_fresh
+from .artifacts import restore_artifact, publish_artifact
+from .releases import release_dir, seed_release, set_current, prune_releases
+from .profiles import effective_profile
+from .logarchive import ArchiveWriter, archive_dir, prune_archives, VALHALLA_LOG_ARCHIVE_KEEP
+from .metrics import (
+    VALHALLA_METRICS_RETENTION_HOURS, VALHALLA_METRICS_WORKERS, ring_slot, sample_from_stats, container_fields,
+)
+from .gtfs_cache import fetch_gtfs, STATE_NOT_MODIFIED, STATE_UNCHANGED, STATE_STALE
 
 
 # ─────────────────────────
@@ -28,6 +43,23 @@ GRAPH_ROOT = "/data/graphs"          # /data/graphs/<graph_name>
 # Nom du container dans lequel exécuter `build_graph.sh` (configurable)
 VALHALLA_BUILD_CONTAINER = os.getenv("VALHALLA_BUILD_CONTAINER", os.getenv("VALHALLA_CONTAINER", "valhallaDjango"))
 OSM_SOURCE_DIR = "/data/sources/osm"
+# Nombre de plages HTTP parallèles pour les gros PBF
+OSM_DOWNLOAD_SEGMENTS = int(os.getenv("OSM_DOWNLOAD_SEGMENTS", "4"))
+# Appliquer les diffs Geofabrik aux PBF déjà présents avant chaque build. Désactivé par
+# défaut : le PBF changerait à presque chaque build (étapes osm_tiles/admins et cache de
+# fusion invalidés) ; les diffs sont appliqués chaque nuit par refresh_osm_sources.
+OSM_AUTO_UPDATE = os.getenv("OSM_AUTO_UPDATE", "0") not in ("0", "false", "False")
+
+# Basculement blue/green : délai max du health check du candidat, drain de l'ancien container
+VALHALLA_SWAP_HEALTH_TIMEOUT = int(os.getenv("VALHALLA_SWAP_HEALTH_TIMEOUT", "600"))
+VALHALLA_SWAP_DRAIN_SECONDS = int(os.getenv("VALHALLA_SWAP_DRAIN_SECONDS", "5"))
+
+# Délai max (s) avant d'écrire en DB (et de diffuser) les lignes bufferisées d'un build
+LOG_FLUSH_SECONDS = float(os.getenv("VALHALLA_LOG_FLUSH_SECONDS", "1"))
+
+# Téléchargement/extraction GTFS parallèles (pool borné + limite par hôte)
+GTFS_FETCH_WORKERS = int(os.getenv("GTFS_FETCH_WORKERS", "4"))
+GTFS_FETCH_PER_HOST = int(os.getenv("GTFS_FETCH_PER_HOST", "2"))
 
 
 # ─────────────────────────
@@ -65,9 +97,13 @@ def start_valhalla_build(self, task_id):
         os.makedirs(graph_dir, exist_ok=True)
         task.output_dir = graph_dir
         task.add_log(f"📁 Graph dir : {graph_dir}")
+        # Les tuiles sont construites dans une release dédiée, à côté de celle en service
+        task.release_dir = release_dir(graph_dir, task.id)
+        os.makedirs(task.release_dir, exist_ok=True)
+        task.add_log(f"📁 Release : {task.release_dir}")
 
         # ─────────────────────────
-        # OSM → COPIE dans <graph>/osm/
+        # OSM → STAGING dans <graph>/osm/ (hardlink/reflink, copie en dernier recours)
         # ─────────────────────────
         osm_source = get_osm_file(task)
 
@@ -75,16 +111,23 @@ def start_valhalla_build(self, task_id):
         os.makedirs(osm_dir, exist_ok=True)
 
         osm_dest = os.path.join(osm_dir, os.path.basename(osm_source))
-        if not os.path.exists(osm_dest):
-            shutil.copy(osm_source, osm_dest)
+        # build_graph.sh prend le premier *.pbf : retirer ceux d'une sélection précédente
+        for name in os.listdir(osm_dir):
+            path = os.path.join(osm_dir, name)
+            if path not in (osm_dest, f"{osm_dest}.sha256.json") and (os.path.isfile(path) or os.path.islink(path)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        stage_mode = stage_file(osm_source, osm_dest, allow_symlink=True)
 
-        task.add_log(f"🗺 OSM prêt : {osm_dest}")
+        task.add_log(f"🗺 OSM prêt : {osm_dest} ({stage_mode})")
 
         # ─────────────────────────
         # GTFS → upload local + download + unzip
         # ─────────────────────────
         gtfs_dir = os.path.join(graph_dir, "gtfs")
-        # Nettoyer pour forcer re-téléchargement à chaque build planifié/recréé
+        # Nettoyer les extractions précédentes (les archives restent dans le cache partagé)
         try:
             if os.path.isdir(gtfs_dir):
                 shutil.rmtree(gtfs_dir, ignore_errors=True)
@@ -125,46 +168,40 @@ def start_valhalla_build(self, task_id):
             except Exception as e:
                 task.add_log(f"⚠️ Extraction zip uploadé échouée ({fname}): {e}")
 
-        # 2) Télécharger et extraire les GTFS référencés en base
-        for gtfs_id in task.gtfs_ids:
-            g = GtfsSource.objects.get(id=gtfs_id)
-
-            zip_path = os.path.join(gtfs_dir, f"{g.source_id}.zip")
-            extract_dir = os.path.join(gtfs_dir, g.source_id)
-
-            task.add_log(f"⬇️ Téléchargement GTFS : {g.name}")
-            r = _fetch_with_retry(g.url, timeout=300)
-            r.raise_for_status()
-
-            with open(zip_path, "wb") as f:
-                f.write(r.content)
-
-            os.makedirs(extract_dir, exist_ok=True)
-            with zipfile.ZipFile(zip_path, "r") as z:
-                z.extractall(extract_dir)
-
-            os.remove(zip_path)
-            task.add_log(f"📦 GTFS extrait : {g.source_id}")
-
-            # ─────────────────────────
-            # Synthétiser calendar.txt si absent, depuis calendar_dates.txt
-            # ─────────────────────────
-            try:
-                # Infos rapides sur la présence des fichiers GTFS clés
-                cal_exists = os.path.exists(os.path.join(extract_dir, "calendar.txt"))
-                cal_dates_exists = os.path.exists(os.path.join(extract_dir, "calendar_dates.txt"))
-                try:
-                    file_count = len(os.listdir(extract_dir))
-                except Exception:
-                    file_count = -1
-                task.add_log(
-                    f"📂 {g.source_id}: fichiers={file_count}, calendar.txt={'oui' if cal_exists else 'non'}, calendar_dates.txt={'oui' if cal_dates_exists else 'non'}"
-                )
-
-                summary = ensure_calendar_augmented(extract_dir)
-                task.add_log(summary)
-            except Exception as e:
-                task.add_log(f"⚠️ Échec synthèse calendar.txt ({g.source_id}): {e}")
+        # 2) Télécharger et extraire les GTFS référencés en base (en parallèle)
+        sources = [GtfsSource.objects.get(id=gtfs_id) for gtfs_id in task.gtfs_ids]
+        if sources:
+            workers = max(1, min(GTFS_FETCH_WORKERS, len(sources)))
+            task.add_log(
+                f"⬇️ Téléchargement de {len(sources)} GTFS ({workers} en parallèle, {GTFS_FETCH_PER_HOST} max par hôte)"
+            )
+            host_limits = {}
+            for g in sources:
+                host = urlparse(g.url).netloc
+                host_limits.setdefault(host, threading.BoundedSemaphore(GTFS_FETCH_PER_HOST))
+
+            failures = []
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gtfs-fetch") as pool:
+                futures = {
+                    pool.submit(
+                        _prepare_gtfs_feed,
+                        g.source_id, g.name, g.url, gtfs_dir,
+                        host_limits[urlparse(g.url).netloc],
+                    ): g
+                    for g in sources
+                }
+                # Les logs sont écrits depuis le thread principal, au fil des résultats
+                for fut in as_completed(futures):
+                    g = futures[fut]
+                    try:
+                        for message in fut.result():
+                            task.add_log(message)
+                    except Exception as e:
+                        failures.append(g.source_id)
+                        task.add_log(f"❌ GTFS {g.source_id} ({g.name}) : {e}")
+
+            if failures:
+                raise RuntimeError(f"Échec de préparation GTFS : {', '.join(failures)}")
 
         # Compter uniquement les sous-dossiers (feeds extraits)
         try:
@@ -191,14 +228,15 @@ def start_valhalla_build(self, task_id):
         with open(template_path, "r") as f:
             valhalla_json = json.load(f)
         
-        # Ajuster les chemins dynamiques spécifiques au graph
-        valhalla_json["mjolnir"]["tile_dir"] = os.path.join(graph_dir, "build/tiles/valhalla")
-        valhalla_json["mjolnir"]["tile_extract"] = os.path.join(graph_dir, "build/tiles/valhalla_tiles.tar")
-        valhalla_json["mjolnir"]["timezone"] = os.path.join(graph_dir, "build/tiles/tz.sqlite")
-        valhalla_json["mjolnir"]["transit_dir"] = os.path.join(graph_dir, "build/tiles/transit_tiles")
-        valhalla_json["mjolnir"]["transit_feeds_dir"] = os.path.join(graph_dir, "build/tiles/transit-feeds")
-
-        with open(os.path.join(graph_dir, "valhalla.json"), "w") as f:
+        # Ajuster les chemins dynamiques spécifiques à la release
+        out_dir = task.serve_dir
+        valhalla_json["mjolnir"]["tile_dir"] = os.path.join(out_dir, "build/tiles/valhalla")
+        valhalla_json["mjolnir"]["tile_extract"] = os.path.join(out_dir, "build/tiles/valhalla_tiles.tar")
+        valhalla_json["mjolnir"]["timezone"] = os.path.join(out_dir, "build/tiles/tz.sqlite")
+        valhalla_json["mjolnir"]["transit_dir"] = os.path.join(out_dir, "build/tiles/transit_tiles")
+        valhalla_json["mjolnir"]["transit_feeds_dir"] = os.path.join(out_dir, "build/tiles/transit-feeds")
+
+        with open(os.path.join(out_dir, "valhalla.json"), "w") as f:
             json.dump(valhalla_json, f, indent=2)
 
         task.add_log("⚙️ valhalla.json généré")
@@ -231,60 +269,52 @@ def run_valhalla_build(self, task_id):
         task.add_log("🚧 Lancement build Valhalla")
         _safe_save(task)
 
-        cmd = [
-            "docker", "exec",
-            VALHALLA_BUILD_CONTAINER,
-            "build_graph.sh",
-            task.output_dir   # CHEMIN COMPLET
-        ]
-
-        task.add_log("🐳 Commande : " + " ".join(cmd))
-
-        # Streaming en temps réel avec capture stderr séparée
-        build_log_path = os.path.join(task.output_dir, "build.log")
-        os.makedirs(task.output_dir, exist_ok=True)
-
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1
-        )
-
-        # Buffer pour logs (sauvegarder toutes les 25 lignes)
-        log_buffer = []
-        flush_threshold = 25
-
-        # Lire et logger ligne par ligne (stdout)
-        # Écrire les logs complets dans un fichier, et ne pousser que des aperçus en DB
-        with open(build_log_path, "a", encoding="utf-8", errors="ignore") as lf:
-            for line in process.stdout:
-                line = line.rstrip()
-                if not line:
+        # Étapes à empreinte : seules celles dont les entrées ont changé sont rejouées
+        # Sortie complète archivée en segments gzip indexés (<graph>/logs/<task_id>/)
+        log_archive = archive_dir(task.output_dir, task.id)
+        prune_archives(task.output_dir, keep=VALHALLA_LOG_ARCHIVE_KEEP - 1)
+        build_dir = os.path.join(task.serve_dir, "build")
+        os.makedirs(task.serve_dir, exist_ok=True)
+
+        # Nouvelle release initialisée par hardlinks depuis celle en service : étapes inchangées réutilisées
+        if task.release_dir:
+            seeded = seed_release(task.output_dir, task.release_dir)
+            if seeded:
+                task.add_log(f"🔗 Release initialisée depuis {seeded}")
+
+        with ArchiveWriter(log_archive) as lf:
+            # La config est toujours régénérée (rapide) : elle entre dans les empreintes
+            _run_build_stage(task, "config", lf)
+
+            valhalla_version = _valhalla_version()
+            task.add_log(f"🏷 Version Valhalla : {valhalla_version or 'inconnue (cache d’artefacts désactivé)'}")
+            inputs = graph_inputs(task.output_dir, valhalla_version, task.release_dir)
+            keys = compute_stage_keys(inputs)
+            manifest = load_manifest(build_dir)
+            rebuilt = False
+            for stage in STAGES:
+                key = keys[stage]
+                # Une étape amont rejouée invalide déjà les clés aval (dépendances)
+                if is_fresh(build_dir, manifest, stage, key, inputs):
+                    task.add_log(f"⏭ Étape {stage} inchangée ({key[:12]}) — réutilisée")
                     continue
-                # Fichier complet
-                try:
-                    lf.write(line + "\n")
-                except Exception:
-                    pass
-                # Aperçu DB
-                log_buffer.append(f"[{timezone.now()}] 📟 {line}")
-                if len(log_buffer) >= flush_threshold:
-                    _flush_logs_buffer(task, log_buffer)
-                    log_buffer = []
-
-        # Sauvegarder les logs restants
-        if log_buffer:
-            _flush_logs_buffer(task, log_buffer)
-
-        process.wait()
-        # Pas de thread stderr: fusionné dans stdout
+                # Retirer la clé avant exécution : un échec ne laisse pas d'étape "à jour" périmée
+                manifest.pop(stage, None)
+                save_manifest(build_dir, manifest)
+                # tz.sqlite / admin.sqlite : artefacts partagés entre graphs (/data/sources/artifacts)
+                restored = restore_artifact(stage, inputs, build_dir)
+                if restored:
+                    task.add_log(f"📦 Étape {stage} : artefact partagé réutilisé ({restored})")
+                else:
+                    _run_build_stage(task, stage, lf)
+                    if publish_artifact(stage, inputs, build_dir):
+                        task.add_log(f"📦 Étape {stage} : artefact publié dans le cache partagé")
+                manifest[stage] = key
+                save_manifest(build_dir, manifest)
+                rebuilt = True
 
-        if process.returncode != 0:
-            raise RuntimeError(
-                f"build_graph.sh exited with code {process.returncode}"
-            )
+        if not rebuilt:
+            task.add_log("♻️ Aucune entrée modifiée depuis le dernier build : tuiles réutilisées")
 
         task.status = "built"
         task.is_ready = True
@@ -306,21 +336,114 @@ def run_valhalla_build(self, task_id):
             pass
 
 
+def _valhalla_version() -> str | None:
+    """Version des outils Valhalla du conteneur de build (None si indéterminable)."""
+    try:
+        out = subprocess.run(
+            ["docker", "exec", VALHALLA_BUILD_CONTAINER, "valhalla_build_tiles", "--version"],
+            capture_output=True, text=True, timeout=60,
+        )
+    except Exception:
+        return None
+    words = (out.stdout or "").strip().split()
+    if out.returncode != 0 or not words:
+        return None
+    return words[-1]
+
+
+def _run_build_stage(task: BuildTask, stage: str, lf) -> None:
+    """Exécute `build_graph.sh <graph> <stage>` dans le conteneur de build en streamant la sortie."""
+    cmd = [
+        "docker", "exec",
+        VALHALLA_BUILD_CONTAINER,
+        "build_graph.sh",
+        task.output_dir,   # CHEMIN COMPLET
+        stage,
+        task.serve_dir,    # release de sortie
+    ]
+
+    task.add_log("🐳 Commande : " + " ".join(cmd))
+    _safe_save(task)
+
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1
+    )
+
+    # Buffer pour logs (INSERT groupé toutes les 25 lignes, ou après LOG_FLUSH_SECONDS)
+    log_buffer = []
+    flush_threshold = 25
+
+    # Lecture dans un thread : la boucle peut vider le buffer pendant un silence de build_graph.sh,
+    # pour que les lignes arrivent sans attendre la suivante (flux SSE, voir logstream.py)
+    lines = queue.Queue()
+
+    def read_stdout():
+        for raw in process.stdout:
+            lines.put(raw)
+        lines.put(None)
+
+    threading.Thread(target=read_stdout, daemon=True).start()
+
+    # Lire et logger ligne par ligne (stdout)
+    # Écrire les logs complets dans un fichier, et les lignes en DB
+    last_flush = time.monotonic()
+    while True:
+        try:
+            line = lines.get(timeout=LOG_FLUSH_SECONDS)
+        except queue.Empty:
+            line = ""
+        if line is None:
+            break
+        line = line.rstrip()
+        if line:
+            # Fichier complet
+            try:
+                lf.write(line + "\n")
+            except Exception:
+                pass
+            # Journal DB (lignes ajoutées, sans réécriture)
+            log_buffer.append((timezone.now(), f"📟 {line}"))
+        if len(log_buffer) >= flush_threshold or (log_buffer and time.monotonic() - last_flush >= LOG_FLUSH_SECONDS):
+            _flush_logs_buffer(task, log_buffer)
+            log_buffer = []
+            last_flush = time.monotonic()
+
+    # Sauvegarder les logs restants
+    if log_buffer:
+        _flush_logs_buffer(task, log_buffer)
+
+    process.wait()
+    # Pas de thread stderr: fusionné dans stdout
+
+    if process.returncode != 0:
+        raise RuntimeError(
+            f"build_graph.sh ({stage}) exited with code {process.returncode}"
+        )
+
+
 # ─────────────────────────
 # PHASE 3 — SERVING
 # ─────────────────────────
 
 @shared_task
-def ensure_valhalla_running(task_id):
-    """Démarre un container Valhalla pour le graph"""
-    from .docker_manager import ValhallaDockerManager
+def ensure_valhalla_running(task_id, reload=False):
+    """Démarre un container Valhalla pour le graph
+
+    reload=True : graph déjà servi dont la config ou le profil a changé ;
+    les containers sont remplacés par basculement blue/green.
+    """
+    from .docker_manager import get_manager
     import json
     
     task = BuildTask.objects.filter(id=task_id).first()
     if not task:
         return
 
-    if task.is_serving:
+    if task.is_serving and not reload:
         task.add_log("ℹ️ Container déjà actif")
         return
 
@@ -328,17 +451,18 @@ def ensure_valhalla_running(task_id):
     _safe_save(task)
     
     try:
-        # Préparer les chemins de config
-        valhalla_json_path = os.path.join(task.output_dir, "valhalla.json")
-        valhalla_serve_json_path = os.path.join(task.output_dir, "valhalla_serve.json")
+        # Préparer les chemins de config (dans la release servie)
+        serve_dir = task.serve_dir
+        valhalla_json_path = os.path.join(serve_dir, "valhalla.json")
+        valhalla_serve_json_path = os.path.join(serve_dir, "valhalla_serve.json")
 
         def replace_paths(obj):
             if isinstance(obj, dict):
                 return {k: replace_paths(v) for k, v in obj.items()}
             elif isinstance(obj, list):
                 return [replace_paths(item) for item in obj]
-            elif isinstance(obj, str) and task.output_dir in obj:
-                return obj.replace(task.output_dir, "/data/valhalla")
+            elif isinstance(obj, str) and serve_dir in obj:
+                return obj.replace(serve_dir, "/data/valhalla")
             return obj
 
         # Charger config de base (valhalla.json) si dispo, sinon patcher l'existante (valhalla_serve.json)
@@ -373,6 +497,12 @@ def ensure_valhalla_running(task_id):
         except Exception as e:
             task.add_log(f"⚠️ Injection CORS échouée: {e}")
 
+        # Cache de tuiles du profil de service
+        max_cache_size = effective_profile(task.serve_profile)["max_cache_size"]
+        if max_cache_size:
+            valhalla_config.setdefault("mjolnir", {})["max_cache_size"] = max_cache_size
+            task.add_log(f"🧠 mjolnir.max_cache_size = {max_cache_size}")
+
         try:
             with open(valhalla_serve_json_path, "w") as f:
                 json.dump(valhalla_config, f, indent=2)
@@ -381,22 +511,31 @@ def ensure_valhalla_running(task_id):
         
         task.add_log("⚙️ Configuration serving générée")
         
-        manager = ValhallaDockerManager()
-        
+        manager = get_manager()
+
+        # Une autre release du graph est en service (ou rechargement demandé) : basculement blue/green
+        # (candidat sur un nouveau port, health check, puis bascule) pour éviter toute coupure
+        current_status = manager.get_container_state(task.name)
+        if current_status.get("running") and (reload or current_status.get("build_id") != str(task.id)):
+            _swap_valhalla_container(task, manager)
+            return
+
         # Utiliser le chemin du worker (sera converti en chemin hôte par le manager)
-        # Démarrer le container
-        result = manager.start_container(
+        # Démarrer le(s) container(s)
+        result = manager.start_replicas(
             graph_name=task.name,
-            graph_path=task.output_dir  # Ex: /data/graphs/aura_2025
+            graph_path=serve_dir,  # Ex: /data/graphs/aura_2025/releases/42
+            replicas=task.serve_replicas,
+            build_id=task.id,
+            profile=task.serve_profile,
         )
         
         if result["status"] in ["started", "restarted", "already_running"]:
-            task.status = "serving"
-            task.is_serving = True
-            task.serve_port = result["port"]
+            _mark_serving(task, result["ports"])
             task.add_log(f"✅ {result['message']}")
             task.add_log(f"🌐 Endpoint: http://localhost:{result['port']}/route")
             _safe_save(task)
+            _publish_release(task)
         else:
             task.status = "error"
             task.add_log(f"❌ Erreur démarrage container: {result.get('message')}")
@@ -410,6 +549,108 @@ def ensure_valhalla_running(task_id):
         except Exception:
             pass
 
+
+def _swap_valhalla_container(task: BuildTask, manager) -> None:
+    """Démarre la release de `task` à côté de celle en service et bascule après health check."""
+    task.add_log("🔀 Containers déjà en service : démarrage d'un container candidat")
+    _safe_save(task)
+
+    result = manager.start_replicas(
+        graph_name=task.name,
+        graph_path=task.serve_dir,
+        replicas=task.serve_replicas,
+        build_id=task.id,
+        candidate=True,
+        profile=task.serve_profile,
+    )
+    if result["status"] != "started":
+        manager.remove_candidates(task.name)
+        task.status = "error"
+        task.add_log(f"❌ Erreur démarrage candidat: {result.get('message')} — l'ancienne release reste en service")
+        _safe_save(task)
+        return
+
+    task.add_log(f"🩺 Health check du candidat (ports {', '.join(map(str, result['ports']))})…")
+    _safe_save(task)
+    healthy = all(
+        manager.wait_until_healthy(
+            manager.get_replica_name(task.name, i, candidate=True), port, timeout=VALHALLA_SWAP_HEALTH_TIMEOUT
+        )
+        for i, port in enumerate(result["ports"])
+    )
+    if not healthy:
+        manager.remove_candidates(task.name)
+        task.status = "error"
+        task.add_log("❌ Health check échoué — candidat supprimé, l'ancienne release reste en service")
+        _safe_save(task)
+        return
+
+    # Routage (proxy) vers les nouveaux ports avant l'arrêt des anciens containers
+    previous = list(
+        BuildTask.objects.filter(name=task.name, is_serving=True).exclude(id=task.id).values_list("id", flat=True)
+    )
+    _mark_serving(task, result["ports"])
+    promoted = manager.promote_candidate(task.name, drain_seconds=VALHALLA_SWAP_DRAIN_SECONDS)
+    if promoted["status"] != "promoted":
+        manager.remove_candidates(task.name)
+        _restore_serving(task, previous)
+        task.add_log(f"❌ Bascule impossible : {promoted.get('message')}")
+        _safe_save(task)
+        return
+    task.add_log(f"✅ Nouvelle release en service sans interruption (port {result['port']})")
+    task.add_log(f"🌐 Endpoint: http://localhost:{result['port']}/route")
+    _safe_save(task)
+    _publish_release(task)
+
+
+def _mark_serving(task: BuildTask, ports: list) -> None:
+    """Bascule atomique : `task` devient la seule tâche servie pour ce graph."""
+    with transaction.atomic():
+        (
+            BuildTask.objects
+            .filter(name=task.name, is_serving=True)
+            .exclude(id=task.id)
+            .update(is_serving=False, status="built")
+        )
+        task.status = "serving"
+        task.is_serving = True
+        task.serve_port = ports[0] if ports else None
+        task.serve_ports = ports
+        task.save(update_fields=["status", "is_serving", "serve_port", "serve_ports"])
+
+
+def _restore_serving(task: BuildTask, previous_ids: list) -> None:
+    """Annule `_mark_serving` après un basculement avorté : les tâches précédentes redeviennent servies."""
+    with transaction.atomic():
+        BuildTask.objects.filter(id__in=previous_ids).update(is_serving=True, status="serving")
+        task.status = "error"
+        task.is_serving = False
+        task.serve_port = None
+        task.serve_ports = []
+        task.save(update_fields=["status", "is_serving", "serve_port", "serve_ports"])
+
+
+def _publish_release(task: BuildTask) -> None:
+    """Fait pointer `<graph>/current` vers la release servie et purge les anciennes."""
+    if not task.release_dir or not task.output_dir:
+        return
+    try:
+        set_current(task.output_dir, task.release_dir)
+        # Ne jamais supprimer la release d'un build en cours pour ce graph
+        in_progress = set(
+            BuildTask.objects
+            .filter(name=task.name, status__in=["pending", "preparing", "building"])
+            .exclude(release_dir__isnull=True)
+            .values_list("release_dir", flat=True)
+        )
+        removed = prune_releases(task.output_dir, protect=in_progress)
+        if removed:
+            task.add_log(f"🧹 Anciennes releases supprimées : {', '.join(os.path.basename(p) for p in removed)}")
+            _safe_save(task)
+    except Exception as e:
+        task.add_log(f"⚠️ Mise à jour de la release courante impossible: {e}")
+        _safe_save(task)
+
 # ─────────────────────────
 # Helpers
 # ─────────────────────────
@@ -434,7 +675,7 @@ def _safe_save(task: BuildTask, update_fields=None):
                 else:
                     # attempt best-effort full save
                     for f in [
-                        'status','logs','output_dir','is_ready','is_serving','serve_port'
+                        'status','logs','output_dir','release_dir','is_ready','is_serving','serve_port','serve_ports'
                     ]:
                         try:
                             setattr(fresh, f, getattr(task, f))
@@ -445,9 +686,11 @@ def _safe_save(task: BuildTask, update_fields=None):
                     task.status = fresh.status
                     task.logs = fresh.logs
                     task.output_dir = fresh.output_dir
+                    task.release_dir = fresh.release_dir
                     task.is_ready = fresh.is_ready
                     task.is_serving = fresh.is_serving
                     task.serve_port = fresh.serve_port
+                    task.serve_ports = fresh.serve_ports
         except Exception:
             pass
 
@@ -457,14 +700,14 @@ def _safe_save(task: BuildTask, update_fields=None):
 @shared_task
 def stop_valhalla_container(task_id):
     """Arrête le container Valhalla d'un graph"""
-    from .docker_manager import ValhallaDockerManager
+    from .docker_manager import get_manager
     
     task = BuildTask.objects.filter(id=task_id).first()
     if not task:
         return
     
     try:
-        manager = ValhallaDockerManager()
+        manager = get_manager()
         result = manager.stop_container(task.name)
         
         if result["status"] == "stopped":
@@ -480,6 +723,146 @@ def stop_valhalla_container(task_id):
         task.save()
 
 
+@shared_task
+def scale_valhalla_replicas(task_id):
+    """Aligne le nombre de containers d'un graph servi sur `serve_replicas`"""
+    from .docker_manager import get_manager
+
+    task = BuildTask.objects.filter(id=task_id).first()
+    if not task or not task.is_serving:
+        return
+
+    try:
+        manager = get_manager()
+        result = manager.start_replicas(
+            graph_name=task.name,
+            graph_path=task.serve_dir,
+            replicas=task.serve_replicas,
+            build_id=task.id,
+            profile=task.serve_profile,
+        )
+        if result["status"] in ["started", "restarted", "already_running"]:
+            _mark_serving(task, result["ports"])
+            task.add_log(f"⚖️ {task.serve_replicas} replica(s) en service (ports {', '.join(map(str, result['ports']))})")
+        else:
+            task.add_log(f"⚠️ Mise à l'échelle impossible: {result.get('message')}")
+    except Exception as e:
+        task.add_log(f"❌ Erreur mise à l'échelle: {str(e)}")
+
+
+@shared_task
+def collect_container_metrics():
+    """Échantillonne CPU/mémoire de tous les containers Valhalla gérés (tâche beat)"""
+    from .docker_manager import get_manager
+
+    manager = get_manager()
+    containers = manager.client.containers.list(
+        sparse=True, filters={"label": "valhalla.managed=true", "status": "running"}
+    )
+    if not containers:
+        return 0
+
+    def sample(container):
+        try:
+            return container, sample_from_stats(manager.client.api.stats(container.id, stream=False))
+        except Exception:
+            return container, None
+
+    now = timezone.now()
+    slot = ring_slot(now.timestamp())
+    rows = []
+    with ThreadPoolExecutor(max_workers=min(VALHALLA_METRICS_WORKERS, len(containers))) as pool:
+        for container, values in pool.map(sample, containers):
+            if values is None:
+                continue
+            fields = container_fields(container.attrs)
+            if not fields["container_name"]:
+                continue
+            rows.append(ContainerMetricSample(
+                **fields,
+                slot=slot,
+                sampled_at=now,
+                **values,
+            ))
+
+    # Emplacement du tampon circulaire réécrit en place (une seule requête)
+    ContainerMetricSample.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["container_name", "slot"],
+        update_fields=["graph_name", "replica", "sampled_at", "cpu_percent", "memory_mb", "memory_limit_mb", "cache_mb"],
+    )
+    # Containers supprimés : leurs emplacements expirent avec la rétention
+    ContainerMetricSample.objects.filter(
+        sampled_at__lt=now - timedelta(hours=VALHALLA_METRICS_RETENTION_HOURS)
+    ).delete()
+    return len(rows)
+
+
+@shared_task
+def reconcile_port_reservations():
+    """Aligne les réservations de ports sur les containers Valhalla réels (tâche beat)"""
+    from .docker_manager import get_manager
+    from . import ports
+
+    manager = get_manager()
+    return ports.reconcile(manager.port_inventory())
+
+
+# ─────────────────────────
+# GTFS HELPER
+# ─────────────────────────
+
+def _prepare_gtfs_feed(source_id: str, name: str, url: str, gtfs_dir: str, host_limit: threading.Semaphore) -> list[str]:
+    """Télécharge (via le cache), extrait et augmente un feed GTFS.
+
+    Exécuté dans un thread du pool : aucun accès DB ici, les messages sont
+    retournés pour être journalisés par l'appelant.
+    """
+    started = time.monotonic()
+    messages = [f"⬇️ Téléchargement GTFS : {name}"]
+    extract_dir = os.path.join(gtfs_dir, source_id)
+
+    with host_limit:
+        zip_path, cache_state = fetch_gtfs(source_id, url, timeout=300)
+    if cache_state == STATE_NOT_MODIFIED:
+        messages.append(f"♻️ GTFS inchangé (304), archive en cache : {source_id}")
+    elif cache_state == STATE_UNCHANGED:
+        messages.append(f"♻️ GTFS identique au cache (sha256) : {source_id}")
+    elif cache_state == STATE_STALE:
+        messages.append(f"⚠️ Source GTFS injoignable, archive en cache utilisée : {source_id}")
+    else:
+        messages.append(f"✅ GTFS téléchargé et mis en cache : {source_id}")
+
+    os.makedirs(extract_dir, exist_ok=True)
+    with zipfile.ZipFile(zip_path, "r") as z:
+        z.extractall(extract_dir)
+
+    messages.append(f"📦 GTFS extrait : {source_id}")
+
+    # ─────────────────────────
+    # Synthétiser calendar.txt si absent, depuis calendar_dates.txt
+    # ─────────────────────────
+    try:
+        # Infos rapides sur la présence des fichiers GTFS clés
+        cal_exists = os.path.exists(os.path.join(extract_dir, "calendar.txt"))
+        cal_dates_exists = os.path.exists(os.path.join(extract_dir, "calendar_dates.txt"))
+        try:
+            file_count = len(os.listdir(extract_dir))
+        except Exception:
+            file_count = -1
+        messages.append(
+            f"📂 {source_id}: fichiers={file_count}, calendar.txt={'oui' if cal_exists else 'non'}, calendar_dates.txt={'oui' if cal_dates_exists else 'non'}"
+        )
+
+        messages.append(ensure_calendar_augmented(extract_dir))
+    except Exception as e:
+        messages.append(f"⚠️ Échec synthèse calendar.txt ({source_id}): {e}")
+
+    messages.append(f"⏱ GTFS {source_id} prêt en {time.monotonic() - started:.1f}s")
+    return messages
+
+
 # ─────────────────────────
 # OSM HELPER
 # ─────────────────────────
@@ -488,8 +871,6 @@ def get_osm_file(task):
     """
     Garantit la présence du fichier OSM dans /data/sources/osm
     """
-    from urllib.parse import urlparse
-
     os.makedirs(OSM_SOURCE_DIR, exist_ok=True)
 
     # Supporte plusieurs fichiers OSM séparés par des virgules
@@ -506,77 +887,113 @@ def get_osm_file(task):
 
         local_path = os.path.join(OSM_SOURCE_DIR, osm_filename)
 
+        entry = next((e for e in OSM_CATALOG_FR if e["file"] == osm_filename), None)
+        download_url = entry["url"] if entry else osm_url
+
         if not os.path.exists(local_path):
-            entry = next((e for e in OSM_CATALOG_FR if e["file"] == osm_filename), None)
-            download_url = None
             if entry:
-                download_url = entry["url"]
                 task.add_log(f"⬇️ Téléchargement OSM (catalogue) : {download_url}")
             elif osm_url:
-                download_url = osm_url
                 task.add_log(f"⬇️ Téléchargement OSM (URL fournie) : {download_url}")
             else:
                 raise FileNotFoundError(f"OSM inconnu : {osm_filename}")
 
-            r = _fetch_with_retry(download_url, stream=True, timeout=900)
-            r.raise_for_status()
-            with open(local_path, "wb") as f:
-                for chunk in r.iter_content(1024 * 1024):
-                    f.write(chunk)
-            task.add_log(f"✅ OSM téléchargé : {osm_filename}")
+            _download_osm_file(task, osm_filename, download_url, local_path, if_missing=True)
         else:
             task.add_log(f"📦 OSM trouvé localement : {osm_filename}")
+            if OSM_AUTO_UPDATE:
+                _update_osm_file(task, osm_filename, download_url, local_path)
         local_paths.append(local_path)
 
     # Si un seul fichier, retour direct
     if len(local_paths) == 1:
         return local_paths[0]
 
-    # Fusionner plusieurs fichiers avec osmium-tool
-    merged_path = os.path.join(OSM_SOURCE_DIR, f"merged_{task.id}.osm.pbf")
-    import shutil
+    # Fusionner plusieurs fichiers avec osmium-tool (cache partagé par combinaison d'entrées)
     try:
-        osmium_path = shutil.which("osmium") or "/usr/bin/osmium"
-        task.add_log(f"🔀 Fusion de {len(local_paths)} fichiers OSM avec osmium-tool ({osmium_path})...")
-        cmd = [osmium_path, "merge"] + local_paths + ["-o", merged_path]
-        subprocess.run(cmd, check=True)
-        task.add_log(f"✅ Fusion OSM terminée : {merged_path}")
+        task.add_log(f"🔀 Fusion de {len(local_paths)} fichiers OSM avec osmium-tool...")
+        merged_path, hit = merge_cached(local_paths, os.path.join(OSM_SOURCE_DIR, "merged"))
+        if hit:
+            task.add_log(f"♻️ Fusion OSM réutilisée depuis le cache : {merged_path}")
+        else:
+            task.add_log(f"✅ Fusion OSM terminée : {merged_path}")
     except Exception as e:
         task.add_log(f"❌ Erreur fusion OSM : {e}")
         raise
     return merged_path
 
-# ─────────────────────────
-# Internal helpers (retry + log flush)
-# ─────────────────────────
 
-def _flush_logs_buffer(task: BuildTask, buffer: list[str]):
-    """Append buffered lines to task logs with safe save."""
+def _download_osm_file(task, osm_filename: str, download_url: str, local_path: str, if_missing: bool = False) -> None:
+    """Téléchargement complet d'un PBF (plages parallèles) + initialisation du suivi des diffs.
+
+    `if_missing` : le fichier absent au départ a pu être téléchargé par une autre tâche
+    pendant l'attente du verrou ; il est alors réutilisé tel quel.
+    """
+    result = download_segmented(
+        download_url,
+        local_path,
+        segments=OSM_DOWNLOAD_SEGMENTS,
+        timeout=900,
+        md5_url=f"{download_url}.md5",
+        if_missing=if_missing,
+    )
+    if result["mode"] == "existing":
+        task.add_log(f"📦 OSM téléchargé entre-temps par une autre tâche : {osm_filename}")
+        return
+    details = f"{result['segments']} segment(s), md5 {'vérifié' if result['md5'] == 'ok' else 'non publié'}"
+    if result["resumed_bytes"]:
+        details += f", reprise de {result['resumed_bytes'] // (1024 * 1024)} Mo"
+    task.add_log(f"✅ OSM téléchargé : {osm_filename} ({details})")
     try:
-        task.logs = (task.logs or "") + "\n" + "\n".join(buffer)
-        task.save(update_fields=['logs'])
-    except Exception:
-        try:
-            fresh = BuildTask.objects.filter(id=task.id).first()
-            if fresh:
-                fresh.logs = (fresh.logs or "") + "\n" + "\n".join(buffer)
-                fresh.save(update_fields=['logs'])
-                task.logs = fresh.logs
-        except Exception:
-            pass
+        state = init_state(local_path, download_url)
+        if state:
+            task.add_log(f"🔁 Suivi des diffs OSM : {osm_filename} (séquence {state.get('sequence')})")
+    except Exception as e:
+        task.add_log(f"⚠️ Suivi des diffs OSM indisponible ({osm_filename}) : {e}")
+
+
+def _update_osm_file(task, osm_filename: str, download_url: str | None, local_path: str) -> None:
+    """Applique les diffs de réplication au PBF local ; la version locale reste utilisée en cas d'échec."""
+    try:
+        result = update_osm_file(local_path, download_url)
+    except Exception as e:
+        task.add_log(f"⚠️ Mise à jour OSM impossible ({osm_filename}) : {e} — version locale utilisée")
+        return
+    if result["status"] == "updated":
+        task.add_log(
+            f"🔄 OSM mis à jour : {osm_filename} (séquence {result['from']} → {result['to']}, {result['applied']} diff(s))"
+        )
+    elif result["status"] == "up_to_date":
+        task.add_log(f"✅ OSM à jour : {osm_filename} (séquence {result['to']})")
+    elif result["status"] == "too_old":
+        if result["from"] is None:
+            task.add_log(f"⚠️ OSM sans séquence de réplication connue ({osm_filename}) : retéléchargement complet")
+        else:
+            task.add_log(
+                f"⚠️ OSM trop ancien pour les diffs ({result['to'] - result['from']} séquences) : retéléchargement complet"
+            )
+        _download_osm_file(task, osm_filename, download_url, local_path)
 
 
-def _fetch_with_retry(url: str, timeout: int = 300, stream: bool = False, max_retries: int = 3, backoff_seconds: int = 2):
-    """Simple HTTP GET with retry/backoff for transient network errors."""
-    last_exc = None
-    for attempt in range(1, max_retries + 1):
+@shared_task
+def refresh_osm_sources():
+    """Tâche planifiée : applique les diffs quotidiens aux PBF du catalogue présents localement."""
+    results = {}
+    for entry in OSM_CATALOG_FR:
+        local_path = os.path.join(OSM_SOURCE_DIR, entry["file"])
+        if not os.path.exists(local_path):
+            continue
         try:
-            r = requests.get(url, timeout=timeout, stream=stream)
-            r.raise_for_status()
-            return r
+            results[entry["file"]] = update_osm_file(local_path, entry["url"])["status"]
         except Exception as e:
-            last_exc = e
-            if attempt < max_retries:
-                time.sleep(backoff_seconds * attempt)
-            else:
-                raise
+            results[entry["file"]] = f"error: {e}"
+    return results
+
+# ─────────────────────────
+# Internal helpers (log flush)
+# ─────────────────────────
+
+def _flush_logs_buffer(task: BuildTask, buffer: list[tuple]):
+    """Insère les lignes bufferisées [(horodatage, texte)] en une requête."""
+    task.add_log_lines(buffer)
+
@@ -0,0 +1,32 @@
+import os
+import tempfile
+import shutil
+from valhalla_admin.graph import artifacts
+
+
+def test_admins_artifact_shared_between_graphs():
+    tmp = tempfile.mkdtemp()
+    try:
+        cache = os.path.join(tmp, "artifacts")
+        inputs = {"valhalla": "3.5.1", "osm": "abc", "config": "graph-a"}
+        build_a = os.path.join(tmp, "a", "build")
+        build_b = os.path.join(tmp, "b", "build")
+        os.makedirs(os.path.join(build_a, "tiles"))
+        with open(os.path.join(build_a, "tiles", "admin.sqlite"), "wb") as f:
+            f.write(b"admins")
+
+        assert artifacts.restore_artifact("admins", inputs, build_b, cache_dir=cache) is None
+        assert artifacts.publish_artifact("admins", inputs, build_a, cache_dir=cache)
+
+        # Config différente (chemins du graph) : l'artefact reste partagé
+        other = dict(inputs, config="graph-b")
+        assert artifacts.restore_artifact("admins", other, build_b, cache_dir=cache)
+        with open(os.path.join(build_b, "tiles", "admin.sqlite"), "rb") as f:
+            assert f.read() == b"admins"
+
+        # Autre PBF ou version inconnue : pas de partage
+        assert artifacts.restore_artifact("admins", dict(inputs, osm="def"), build_b, cache_dir=cache) is None
+        assert artifacts.artifact_path("admins", dict(inputs, valhalla="unknown"), cache) is None
+        assert artifacts.artifact_path("transit", inputs, cache) is None
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+
+from valhalla_admin.graph import container_state
+
+
+def _summary(name, graph, state="running", port=None, status="Up 2 hours (healthy)", build="7"):
+    return {
+        "Names": [f"/{name}"],
+        "State": state,
+        "Status": status,
+        "Ports": [{"PrivatePort": 8002, "PublicPort": port, "Type": "tcp"}] if port else [],
+        "Labels": {"valhalla.graph": graph, "valhalla.managed": "true", "valhalla.build": build},
+    }
+
+
+def test_states_from_summaries():
+    states = container_state.states_from_summaries([
+        _summary("valhalla-graph-fr", "fr", port=8003),
+        _summary("valhalla-graph-fr-r1", "fr", port=8004),
+        _summary("valhalla-graph-fr-r2", "fr", state="exited", status="Exited (137) 1 hour ago"),
+        _summary("valhalla-graph-fr-next", "fr", port=8005, build="8"),
+        _summary("valhalla-graph-fr-retired-1700000000", "fr", port=8006, build="6"),
+        _summary("valhalla-graph-aura", "aura", state="exited", status="Exited (0) 3 days ago"),
+    ])
+
+    fr = states["fr"]
+    assert fr["running"] and fr["port"] == 8003 and fr["ports"] == [8003, 8004]
+    assert fr["health"] == "healthy" and fr["build_id"] == "7" and fr["replicas"] == 3
+
+    aura = states["aura"]
+    assert not aura["running"] and aura["port"] is None and aura["health"] == "unknown"
+
+    stats = container_state.system_stats(states)
+    assert (stats["total_containers"], stats["running_containers"], stats["stopped_containers"]) == (2, 1, 1)
+
+
+def test_unhealthy_replica_not_routed():
+    states = container_state.states_from_summaries([
+        _summary("valhalla-graph-fr", "fr", port=8003),
+        _summary("valhalla-graph-fr-r1", "fr", port=8004, status="Up 5 minutes (unhealthy)"),
+    ])
+    assert states["fr"]["ports"] == [8003]
+
+
+def test_apply_state():
+    task = SimpleNamespace(
+        id=7, is_serving=False, is_ready=True, status="error",
+        serve_port=None, serve_ports=[], serve_health="",
+    )
+    state = {"running": True, "port": 8003, "ports": [8003, 8004], "health": "healthy", "build_id": "7"}
+    assert set(container_state.apply_state(task, state)) == {"is_serving", "status", "serve_port", "serve_ports", "serve_health"}
+    assert task.status == "serving" and task.serve_ports == [8003, 8004]
+    assert container_state.apply_state(task, state) == ()
+
+    # Container d'une autre release : la tâche n'est plus servie, son statut repasse à « built »
+    fields = container_state.apply_state(task, dict(state, build_id="8"))
+    assert set(fields) == {"is_serving", "status", "serve_health"} and task.status == "built"
+    task.status = "error"
+    task.is_serving = True
+    assert "status" in container_state.apply_state(task, {}) and task.status == "built"
+
+
+def test_apply_state_skips_builds_in_progress():
+    task = SimpleNamespace(
+        id=9, name="fr", is_serving=False, is_ready=False, status="building",
+        serve_port=None, serve_ports=[], serve_health="",
+    )
+    state = {"running": True, "port": 8003, "ports": [8003], "health": "healthy", "build_id": None}
+    assert container_state.apply_state(task, state, {}) == ()
+    assert task.status == "building" and not task.is_serving
+
+
+def test_unlabeled_container_served_by_latest_ready_task():
+    state = {"running": True, "port": 8003, "ports": [8003], "health": "healthy", "build_id": None}
+    owners = {"fr": 7}
+    tasks = [
+        SimpleNamespace(id=i, name="fr", is_serving=False, is_ready=True, status="built",
+                        serve_port=None, serve_ports=[], serve_health="")
+        for i in (5, 7)
+    ]
+    for task in tasks:
+        container_state.apply_state(task, state, owners)
+    assert [t.is_serving for t in tasks] == [False, True]
+    assert tasks[1].status == "serving" and tasks[0].status == "built"
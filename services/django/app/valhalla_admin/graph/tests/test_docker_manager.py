@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+from docker.errors import APIError
+
+from valhalla_admin.graph.docker_manager import ValhallaDockerManager
+
+
+class FakeContainer:
+    def __init__(self, name, fail_rename=False):
+        # Comme docker-py : `name` reste celui de la liste, rename() ne le met pas à jour
+        self.name = name
+        self.current = name
+        self.id = name
+        self.fail_rename = fail_rename
+
+    def rename(self, new_name):
+        if self.fail_rename:
+            raise APIError("Conflict")
+        self.current = new_name
+
+
+def _manager(containers):
+    manager = ValhallaDockerManager.__new__(ValhallaDockerManager)
+    manager.client = SimpleNamespace(containers=SimpleNamespace(list=lambda **kw: containers))
+    manager._release_port = lambda *a, **kw: None
+    return manager
+
+
+def test_promote_candidate_rolls_back_failed_rename():
+    olds = [FakeContainer("valhalla-graph-fr"), FakeContainer("valhalla-graph-fr-r1")]
+    candidates = [FakeContainer("valhalla-graph-fr-next"), FakeContainer("valhalla-graph-fr-r1-next", fail_rename=True)]
+    manager = _manager(olds + candidates)
+
+    result = manager.promote_candidate("fr", drain_seconds=0)
+    assert result["status"] == "error"
+    assert [c.current for c in olds] == ["valhalla-graph-fr", "valhalla-graph-fr-r1"]
+    assert [c.current for c in candidates] == ["valhalla-graph-fr-next", "valhalla-graph-fr-r1-next"]
+
+
+def test_promote_candidate_keeps_serving_when_old_rename_fails():
+    olds = [FakeContainer("valhalla-graph-fr"), FakeContainer("valhalla-graph-fr-r1", fail_rename=True)]
+    candidates = [FakeContainer("valhalla-graph-fr-next")]
+    manager = _manager(olds + candidates)
+
+    assert manager.promote_candidate("fr", drain_seconds=0)["status"] == "error"
+    assert olds[0].current == "valhalla-graph-fr"
+    assert candidates[0].current == "valhalla-graph-fr-next"
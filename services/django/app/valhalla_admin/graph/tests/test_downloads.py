@@ -0,0 +1,145 @@
+import os
+import hashlib
+import tempfile
+import shutil
+import requests
+from valhalla_admin.graph import downloads
+
+
+class FakeStream:
+    def __init__(self, status_code, chunks, headers=None, fail_after=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._chunks = chunks
+        self._fail_after = fail_after
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, size):
+        for i, c in enumerate(self._chunks):
+            if self._fail_after is not None and i >= self._fail_after:
+                raise requests.ConnectionError("coupure")
+            yield c
+
+    def close(self):
+        pass
+
+
+def test_fetch_to_file_resumes_with_range(monkeypatch):
+    tmp = tempfile.mkdtemp()
+    try:
+        body = [b"abc", b"def", b"ghi"]
+        seen = []
+
+        def fake_get(url, timeout=None, stream=False, headers=None):
+            seen.append(dict(headers or {}))
+            if headers and "Range" in headers:
+                assert headers["Range"] == "bytes=3-"
+                assert headers["If-Range"] == '"e1"'
+                return FakeStream(206, body[1:])
+            return FakeStream(200, body, {"ETag": '"e1"'}, fail_after=1)
+
+        monkeypatch.setattr(downloads.requests, "get", fake_get)
+        monkeypatch.setattr(downloads.time, "sleep", lambda s: None)
+
+        dest = os.path.join(tmp, "feed.zip")
+        r, sha, size = downloads.fetch_to_file("http://x/feed.zip", dest)
+        with open(dest, "rb") as f:
+            assert f.read() == b"abcdefghi"
+        assert size == 9
+        assert sha == hashlib.sha256(b"abcdefghi").hexdigest()
+        assert len(seen) == 2
+        assert [n for n in os.listdir(tmp)] == ["feed.zip"]
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_fetch_to_file_not_modified_writes_nothing(monkeypatch):
+    tmp = tempfile.mkdtemp()
+    try:
+        monkeypatch.setattr(downloads.requests, "get", lambda url, **kw: FakeStream(304, []))
+        dest = os.path.join(tmp, "feed.zip")
+        r, sha, size = downloads.fetch_to_file("http://x/feed.zip", dest, headers={"If-None-Match": '"e1"'})
+        assert r.status_code == 304 and sha is None
+        assert os.listdir(tmp) == []
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_split_ranges_covers_whole_file():
+    ranges = downloads.split_ranges(10, 3)
+    assert ranges == [(0, 3), (4, 7), (8, 9)]
+    assert downloads.split_ranges(2, 4) == [(0, 0), (1, 1)]
+
+
+def test_download_segmented_resumes_existing_part(monkeypatch):
+    tmp = tempfile.mkdtemp()
+    try:
+        data = bytes(range(256)) * 4
+        dest = os.path.join(tmp, "region.osm.pbf")
+        ranges = downloads.split_ranges(len(data), 2)
+        # Simule un téléchargement interrompu : état + moitié du premier segment
+        import json
+        with open(dest + ".parts.json", "w") as f:
+            json.dump({"url": "http://x/region.osm.pbf", "size": len(data), "validator": '"e1"', "ranges": ranges}, f)
+        with open(dest + ".part0", "wb") as f:
+            f.write(data[:100])
+
+        class Head:
+            headers = {"Content-Length": str(len(data)), "Accept-Ranges": "bytes", "ETag": '"e1"'}
+
+            def raise_for_status(self):
+                pass
+
+        class Md5:
+            status_code = 200
+            text = hashlib.md5(data).hexdigest() + "  region.osm.pbf\n"
+
+        requested = []
+
+        def fake_get(url, timeout=None, stream=False, headers=None):
+            if url.endswith(".md5"):
+                return Md5()
+            rng = headers["Range"].split("=")[1]
+            start, end = (int(v) for v in rng.split("-"))
+            requested.append((start, end))
+            return FakeStream(206, [data[start:end + 1]])
+
+        monkeypatch.setattr(downloads.requests, "head", lambda url, **kw: Head())
+        monkeypatch.setattr(downloads.requests, "get", fake_get)
+
+        result = downloads.download_segmented(
+            "http://x/region.osm.pbf", dest, segments=2,
+            md5_url="http://x/region.osm.pbf.md5", min_segment_bytes=0,
+        )
+        assert result["mode"] == "ranges" and result["md5"] == "ok"
+        assert result["resumed_bytes"] == 100
+        assert (100, ranges[0][1]) in requested
+        with open(dest, "rb") as f:
+            assert f.read() == data
+        assert not os.path.exists(dest + ".part0")
+        assert not os.path.exists(dest + ".parts.json")
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_download_segmented_if_missing_skips_existing(monkeypatch):
+    tmp = tempfile.mkdtemp()
+    try:
+        dest = os.path.join(tmp, "region.osm.pbf")
+        with open(dest, "wb") as f:
+            f.write(b"pbf")
+
+        def fail(*args, **kwargs):
+            raise AssertionError("aucune requête attendue")
+
+        monkeypatch.setattr(downloads.requests, "head", fail)
+        monkeypatch.setattr(downloads.requests, "get", fail)
+
+        result = downloads.download_segmented("http://x/region.osm.pbf", dest, md5_url="http://x/region.osm.pbf.md5", if_missing=True)
+        assert result["mode"] == "existing"
+        with open(dest, "rb") as f:
+            assert f.read() == b"pbf"
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,17 @@
+from valhalla_admin.graph.events import event_graph
+
+
+def _event(action, graph="fr", type_="container"):
+    return {
+        "Type": type_,
+        "Action": action,
+        "Actor": {"ID": "abc", "Attributes": {"name": f"valhalla-graph-{graph}", "valhalla.graph": graph}},
+    }
+
+
+def test_event_graph():
+    assert event_graph(_event("die")) == "fr"
+    assert event_graph(_event("health_status: unhealthy")) == "fr"
+    assert event_graph(_event("exec_start: curl -f http://localhost:8002/status")) is None
+    assert event_graph(_event("start", type_="network")) is None
+    assert event_graph({"Type": "container", "Action": "start", "Actor": {"Attributes": {}}}) is None
@@ -0,0 +1,100 @@
+import os
+import time
+import hashlib
+import tempfile
+import shutil
+import threading
+from valhalla_admin.graph import gtfs_cache
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def test_fetch_gtfs_revalidates_with_etag(monkeypatch):
+    tmp = tempfile.mkdtemp()
+    try:
+        calls = []
+
+        def fake_fetch(url, dest, timeout=300, headers=None, **kwargs):
+            calls.append(headers or {})
+            if headers and headers.get("If-None-Match") == '"v1"':
+                return FakeResponse(304), None, 0
+            with open(dest, "wb") as f:
+                f.write(b"zip-v1")
+            return FakeResponse(200, {"ETag": '"v1"'}), hashlib.sha256(b"zip-v1").hexdigest(), 6
+
+        monkeypatch.setattr(gtfs_cache, "fetch_to_file", fake_fetch)
+
+        path1, state1 = gtfs_cache.fetch_gtfs("feed", "http://x/feed.zip", cache_dir=tmp)
+        assert state1 == gtfs_cache.STATE_DOWNLOADED
+        with open(path1, "rb") as f:
+            assert f.read() == b"zip-v1"
+
+        path2, state2 = gtfs_cache.fetch_gtfs("feed", "http://x/feed.zip", cache_dir=tmp)
+        assert state2 == gtfs_cache.STATE_NOT_MODIFIED
+        assert path2 == path1
+        assert calls[1].get("If-None-Match") == '"v1"'
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_fetch_gtfs_concurrent_same_source(monkeypatch):
+    tmp = tempfile.mkdtemp()
+    try:
+        dests = []
+        barrier = threading.Barrier(2)
+
+        def fake_fetch(url, dest, timeout=300, headers=None, **kwargs):
+            dests.append(dest)
+            with open(dest, "wb") as f:
+                f.write(b"zip-v1")
+            # Les deux fetchs ont écrit leur fichier avant que l'un ne le déplace
+            barrier.wait(timeout=5)
+            return FakeResponse(200), hashlib.sha256(b"zip-v1").hexdigest(), 6
+
+        monkeypatch.setattr(gtfs_cache, "fetch_to_file", fake_fetch)
+
+        results, errors = [], []
+
+        def run():
+            try:
+                results.append(gtfs_cache.fetch_gtfs("feed", "http://x/feed.zip", cache_dir=tmp))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run) for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert not errors
+        assert len(set(dests)) == 2
+        assert len({path for path, _ in results}) == 1
+        assert not [n for n in os.listdir(os.path.join(tmp, "blobs")) if n.startswith(".incoming-")]
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_evict_drops_least_recently_used():
+    tmp = tempfile.mkdtemp()
+    try:
+        for i, sid in enumerate(["old", "new"]):
+            sha = f"{i:064x}"
+            os.makedirs(os.path.join(tmp, "blobs"), exist_ok=True)
+            with open(gtfs_cache._blob_path(tmp, sha), "wb") as f:
+                f.write(b"x" * 100)
+            gtfs_cache._write_meta(gtfs_cache._index_path(tmp, sid), {
+                "url": f"http://x/{sid}.zip", "sha256": sha, "size": 100,
+                "last_used": time.time() + i,
+            })
+
+        freed = gtfs_cache.evict(tmp, max_bytes=150)
+        assert freed == 100
+        assert not os.path.exists(gtfs_cache._index_path(tmp, "old"))
+        assert os.path.exists(gtfs_cache._index_path(tmp, "new"))
+    finally:
+        shutil.rmtree(tmp)
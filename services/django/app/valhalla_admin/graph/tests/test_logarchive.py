@@ -0,0 +1,53 @@
+from valhalla_admin.graph import logarchive
+
+
+def _write(directory, count, segment_bytes=64):
+    with logarchive.ArchiveWriter(str(directory), segment_bytes=segment_bytes) as lf:
+        for i in range(count):
+            lf.write(f"ligne {i}\n")
+
+
+def test_segments_and_line_ranges(tmp_path):
+    _write(tmp_path, 100)
+    index = logarchive.read_index(str(tmp_path))
+    assert len(index["segments"]) > 5
+    assert logarchive.totals(index)[0] == 100
+
+    assert list(logarchive.iter_lines(str(tmp_path), 0, 3)) == ["ligne 0", "ligne 1", "ligne 2"]
+    assert list(logarchive.iter_lines(str(tmp_path), 42, 4)) == [f"ligne {i}" for i in range(42, 46)]
+    assert logarchive.tail(str(tmp_path), 3) == ["ligne 97", "ligne 98", "ligne 99"]
+    assert len(list(logarchive.iter_lines(str(tmp_path), 90))) == 10
+
+
+def test_byte_ranges_match_plain_text(tmp_path):
+    _write(tmp_path, 100)
+    text = "".join(f"ligne {i}\n" for i in range(100)).encode()
+    assert b"".join(logarchive.iter_bytes(str(tmp_path))) == text
+    assert b"".join(logarchive.iter_bytes(str(tmp_path), 60, 200)) == text[60:201]
+
+
+def test_reopen_appends_and_open_segment_is_readable(tmp_path):
+    _write(tmp_path, 10, segment_bytes=1 << 20)
+    lf = logarchive.ArchiveWriter(str(tmp_path))
+    for i in range(10, 10 + logarchive.FLUSH_LINES):
+        lf.write(f"ligne {i}\n")
+    # Segment en cours (non fermé) : lisible jusqu'au dernier flush
+    assert logarchive.tail(str(tmp_path), 1) == [f"ligne {9 + logarchive.FLUSH_LINES}"]
+    lf.close()
+    assert list(logarchive.iter_lines(str(tmp_path), 8, 4)) == ["ligne 8", "ligne 9", "ligne 10", "ligne 11"]
+
+
+def test_parse_range():
+    assert logarchive.parse_range("bytes=0-99", 1000) == (0, 99)
+    assert logarchive.parse_range("bytes=900-", 1000) == (900, 999)
+    assert logarchive.parse_range("bytes=-100", 1000) == (900, 999)
+    assert logarchive.parse_range("bytes=950-2000", 1000) == (950, 999)
+    assert logarchive.parse_range("bytes=1000-", 1000) is None
+    assert logarchive.parse_range("bytes=0-1,5-6", 1000) is None
+    assert logarchive.parse_range(None, 1000) is None
+
+
+def test_prune_archives(tmp_path):
+    for task_id in (3, 12, 7):
+        (tmp_path / "logs" / str(task_id)).mkdir(parents=True)
+    assert logarchive.prune_archives(str(tmp_path), keep=2) == ["3"]
@@ -0,0 +1,25 @@
+import json
+
+from valhalla_admin.graph import logstream
+
+
+def test_sse_event():
+    event = logstream.sse_event("lines", {"cursor": 12, "lines": ["[t] é"]}, 12)
+    assert event.startswith("id: 12\nevent: lines\ndata: ") and event.endswith("\n\n")
+    assert json.loads(event.split("data: ", 1)[1]) == {"cursor": 12, "lines": ["[t] é"]}
+    assert logstream.sse_event("end", {"status": "built"}).startswith("event: end\n")
+
+
+def test_publish_suspended_after_redis_error(monkeypatch):
+    calls = []
+
+    class Down:
+        def publish(self, channel, data):
+            calls.append(channel)
+            raise ConnectionError("redis down")
+
+    monkeypatch.setattr(logstream, "_client", Down())
+    monkeypatch.setattr(logstream, "_down_until", 0.0)
+    logstream.publish(3, 10, ["a"])
+    logstream.publish(3, 11, ["b"])
+    assert calls == ["valhalla:buildlog:3"]
@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+from valhalla_admin.graph import metrics
+
+
+def test_sample_from_stats():
+    mb = 1024 * 1024
+    stats = {
+        "cpu_stats": {"cpu_usage": {"total_usage": 3_000}, "system_cpu_usage": 20_000, "online_cpus": 4},
+        "precpu_stats": {"cpu_usage": {"total_usage": 1_000}, "system_cpu_usage": 10_000},
+        "memory_stats": {"usage": 512 * mb, "limit": 2048 * mb, "stats": {"file": 128 * mb}},
+    }
+    sample = metrics.sample_from_stats(stats)
+    assert sample == {"cpu_percent": 80.0, "memory_mb": 512.0, "memory_limit_mb": 2048.0, "cache_mb": 128.0}
+
+    # Premier échantillon d'un container : pas de precpu
+    assert metrics.sample_from_stats({"cpu_stats": {}, "precpu_stats": {}, "memory_stats": {}})["cpu_percent"] == 0.0
+
+
+def test_ring_slot_wraps():
+    span = metrics.RING_SLOTS * metrics.VALHALLA_METRICS_INTERVAL
+    assert metrics.ring_slot(1000.0) == metrics.ring_slot(1000.0 + span)
+    assert 0 <= metrics.ring_slot(1e9) < metrics.RING_SLOTS
+
+
+def test_latest_by_graph_sums_replicas():
+    s = lambda c, g, cpu, mem, t: SimpleNamespace(container_name=c, graph_name=g, cpu_percent=cpu, memory_mb=mem, sampled_at=t)
+    samples = [
+        s("valhalla-graph-fr", "fr", 50.0, 1000.0, 2),
+        s("valhalla-graph-fr-r1", "fr", 30.0, 900.0, 2),
+        s("valhalla-graph-fr", "fr", 99.0, 5000.0, 1),  # plus ancien : ignoré
+    ]
+    latest = metrics.latest_by_graph(samples)
+    assert latest["fr"]["cpu_percent"] == 80.0 and latest["fr"]["memory_mb"] == 1900.0
+    assert latest["fr"]["containers"] == 2
+
+
+def test_collector_with_sparse_containers(monkeypatch):
+    """`containers.list(sparse=True)` ne renseigne que Id/Names/Labels : pas de `Name`."""
+    import os
+    import django
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "valhalla_admin.settings")
+    django.setup()
+    from valhalla_admin.graph import docker_manager, tasks
+
+    containers = [
+        SimpleNamespace(id="a1", attrs={"Id": "a1", "Names": ["/valhalla-graph-fr"],
+                                        "Labels": {"valhalla.graph": "fr", "valhalla.managed": "true"}}),
+        SimpleNamespace(id="b2", attrs={"Id": "b2", "Names": ["/valhalla-graph-fr-r1"],
+                                        "Labels": {"valhalla.graph": "fr", "valhalla.replica": "1"}}),
+    ]
+    stats = {"cpu_stats": {}, "precpu_stats": {}, "memory_stats": {"usage": 1024 * 1024}}
+    client = SimpleNamespace(
+        containers=SimpleNamespace(list=lambda **kw: containers),
+        api=SimpleNamespace(stats=lambda cid, stream: stats),
+    )
+    monkeypatch.setattr(docker_manager, "get_manager", lambda: SimpleNamespace(client=client))
+
+    stored = []
+
+    class Objects:
+        def bulk_create(self, rows, **kwargs):
+            stored.extend(rows)
+
+        def filter(self, **kwargs):
+            return SimpleNamespace(delete=lambda: (0, {}))
+
+    monkeypatch.setattr(tasks.ContainerMetricSample, "objects", Objects())
+
+    assert tasks.collect_container_metrics() == 2
+    assert [(r.container_name, r.graph_name, r.replica) for r in stored] == [
+        ("valhalla-graph-fr", "fr", 0),
+        ("valhalla-graph-fr-r1", "fr", 1),
+    ]
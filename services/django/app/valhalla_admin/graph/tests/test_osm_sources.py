@@ -0,0 +1,97 @@
+import os
+import tempfile
+import shutil
+from valhalla_admin.graph import osm_sources
+
+
+def test_updates_url_for_geofabrik_extract():
+    url = "https://download.geofabrik.de/europe/france/alsace-latest.osm.pbf"
+    assert osm_sources.updates_url_for(url) == "https://download.geofabrik.de/europe/france/alsace-updates"
+    assert osm_sources.updates_url_for("https://example.org/custom.osm.pbf") is None
+
+
+def test_parse_state_and_sequence_path():
+    text = "#Sat Jan 04 20:21:02 UTC 2025\nsequenceNumber=4321\ntimestamp=2025-01-04T20\\:21\\:02Z\n"
+    state = osm_sources.parse_state(text)
+    assert state == {"sequence": 4321, "timestamp": "2025-01-04T20:21:02Z"}
+    assert osm_sources.sequence_path(4321) == "000/004/321"
+
+
+def test_catalog_with_freshness_reads_state():
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, "alsace-latest.osm.pbf")
+        open(path, "wb").close()
+        osm_sources.save_state(path, {"sequence": 12, "timestamp": "2025-01-04T20:21:02Z"})
+        catalog = [
+            {"region": "Alsace", "file": "alsace-latest.osm.pbf", "url": "u1"},
+            {"region": "Corse", "file": "corse-latest.osm.pbf", "url": "u2"},
+        ]
+        entries = osm_sources.catalog_with_freshness(catalog, tmp)
+        assert entries[0]["local"] and entries[0]["sequence"] == 12
+        assert not entries[1]["local"] and entries[1]["sequence"] is None
+        assert "local" not in catalog[0]
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_update_untracked_file_without_header_sequence_is_too_old(monkeypatch):
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, "alsace-latest.osm.pbf")
+        open(path, "wb").close()
+        url = "https://download.geofabrik.de/europe/france/alsace-latest.osm.pbf"
+        monkeypatch.setattr(osm_sources, "read_pbf_sequence", lambda p: {})
+        monkeypatch.setattr(osm_sources, "fetch_remote_state", lambda u: {"sequence": 4321})
+
+        result = osm_sources.update_osm_file(path, url)
+        assert result["status"] == "too_old"
+        assert osm_sources.load_state(path) is None
+
+        # Fichier fraîchement téléchargé : l'état distant est adopté
+        assert osm_sources.init_state(path, url)["sequence"] == 4321
+        assert osm_sources.load_state(path)["sequence"] == 4321
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_merge_cached_reuses_same_input_set(monkeypatch):
+    tmp = tempfile.mkdtemp()
+    try:
+        a = os.path.join(tmp, "a.osm.pbf")
+        b = os.path.join(tmp, "b.osm.pbf")
+        for p, data in ((a, b"aaaa"), (b, b"bbbb")):
+            with open(p, "wb") as f:
+                f.write(data)
+        runs = []
+
+        def fake_run(cmd, check=True, **kwargs):
+            runs.append(cmd)
+            with open(cmd[cmd.index("-o") + 1], "wb") as f:
+                f.write(b"merged")
+
+        monkeypatch.setattr(osm_sources.subprocess, "run", fake_run)
+        cache = os.path.join(tmp, "merged")
+
+        path1, hit1 = osm_sources.merge_cached([a, b], cache)
+        path2, hit2 = osm_sources.merge_cached([b, a], cache)
+        assert not hit1 and hit2
+        assert path1 == path2 and len(runs) == 1
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_evict_merged_keeps_budget():
+    tmp = tempfile.mkdtemp()
+    try:
+        paths = []
+        for i in range(3):
+            p = os.path.join(tmp, f"{i}.osm.pbf")
+            with open(p, "wb") as f:
+                f.write(b"x" * 10)
+            os.utime(p, (1000 + i, 1000 + i))
+            paths.append(p)
+        removed = osm_sources.evict_merged(tmp, max_bytes=20)
+        assert removed == [paths[0]]
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,83 @@
+import os
+import json
+import tempfile
+import shutil
+from valhalla_admin.graph import pipeline
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def test_gtfs_change_only_invalidates_transit_stages():
+    base = pipeline.compute_stage_keys({"valhalla": "3.5", "osm": "o1", "gtfs": "g1", "config": "c1"})
+    gtfs = pipeline.compute_stage_keys({"valhalla": "3.5", "osm": "o1", "gtfs": "g2", "config": "c1"})
+    osm = pipeline.compute_stage_keys({"valhalla": "3.5", "osm": "o2", "gtfs": "g1", "config": "c1"})
+
+    changed = {s for s in pipeline.STAGES if base[s] != gtfs[s]}
+    assert changed == {"transit", "graph", "extract"}
+
+    changed = {s for s in pipeline.STAGES if base[s] != osm[s]}
+    assert changed == {"admins", "osm_tiles", "graph", "extract"}
+
+
+def test_gtfs_fingerprint_ignores_mtime_and_invalid_dirs():
+    tmp = tempfile.mkdtemp()
+    try:
+        _write(os.path.join(tmp, "a", "stops.txt"), "stop_id\n1\n")
+        _write(os.path.join(tmp, "empty", "readme.txt"), "x")
+        first = pipeline.gtfs_fingerprint(tmp)
+        os.utime(os.path.join(tmp, "a", "stops.txt"), (0, 0))
+        assert pipeline.gtfs_fingerprint(tmp) == first
+
+        _write(os.path.join(tmp, "a", "stops.txt"), "stop_id\n2\n")
+        assert pipeline.gtfs_fingerprint(tmp) != first
+
+        shutil.rmtree(os.path.join(tmp, "a"))
+        assert pipeline.gtfs_fingerprint(tmp) == "none"
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_config_fingerprint_ignores_concurrency_and_transit_paths():
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, "valhalla.json")
+        _write(path, json.dumps({"mjolnir": {"tile_dir": "/t", "concurrency": 8}}))
+        first = pipeline.config_fingerprint(path)
+        _write(path, json.dumps({"mjolnir": {"tile_dir": "/t", "concurrency": 2, "transit_dir": "/tt"}}))
+        assert pipeline.config_fingerprint(path) == first
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_is_fresh_requires_key_and_outputs():
+    tmp = tempfile.mkdtemp()
+    try:
+        pipeline.save_manifest(tmp, {"admins": "k1"})
+        manifest = pipeline.load_manifest(tmp)
+        assert not pipeline.is_fresh(tmp, manifest, "admins", "k1")  # admin.sqlite absent
+
+        _write(os.path.join(tmp, "tiles", "admin.sqlite"), "db")
+        assert pipeline.is_fresh(tmp, manifest, "admins", "k1")
+        assert not pipeline.is_fresh(tmp, manifest, "admins", "k2")
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_is_fresh_checks_transit_tiles_only_with_gtfs():
+    tmp = tempfile.mkdtemp()
+    try:
+        manifest = {"transit": "k1"}
+        assert pipeline.is_fresh(tmp, manifest, "transit", "k1", {"gtfs": "none"})
+        assert not pipeline.is_fresh(tmp, manifest, "transit", "k1", {"gtfs": "g1"})
+
+        # Dossier créé mais vide (conversion interrompue ou tuiles supprimées)
+        os.makedirs(os.path.join(tmp, "tiles", "transit_tiles"))
+        assert not pipeline.is_fresh(tmp, manifest, "transit", "k1", {"gtfs": "g1"})
+        _write(os.path.join(tmp, "tiles", "transit_tiles", "2", "000", "000.gph"), "t")
+        assert pipeline.is_fresh(tmp, manifest, "transit", "k1", {"gtfs": "g1"})
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,25 @@
+from valhalla_admin.graph import profiles
+
+
+def test_validate_profile():
+    profile, error = profiles.validate_profile(
+        {"threads": 16, "cpuset": "0-15", "mem_limit": "24g", "shm_size": "1g", "max_cache_size": 8_000_000_000}
+    )
+    assert error is None and profile["threads"] == 16
+
+    # Valeurs vides : retour au défaut
+    profile, error = profiles.validate_profile({"threads": 4, "cpuset": "", "mem_limit": None})
+    assert error is None and profile == {"threads": 4}
+
+    for bad in ({"threads": 0}, {"threads": "4"}, {"cpuset": "0-"}, {"mem_limit": "lots"},
+                {"max_cache_size": -1}, {"workers": 2}, []):
+        assert profiles.validate_profile(bad)[1] is not None
+
+
+def test_effective_profile_and_fingerprint():
+    eff = profiles.effective_profile({"threads": 8, "ignored": 1})
+    assert eff["threads"] == 8 and "ignored" not in eff
+    assert set(eff) == set(profiles.DEFAULT_PROFILE)
+
+    assert profiles.profile_fingerprint({}) == profiles.profile_fingerprint(None)
+    assert profiles.profile_fingerprint({"threads": 8}) != profiles.profile_fingerprint({})
@@ -0,0 +1,41 @@
+import os
+import tempfile
+import shutil
+from valhalla_admin.graph import releases
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def test_seed_switch_and_prune_releases():
+    tmp = tempfile.mkdtemp()
+    try:
+        # Ancien layout : <graph>/build
+        _write(os.path.join(tmp, "build", "tiles", "admin.sqlite"), "v0")
+
+        r1 = releases.release_dir(tmp, 1)
+        assert releases.seed_release(tmp, r1) == os.path.join(tmp, "build")
+        seeded = os.path.join(r1, "build", "tiles", "admin.sqlite")
+        assert os.path.samefile(seeded, os.path.join(tmp, "build", "tiles", "admin.sqlite"))
+        releases.set_current(tmp, r1)
+        assert releases.current_release(tmp) == os.path.realpath(r1)
+
+        # Release suivante initialisée depuis la courante, puis bascule
+        r2 = releases.release_dir(tmp, 2)
+        assert releases.seed_release(tmp, r2) == os.path.join(os.path.realpath(r1), "build")
+        assert releases.seed_release(tmp, r2) is None  # déjà initialisée
+        releases.set_current(tmp, r2)
+        assert os.readlink(os.path.join(tmp, "current")) == os.path.join("releases", "2")
+
+        r3 = releases.release_dir(tmp, 3)
+        os.makedirs(r3)
+        # keep=1 : la release précédente reste disponible pour un retour arrière
+        assert releases.prune_releases(tmp, keep=1, protect={r3}) == []
+        removed = releases.prune_releases(tmp, keep=0, protect={r3})
+        assert removed == [r1]
+        assert os.path.isdir(r2) and os.path.isdir(r3)
+    finally:
+        shutil.rmtree(tmp)
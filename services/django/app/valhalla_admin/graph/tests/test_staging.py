@@ -0,0 +1,44 @@
+import os
+import tempfile
+import shutil
+from valhalla_admin.graph import staging
+
+
+def test_stage_file_hardlinks_and_detects_current():
+    tmp = tempfile.mkdtemp()
+    try:
+        src = os.path.join(tmp, "src.osm.pbf")
+        with open(src, "wb") as f:
+            f.write(b"pbf")
+        dest = os.path.join(tmp, "graph", "osm", "src.osm.pbf")
+
+        assert staging.stage_file(src, dest) == staging.MODE_HARDLINK
+        assert os.path.samefile(src, dest)
+        assert staging.stage_file(src, dest) == staging.MODE_EXISTING
+    finally:
+        shutil.rmtree(tmp)
+
+
+def test_stage_file_falls_back_to_copy(monkeypatch):
+    tmp = tempfile.mkdtemp()
+    try:
+        src = os.path.join(tmp, "src.osm.pbf")
+        with open(src, "wb") as f:
+            f.write(b"pbf")
+        dest = os.path.join(tmp, "dest.osm.pbf")
+
+        def no_link(a, b):
+            raise OSError(staging.errno.EXDEV, "cross-device link")
+
+        def no_reflink(a, b):
+            raise OSError(staging.errno.EOPNOTSUPP, "no reflink")
+
+        monkeypatch.setattr(staging.os, "link", no_link)
+        monkeypatch.setattr(staging, "_reflink", no_reflink)
+
+        assert staging.stage_file(src, dest) == staging.MODE_COPY
+        assert not os.path.samefile(src, dest)
+        # copy2 conserve mtime/taille : la copie est reconnue comme à jour
+        assert staging.stage_file(src, dest) == staging.MODE_EXISTING
+    finally:
+        shutil.rmtree(tmp)
@@ -7,6 +7,7 @@ urlpatterns = [
     path("create/", views.graph_create, name="graph_create"),
     path("<str:name>/status/", views.graph_status, name="graph_status"),
     path("<str:name>/map/", views.graph_map, name="graph_map"),
+    path("<str:name>/metrics/", views.graph_metrics, name="graph_metrics"),
     path("<str:name>/stops.geojson", views.graph_stops_geojson, name="graph_stops_geojson"),
     # Config endpoints (GET/POST JSON)
     path("<str:name>/config/", views.graph_config, name="graph_config"),
@@ -15,11 +16,14 @@ urlpatterns = [
     path("<str:name>/", views.graph_detail, name="graph_detail"),
     path("task/<int:task_id>/delete/", views.delete_task, name="graph_task_delete"),
     path("task/<int:task_id>/logs/", views.graph_logs, name="graph_logs"),
+    path("task/<int:task_id>/logs/stream/", views.graph_log_stream, name="graph_log_stream"),
+    path("task/<int:task_id>/build-log/", views.build_log, name="graph_build_log"),
     path("task/<int:task_id>/recreate/", views.recreate_task, name="graph_task_recreate"),
     
     # Gestion containers
     path("task/<int:task_id>/start/", views.start_container, name="container_start"),
     path("task/<int:task_id>/stop/", views.stop_container, name="container_stop"),
     path("task/<int:task_id>/restart/", views.restart_container, name="container_restart"),
+    path("task/<int:task_id>/replicas/", views.set_replicas, name="container_replicas"),
     path("task/<int:task_id>/container-status/", views.container_status_api, name="container_status"),
 ]
\ No newline at end of file
@@ -1,5 +1,5 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse, Http404, HttpResponse
+from django.http import JsonResponse, Http404, HttpResponse, StreamingHttpResponse
 from django.views.decorators.http import require_POST
 from django.utils import timezone
 import shutil
@@ -7,54 +7,79 @@ import shutil
 import os
 import json
 import csv
+from datetime import timedelta
 
-from .models import BuildTask
-from .tasks import start_valhalla_build, ensure_valhalla_running, stop_valhalla_container
+from .models import BuildTask, ContainerMetricSample
+from .tasks import start_valhalla_build, ensure_valhalla_running, stop_valhalla_container, scale_valhalla_replicas
 from valhalla_admin.gtfs.models import GtfsSource
 from .utils import OSM_CATALOG_FR, get_gtfs_date_range
+from .osm_sources import catalog_with_freshness
 from valhalla_admin.timeutil import parse_datetime_local, to_utc, get_system_timezone
-from .docker_manager import ValhallaDockerManager
+from .docker_manager import get_manager
+from .profiles import DEFAULT_PROFILE, effective_profile, validate_profile
+from . import container_state, logarchive, logstream
+from .events import VALHALLA_EVENTS_WATCHER
+from .metrics import VALHALLA_METRICS_INTERVAL, VALHALLA_METRICS_RETENTION_HOURS, latest_by_graph
+
+
+# Nombre max de containers par graph
+VALHALLA_MAX_REPLICAS = int(os.getenv("VALHALLA_MAX_REPLICAS", "8"))
+# Silence (s) au-delà duquel un build en cours est signalé comme possiblement tué
+LOG_STALL_SECONDS = 600
+# Lignes max renvoyées par un extrait du journal complet (build-log/?tail= / ?start=)
+BUILD_LOG_MAX_LINES = 10000
 
 
 # ─────────────────────────
 # Dashboard & liste
 # ─────────────────────────
 
+def _latest_metrics(graph_name: str | None = None) -> dict:
+    """Derniers CPU/mémoire connus par graph (échantillons du collecteur, sans appel Docker)."""
+    since = timezone.now() - timedelta(seconds=3 * VALHALLA_METRICS_INTERVAL)
+    samples = ContainerMetricSample.objects.filter(sampled_at__gte=since)
+    if graph_name:
+        samples = samples.filter(graph_name=graph_name)
+    return latest_by_graph(samples.order_by("-sampled_at"))
+
+
 def dashboard(request):
     """Dashboard de gestion des graphs avec statistiques containers"""
     docker_error = None
     stats = None
     
     try:
-        manager = ValhallaDockerManager()
-        stats = manager.get_system_stats()
-        
-        # Enrichir avec les infos DB
-        graphs = BuildTask.objects.order_by("-created_at")
+        graphs = list(BuildTask.objects.order_by("-created_at"))
+        if VALHALLA_EVENTS_WATCHER:
+            # État tenu à jour par le watcher d'événements Docker : aucune requête Docker
+            states = {}
+            for graph in graphs:
+                if graph.is_serving:
+                    states.setdefault(graph.name, container_state.state_from_task(graph))
+            stats = container_state.system_stats(states)
+        else:
+            # Un seul appel Docker (instantané partagé), pas d'inspect/stats par graph
+            manager = get_manager()
+            states = container_state.snapshot(manager)
+            stats = container_state.system_stats(states)
         
-        # Synchroniser l'état is_serving avec les containers réels
+            # Synchroniser l'état is_serving avec les containers réels (UPDATE groupés par champs modifiés,
+            # pour ne pas réécrire le statut d'un build en cours)
+            owners = container_state.legacy_owners(states)
+            changed = {}
+            for graph in graphs:
+                update_fields = container_state.apply_state(graph, states.get(graph.name) or {}, owners)
+                if update_fields:
+                    changed.setdefault(update_fields, []).append(graph)
+            for update_fields, rows in changed.items():
+                try:
+                    BuildTask.objects.bulk_update(rows, list(update_fields))
+                except Exception:
+                    pass  # Si une mise à jour échoue, l'état sera resynchronisé au prochain affichage
+
+        metrics = _latest_metrics()
         for graph in graphs:
-            try:
-                container_status = manager.get_container_status(graph.name)
-                running = container_status.get("running", False)
-                if graph.is_serving != running or (running and graph.status != "serving"):
-                    graph.is_serving = running
-                    if running:
-                        # Si le container est effectivement actif, refléter l'état
-                        graph.status = "serving"
-                        if container_status.get("port"):
-                            graph.serve_port = container_status["port"]
-                        graph.save(update_fields=["is_serving", "status", "serve_port"])
-                    else:
-                        # Container arrêté: ne pas écraser un statut en cours (building),
-                        # mais si prêt et marqué erreur, repasser à "built".
-                        update_fields = ["is_serving"]
-                        if graph.is_ready and graph.status == "error":
-                            graph.status = "built"
-                            update_fields.append("status")
-                        graph.save(update_fields=update_fields)
-            except Exception:
-                pass  # Si un container pose problème, continuer avec les autres
+            graph.metrics = metrics.get(graph.name) if graph.is_serving else None
             # Annoter plage de disponibilité GTFS
             try:
                 s, e = get_gtfs_date_range(graph)
@@ -116,6 +141,14 @@ OSM_DIR = "/data/sources/osm"
 GRAPH_ROOT = "/data/graphs"
 
 
+def _inherited_serve_settings(graph_name: str) -> dict:
+    """Réglages de service d'un graph existant (tâche servie, sinon la plus récente), repris par un nouveau build."""
+    previous = BuildTask.objects.filter(name=graph_name).order_by("-is_serving", "-id").first()
+    if previous is None:
+        return {}
+    return {"serve_profile": previous.serve_profile, "serve_replicas": previous.serve_replicas}
+
+
 def graph_create(request):
     # ─────────────────────────
     # POST → création de tâche
@@ -157,6 +190,7 @@ def graph_create(request):
                 gtfs_ids=selected_gtfs,
                 status="pending",
                 serve_port=None,  # port réel attribué au démarrage du container
+                **_inherited_serve_settings(graph_name),
             )
 
             # Créer le dossier du graph et stocker les zips uploadés pour que le worker les traite
@@ -179,7 +213,6 @@ def graph_create(request):
                     saved_count += 1
                 if saved_count:
                     task.add_log(f"📥 {saved_count} fichier(s) GTFS .zip uploadé(s) en attente de traitement")
-                    task.save(update_fields=["logs"])
             except Exception as e:
                 try:
                     task.add_log(f"⚠️ Échec sauvegarde des zips uploadés: {e}")
@@ -196,7 +229,6 @@ def graph_create(request):
                     except Exception:
                         disp = schedule_eta
                     task.add_log(f"🗓 Build planifié pour {disp}")
-                    task.save(update_fields=["logs"])
                 except Exception:
                     start_valhalla_build.delay(task.id)
             else:
@@ -221,7 +253,7 @@ def graph_create(request):
     return render(request, "graph/create.html", {
         "section": "create",
         "gtfs": gtfs,
-        "osm_catalog": OSM_CATALOG_FR,
+        "osm_catalog": catalog_with_freshness(OSM_CATALOG_FR, OSM_DIR),
         "graph": graph,
         "tasks": tasks,
         "show_logs": (request.GET.get("show") == "logs"),
@@ -244,6 +276,82 @@ def graph_logs(request, task_id: int):
         "gtfs_end": e,
     })
 
+async def graph_log_stream(request, task_id: int):
+    """Journal d'une tâche en direct (Server-Sent Events), à partir de `?after=` ou `Last-Event-ID`."""
+    if not logstream.SSE_AVAILABLE:
+        # Sous uWSGI, un flux occuperait un worker pendant tout le build : les pages repassent au polling
+        return JsonResponse({"error": "Flux indisponible, utiliser graph/<name>/status/?after="}, status=503)
+    if not await BuildTask.objects.filter(id=task_id).aexists():
+        raise Http404("Tâche introuvable")
+    raw = request.headers.get("Last-Event-ID") or request.GET.get("after") or "0"
+    try:
+        after = max(0, int(raw))
+    except ValueError:
+        after = 0
+    response = StreamingHttpResponse(logstream.events(task_id, after), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+def build_log(request, task_id: int):
+    """Sortie complète d'un build (archive gzip segmentée, décompressée à la volée).
+
+    - `?tail=N` : N dernières lignes ; `?start=S&count=N` : lignes [S, S+N) (texte, N ≤ BUILD_LOG_MAX_LINES)
+    - sinon : téléchargement complet, `Range: bytes=a-b` accepté (206) pour les archives
+    """
+    task = get_object_or_404(BuildTask, id=task_id)
+    archive = logarchive.archive_dir(task.output_dir or "", task.id)
+    index = logarchive.read_index(archive) if task.output_dir else None
+    legacy = os.path.join(task.output_dir or "", logarchive.LEGACY_LOG)
+    if index is None and not (task.output_dir and os.path.isfile(legacy)):
+        raise Http404("Aucun journal de build")
+
+    if "tail" in request.GET or "start" in request.GET:
+        try:
+            if "tail" in request.GET:
+                count = min(int(request.GET["tail"]), BUILD_LOG_MAX_LINES)
+                start = None
+            else:
+                start = int(request.GET["start"])
+                count = min(int(request.GET.get("count", 1000)), BUILD_LOG_MAX_LINES)
+            if count < 0 or (start is not None and start < 0):
+                raise ValueError
+        except ValueError:
+            return JsonResponse({"error": "tail, start et count doivent être des entiers positifs"}, status=400)
+        if index is not None:
+            lines = logarchive.tail(archive, count) if start is None else list(logarchive.iter_lines(archive, start, count))
+        else:
+            lines = logarchive.legacy_tail(legacy, count) if start is None else list(logarchive.iter_legacy_lines(legacy, start, count))
+        response = HttpResponse("\n".join(lines), content_type="text/plain; charset=utf-8")
+        if index is not None:
+            response["X-Log-Total-Lines"] = logarchive.totals(index)[0]
+        return response
+
+    filename = f"build-{task.name}-{task.id}.log"
+    if index is None:
+        # Ancien build : build.log en clair
+        response = StreamingHttpResponse(logarchive.iter_legacy_bytes(legacy), content_type="text/plain; charset=utf-8")
+        response["Content-Length"] = os.path.getsize(legacy)
+    else:
+        size = logarchive.totals(index)[1]
+        byte_range = logarchive.parse_range(request.headers.get("Range"), size)
+        if request.headers.get("Range") and byte_range is None:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+        start, end = byte_range or (0, size - 1)
+        response = StreamingHttpResponse(
+            logarchive.iter_bytes(archive, start, end),
+            status=206 if byte_range else 200,
+            content_type="text/plain; charset=utf-8",
+        )
+        response["Content-Length"] = max(0, end - start + 1)
+        response["Accept-Ranges"] = "bytes"
+        if byte_range:
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
 # ─────────────────────────
 # Re-création d'un graph (même nom, mêmes GTFS/OSM) avec planification possible
 # ─────────────────────────
@@ -264,6 +372,8 @@ def recreate_task(request, task_id: int):
         gtfs_ids=original.gtfs_ids,
         status="pending",
         serve_port=None,
+        serve_profile=original.serve_profile,
+        serve_replicas=original.serve_replicas,
     )
 
     # Journal
@@ -278,7 +388,6 @@ def recreate_task(request, task_id: int):
             except Exception:
                 disp = schedule_eta
             task.add_log(f"🗓 Build planifié pour {disp}")
-            task.save(update_fields=["logs"])
         except Exception:
             start_valhalla_build.delay(task.id)
     else:
@@ -291,55 +400,57 @@ def recreate_task(request, task_id: int):
 # ─────────────────────────
 
 def graph_status(request, name):
+    """Statut et journal du dernier build d'un graph.
+
+    Sans paramètre : aperçu (50 premières + 50 dernières lignes) et `logs_cursor`.
+    Avec `?after=<cursor>` : uniquement les lignes ajoutées depuis (`logs_lines`, `logs_cursor`, `logs_more`).
+    """
     graph = (
         BuildTask.objects
         .filter(name=name)
         .order_by("-created_at")
         .first()
     )
-    # Préparer un aperçu performant: 50 premières lignes + 50 dernières
-    logs_text = graph.logs or ""
-    lines = logs_text.splitlines()
-    total = len(lines)
+    if not graph:
+        raise Http404("Graph introuvable")
+    after = _log_cursor_param(request)
+    if after is False:
+        return JsonResponse({"error": "after doit être un entier positif"}, status=400)
+
+    # Détecter un silence prolongé (possible SIGKILL/OOM) : si status=building et
+    # aucun log depuis >10 minutes.
+    warning = None
+    if graph.status == "building" and graph.last_log_at:
+        delta = timezone.now() - graph.last_log_at
+        if delta.total_seconds() > LOG_STALL_SECONDS:
+            warning = "Aucun log récent (>10 min). Le build peut avoir été tué (SIGKILL/OOM). Relancez après vérif mémoire."
+
+    data = {
+        "name": graph.name,
+        "status": graph.status,
+        "ready": getattr(graph, "is_ready", False),
+        "serving": getattr(graph, "is_serving", False),
+        "warning": warning,
+    }
+    if after is not None:
+        lines, cursor, more = graph.log_lines_after(after)
+        data.update({"logs_lines": lines, "logs_cursor": cursor, "logs_more": more})
+        return JsonResponse(data)
+
+    # Préparer un aperçu performant: 50 premières lignes + 50 dernières (sans charger tout le journal)
     head_count = 50
     tail_count = 50
-
-    head = lines[:head_count]
-    tail = lines[-tail_count:] if total > tail_count else lines
+    head, tail, total = graph.log_preview(head_count, tail_count)
 
     # Insérer un séparateur si on tronque au milieu
-    if total > head_count + tail_count:
+    if tail:
         preview_lines = head + ["… (logs tronqués, utiliser le bouton pour tout afficher) …"] + tail
     else:
-        preview_lines = lines
+        preview_lines = head
 
     preview_text = "\n".join(preview_lines)
 
-    # Détecter un silence prolongé (possible SIGKILL/OOM) : si status=building et
-    # aucun log récent depuis >10 minutes.
-    warning = None
-    if graph.status == "building" and lines:
-        last_ts = None
-        for l in reversed(lines):
-            if l.startswith("[") and "]" in l:
-                candidate = l.split("]", 1)[0].lstrip("[")
-                try:
-                    last_ts = timezone.datetime.fromisoformat(candidate)
-                    if timezone.is_naive(last_ts):
-                        last_ts = timezone.make_aware(last_ts, timezone.utc)
-                    break
-                except Exception:
-                    continue
-        if last_ts:
-            delta = timezone.now() - last_ts
-            if delta.total_seconds() > 600:
-                warning = "Aucun log récent (>10 min). Le build peut avoir été tué (SIGKILL/OOM). Relancez après vérif mémoire."
-
-    return JsonResponse({
-        "name": graph.name,
-        "status": graph.status,
-        "ready": getattr(graph, "is_ready", False),
-        "serving": getattr(graph, "is_serving", False),
+    data.update({
         # Compat: certaines vues attendent "logs" → fournir le preview dans ce champ
         "logs": preview_text,
         # Et fournir aussi explicitement le champ preview pour les nouvelles vues
@@ -347,8 +458,22 @@ def graph_status(request, name):
         "logs_total_lines": total,
         "logs_head_count": head_count,
         "logs_tail_count": tail_count,
-        "warning": warning,
+        # Curseur pour les appels suivants (?after=)
+        "logs_cursor": graph.log_cursor(),
     })
+    return JsonResponse(data)
+
+
+def _log_cursor_param(request):
+    """Valeur de `?after=` : None si absent, False si invalide."""
+    raw = request.GET.get("after")
+    if raw is None:
+        return None
+    try:
+        after = int(raw)
+    except ValueError:
+        return False
+    return after if after >= 0 else False
 
 
 # ─────────────────────────
@@ -403,23 +528,22 @@ def graph_map(request, name):
 
     # Tenter de récupérer l'état/port réel du container si non renseigné
     serve_url = None
-    try:
-        from .docker_manager import ValhallaDockerManager
-        manager = ValhallaDockerManager()
-        status = manager.get_container_status(graph.name)
-        if status.get("running") and status.get("port"):
-            serve_url = f"http://localhost:{status['port']}"
-            # Garder la DB cohérente si besoin
-            if (not graph.is_serving) or (graph.serve_port != status["port"]):
-                graph.is_serving = True
-                graph.serve_port = status["port"]
-                try:
-                    graph.save(update_fields=["is_serving", "serve_port"])
-                except Exception:
-                    pass
-    except Exception:
-        # Ignorer erreurs docker, on retombe sur le champ existant
-        pass
+    if not VALHALLA_EVENTS_WATCHER:
+        try:
+            manager = get_manager()
+            status = container_state.graph_state(manager, graph.name)
+            if status.get("running") and status.get("port"):
+                serve_url = f"http://localhost:{status['port']}"
+                # Garder la DB cohérente si besoin
+                update_fields = container_state.apply_state(graph, status)
+                if update_fields:
+                    try:
+                        graph.save(update_fields=list(update_fields))
+                    except Exception:
+                        pass
+        except Exception:
+            # Ignorer erreurs docker, on retombe sur le champ existant
+            pass
     if not serve_url and graph.serve_port:
         serve_url = f"http://localhost:{graph.serve_port}"
 
@@ -576,15 +700,25 @@ def delete_task(request, task_id):
     except Exception:
         pass
 
-    # Arrêter et supprimer le container si actif
-    try:
-        manager = ValhallaDockerManager()
-        manager.remove_container(task.name, force=True)
-    except Exception:
-        pass
-
-    if task.output_dir and os.path.exists(task.output_dir):
-        shutil.rmtree(task.output_dir, ignore_errors=True)
+    # Arrêter et supprimer les containers seulement si cette tâche est servie
+    # (les containers du graph sont ceux de la release en service, quelle que soit la tâche supprimée)
+    if task.is_serving:
+        try:
+            manager = get_manager()
+            manager.remove_container(task.name, force=True)
+            container_state.invalidate()
+        except Exception:
+            pass
+
+    if task.release_dir:
+        # Seule la release de cette tâche est supprimée ; osm/, gtfs/ et les autres releases restent
+        if os.path.exists(task.release_dir):
+            shutil.rmtree(task.release_dir, ignore_errors=True)
+        if task.output_dir:
+            shutil.rmtree(logarchive.archive_dir(task.output_dir, task.id), ignore_errors=True)
+    elif task.output_dir and os.path.exists(task.output_dir):
+        if not BuildTask.objects.filter(name=task.name).exclude(id=task.id).exists():
+            shutil.rmtree(task.output_dir, ignore_errors=True)
 
     task.delete()
 
@@ -633,12 +767,14 @@ def restart_container(request, task_id):
     task = get_object_or_404(BuildTask, id=task_id)
     
     try:
-        manager = ValhallaDockerManager()
+        manager = get_manager()
         result = manager.restart_container(task.name)
+        container_state.invalidate()
         
         if result["status"] == "restarted":
             task.is_serving = True
             task.serve_port = result.get("port")
+            task.serve_ports = result.get("ports") or []
             task.add_log("🔄 Container redémarré")
             task.save()
             
@@ -660,20 +796,49 @@ def restart_container(request, task_id):
         }, status=500)
 
 
+@require_POST
+def set_replicas(request, task_id):
+    """Fixe le nombre de containers servant le graph (appliqué à chaud s'il est servi)"""
+    task = get_object_or_404(BuildTask, id=task_id)
+
+    try:
+        payload = json.loads(request.body.decode("utf-8") or "{}")
+        replicas = int(payload.get("replicas", request.POST.get("replicas")))
+    except (TypeError, ValueError):
+        return JsonResponse({"success": False, "message": "Nombre de replicas invalide"}, status=400)
+    if not 1 <= replicas <= VALHALLA_MAX_REPLICAS:
+        return JsonResponse({
+            "success": False,
+            "message": f"Le nombre de replicas doit être entre 1 et {VALHALLA_MAX_REPLICAS}"
+        }, status=400)
+
+    task.serve_replicas = replicas
+    task.save(update_fields=["serve_replicas"])
+    if task.is_serving:
+        scale_valhalla_replicas.delay(task.id)
+
+    return JsonResponse({
+        "success": True,
+        "replicas": replicas,
+        "message": "Mise à l'échelle en cours..." if task.is_serving else "Appliqué au prochain démarrage"
+    })
+
+
 def container_status_api(request, task_id):
     """API pour récupérer le statut d'un container"""
     task = get_object_or_404(BuildTask, id=task_id)
     
     try:
-        manager = ValhallaDockerManager()
-        status = manager.get_container_status(task.name)
-        
-        # Synchroniser l'état DB
-        if status.get("running") != task.is_serving:
-            task.is_serving = status.get("running", False)
-            if status.get("port"):
-                task.serve_port = status["port"]
-            task.save(update_fields=["is_serving", "serve_port"])
+        if VALHALLA_EVENTS_WATCHER:
+            status = container_state.state_from_task(task)
+        else:
+            manager = get_manager()
+            status = dict(container_state.graph_state(manager, task.name))
+            # Synchroniser l'état DB
+            update_fields = container_state.apply_state(task, status)
+            if update_fields:
+                task.save(update_fields=list(update_fields))
+        status["metrics"] = _latest_metrics(task.name).get(task.name)
         
         return JsonResponse({
             "success": True,
@@ -688,14 +853,49 @@ def container_status_api(request, task_id):
         }, status=500)
 
 
+def graph_metrics(request, name):
+    """Historique CPU/mémoire des containers d'un graph (?minutes=60, borné par la rétention)"""
+    try:
+        minutes = int(request.GET.get("minutes", 60))
+    except ValueError:
+        return JsonResponse({"success": False, "message": "minutes invalide"}, status=400)
+    minutes = max(1, min(minutes, VALHALLA_METRICS_RETENTION_HOURS * 60))
+
+    samples = (
+        ContainerMetricSample.objects
+        .filter(graph_name=name, sampled_at__gte=timezone.now() - timedelta(minutes=minutes))
+        .order_by("sampled_at")
+        .values_list("container_name", "replica", "sampled_at", "cpu_percent", "memory_mb", "memory_limit_mb", "cache_mb")
+    )
+    containers = {}
+    for container_name, replica, sampled_at, cpu, memory, limit, cache in samples:
+        containers.setdefault(container_name, {"replica": replica, "points": []})["points"].append({
+            "t": sampled_at.isoformat(),
+            "cpu_percent": cpu,
+            "memory_mb": memory,
+            "memory_limit_mb": limit,
+            "cache_mb": cache,
+        })
+
+    return JsonResponse({
+        "success": True,
+        "graph_name": name,
+        "interval": VALHALLA_METRICS_INTERVAL,
+        "minutes": minutes,
+        "containers": containers,
+        "latest": _latest_metrics(name).get(name),
+    })
+
+
 # ─────────────────────────
 # Configuration valhalla_serve.json (GET/POST)
 # ─────────────────────────
 def _get_task_by_name_or_404(name: str) -> BuildTask:
+    # La release en service d'abord (un rebuild en cours a sa propre release, pas encore servie)
     task = (
         BuildTask.objects
         .filter(name=name)
-        .order_by("-created_at")
+        .order_by("-is_serving", "-created_at")
         .first()
     )
     if not task:
@@ -707,10 +907,15 @@ def graph_config(request, name):
     """GET → retourne le contenu JSON de valhalla_serve.json
        POST → met à jour le valhalla_serve.json (backup + écriture),
                optionnellement redémarre le container si ?restart=true
+       ?section=profile → profil de service (threads, ressources, cache de tuiles)
     """
     task = _get_task_by_name_or_404(name)
-    serve_path = os.path.join(task.output_dir or "", "valhalla_serve.json")
-    base_path = os.path.join(task.output_dir or "", "valhalla.json")
+    if request.GET.get("section") == "profile":
+        return _graph_serve_profile(request, task)
+
+    serve_dir = task.serve_dir or ""
+    serve_path = os.path.join(serve_dir, "valhalla_serve.json")
+    base_path = os.path.join(serve_dir, "valhalla.json")
 
     if request.method == "GET":
         # Si valhalla_serve.json n'existe pas encore, tenter de le dériver
@@ -725,8 +930,8 @@ def graph_config(request, name):
                             return {k: replace_paths(v) for k, v in obj.items()}
                         elif isinstance(obj, list):
                             return [replace_paths(item) for item in obj]
-                        elif isinstance(obj, str) and task.output_dir in obj:
-                            return obj.replace(task.output_dir, "/data/valhalla")
+                        elif isinstance(obj, str) and serve_dir and serve_dir in obj:
+                            return obj.replace(serve_dir, "/data/valhalla")
                         return obj
 
                     cfg = replace_paths(cfg)
@@ -840,13 +1045,15 @@ def graph_config(request, name):
     restart_result = None
     if restart:
         try:
-            manager = ValhallaDockerManager()
+            manager = get_manager()
             restart_result = manager.restart_container(task.name)
+            container_state.invalidate()
             if restart_result.get("status") == "restarted":
                 task.is_serving = True
                 task.serve_port = restart_result.get("port")
+                task.serve_ports = restart_result.get("ports") or []
                 task.add_log("🔄 Config mise à jour, container redémarré")
-                task.save(update_fields=["is_serving", "serve_port", "logs"])
+                task.save(update_fields=["is_serving", "serve_port", "serve_ports"])
             else:
                 return JsonResponse({
                     "success": False,
@@ -864,6 +1071,39 @@ def graph_config(request, name):
     })
 
 
+def _graph_serve_profile(request, task: BuildTask):
+    """GET → profil de service du graph (saisi, effectif, défauts)
+       POST → enregistre le profil ; ?restart=true l'applique à chaud (basculement blue/green)
+    """
+    if request.method == "GET":
+        return JsonResponse({
+            "profile": task.serve_profile or {},
+            "effective": effective_profile(task.serve_profile),
+            "defaults": DEFAULT_PROFILE,
+        })
+
+    try:
+        payload = json.loads(request.body.decode("utf-8"))
+    except Exception as e:
+        return JsonResponse({"success": False, "message": f"JSON invalide: {str(e)}"}, status=400)
+    profile, error = validate_profile(payload)
+    if error:
+        return JsonResponse({"success": False, "message": error}, status=400)
+
+    task.serve_profile = profile
+    task.save(update_fields=["serve_profile"])
+
+    restart = request.GET.get("restart") in ["1", "true", "True"] and task.is_serving
+    if restart:
+        ensure_valhalla_running.delay(task.id, reload=True)
+    return JsonResponse({
+        "success": True,
+        "message": "Profil sauvegardé" + (", application en cours..." if restart else ""),
+        "effective": effective_profile(profile),
+        "restarted": restart,
+    })
+
+
 def config_schema(request):
     schema_path = os.path.join(os.path.dirname(__file__), "..", "config", "valhalla_schema.json")
     try:
@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+from celery.schedules import crontab
 BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = os.getenv("DJANGO_SECRET_KEY","devkey")
 DEBUG = True
@@ -57,8 +58,22 @@ STATIC_URL="/static/"
 MEDIA_ROOT="/app/media"
 MEDIA_URL="/media/"
 CELERY_BROKER_URL="redis://redis:6379/0"
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    # Cache des réponses du proxy Valhalla (api/response_cache.py), base Redis dédiée
+    "valhalla_proxy": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("VALHALLA_PROXY_CACHE_URL", "redis://redis:6379/2"),
+        "KEY_PREFIX": "valhalla",
+    },
+}
 DEFAULT_AUTO_FIELD='django.db.models.AutoField'
 ROOT_URLCONF = "valhalla_admin.urls"
+# Proxy Valhalla asynchrone (httpx) quand Django est servi en ASGI (uvicorn, voir asgi.py)
+VALHALLA_ASYNC_PROXY = (
+    os.getenv("VALHALLA_ASGI") == "1"
+    and os.getenv("VALHALLA_ASYNC_PROXY", "1") not in ("0", "false", "False")
+)
 #LOGIN
 LOGIN_URL = "/admin/login/"
 LOGIN_REDIRECT_URL = "/"
@@ -80,6 +95,23 @@ CELERY_RESULT_SERIALIZER = "json"
 CELERY_RESULT_BACKEND = "redis://redis:6379/0"
 CELERY_ENABLE_UTC = True
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    # Diffs quotidiens Geofabrik appliqués aux PBF sources (/data/sources/osm)
+    "refresh-osm-sources": {
+        "task": "valhalla_admin.graph.tasks.refresh_osm_sources",
+        "schedule": crontab(hour=4, minute=30),
+    },
+    # Métriques CPU/mémoire des containers Valhalla (graph/metrics.py)
+    "collect-container-metrics": {
+        "task": "valhalla_admin.graph.tasks.collect_container_metrics",
+        "schedule": float(os.getenv("VALHALLA_METRICS_INTERVAL", "60")),
+    },
+    # Réservations de ports alignées sur Docker (graph/ports.py)
+    "reconcile-port-reservations": {
+        "task": "valhalla_admin.graph.tasks.reconcile_port_reservations",
+        "schedule": crontab(minute="*/5"),
+    },
+}
 
 # External APIs
 GTFS_SOURCE_API_URL = os.getenv("GTFS_SOURCE_API_URL", "https://transport.data.gouv.fr/api/datasets?format=gtfs")
\ No newline at end of file
@@ -60,7 +60,14 @@ if [ "$RUN_APACHE" = "1" ]; then
         echo "[ERROR] /app/uwsgi.ini not found!"
         ls -l /app/
     fi
-    apache2ctl -D FOREGROUND
+    # Proxy Valhalla asynchrone (uvicorn/ASGI) pour /valhalla/<alias>/api/
+    if [ "${VALHALLA_ASYNC_PROXY:-1}" != "0" ]; then
+        uvicorn valhalla_admin.asgi:application --host 127.0.0.1 --port 8003 \
+            --workers "${ASGI_WORKERS:-2}" --no-access-log &
+        apache2ctl -D ASYNC_PROXY -D FOREGROUND
+    else
+        apache2ctl -D FOREGROUND
+    fi
 fi
 
 exec "$@"
@@ -2,6 +2,10 @@
 set -e
 
 GRAPH_ROOT="$1"
+# Étape à exécuter (pilotée par run_valhalla_build) ; "all" = build complet historique
+STAGE="${2:-all}"
+# Dossier de sortie (release <graph>/releases/<id>) ; par défaut le graph lui-même
+OUT_ROOT="${3:-$GRAPH_ROOT}"
 
 if [ -z "$GRAPH_ROOT" ]; then
   echo "❌ Chemin du graph manquant"
@@ -15,16 +19,18 @@ fi
 
 GRAPH_NAME="$(basename "$GRAPH_ROOT")"
 
-BUILD_DIR="$GRAPH_ROOT/build"
+BUILD_DIR="$OUT_ROOT/build"
 
 GTFS_DIR="$GRAPH_ROOT/gtfs"              # feeds extraits: gtfs/<source_id>/*
 TRANSIT_FEEDS="$BUILD_DIR/transit-feeds"
 TILES_DIR="$BUILD_DIR/tiles"
+STAGES_DIR="$BUILD_DIR/stages"           # artefacts intermédiaires réutilisables entre builds
 
 OSM_FILE=$(ls "$GRAPH_ROOT"/osm/*.pbf 2>/dev/null | head -n 1)
 
-echo "🚀 Build Valhalla graph : $GRAPH_NAME"
+echo "🚀 Build Valhalla graph : $GRAPH_NAME (étape : $STAGE)"
 echo "📁 Graph root : $GRAPH_ROOT"
+echo "📁 Sortie : $OUT_ROOT"
 
 # ==========================
 # Vérifications minimales
@@ -34,43 +40,96 @@ if [ ! -f "$OSM_FILE" ]; then
   exit 1
 fi
 
-# ==========================buil
-# Préparation dossiers
 # ==========================
-rm -rf "$BUILD_DIR"
-mkdir -p "$TILES_DIR/valhalla"
+# Détection GTFS (optionnel)
+# ==========================
+# Cherche au moins un dossier contenant un feed "probable"
+# (on teste agency.txt ou stops.txt pour éviter les dossiers vides).
+# Même test que stage_transit : l'étape config (lancée seule) et transit sont d'accord.
+is_valid_feed() {
+  [ -d "$1" ] && { [ -f "$1/agency.txt" ] || [ -f "$1/stops.txt" ]; }
+}
 
-# On ne crée transit_dirs que si on détecte du GTFS
 HAS_GTFS=0
-
-# ==========================
-# Détection & copie GTFS (optionnel)
-# ==========================
 if [ -d "$GTFS_DIR" ]; then
-  # Cherche au moins un dossier contenant un feed "probable"
-  # (on teste agency.txt ou stops.txt pour éviter les dossiers vides)
   for D in "$GTFS_DIR"/*; do
-    if [ -d "$D" ]; then
-      if [ -f "$D/agency.txt" ] || [ -f "$D/stops.txt" ]; then
-        HAS_GTFS=1
-        break
-      fi
+    if is_valid_feed "$D"; then
+      HAS_GTFS=1
+      break
     fi
   done
 fi
 
-if [ "$HAS_GTFS" -eq 1 ]; then
+# ==========================
+# Timezones
+# ==========================
+stage_timezones() {
+  echo "🕒 Construction timezones…"
+  mkdir -p "$TILES_DIR"
+  valhalla_build_timezones > "$TILES_DIR/tz.sqlite.tmp"
+  mv "$TILES_DIR/tz.sqlite.tmp" "$TILES_DIR/tz.sqlite"
+}
+
+# ==========================
+# Config Valhalla
+# ==========================
+stage_config() {
+  echo "⚙️ Génération config…"
+  mkdir -p "$TILES_DIR"
+
+  if [ "$HAS_GTFS" -eq 1 ]; then
+    valhalla_build_config \
+      --mjolnir-tile-dir="$TILES_DIR/valhalla" \
+      --mjolnir-transit-dir="$TILES_DIR/transit_tiles" \
+      --mjolnir-transit-feeds-dir="$TRANSIT_FEEDS" \
+      --mjolnir-timezone="$TILES_DIR/tz.sqlite" \
+      --mjolnir-admin="$TILES_DIR/admin.sqlite" \
+      --mjolnir-tile-extract="$TILES_DIR/valhalla_tiles.tar" \
+      --mjolnir-concurrency=${MJOLNIR_CONCURRENCY:-8} \
+      > "$OUT_ROOT/valhalla.json"
+  else
+    # Pas de flags transit si pas de feeds
+    valhalla_build_config \
+      --mjolnir-tile-dir="$TILES_DIR/valhalla" \
+      --mjolnir-timezone="$TILES_DIR/tz.sqlite" \
+      --mjolnir-admin="$TILES_DIR/admin.sqlite" \
+      --mjolnir-tile-extract="$TILES_DIR/valhalla_tiles.tar" \
+      --mjolnir-concurrency=${MJOLNIR_CONCURRENCY:-8} \
+      > "$OUT_ROOT/valhalla.json"
+  fi
+}
+
+# ==========================
+# Admins (admin.sqlite)
+# ==========================
+stage_admins() {
+  echo "🌍 Build admin.sqlite…"
+  rm -f "$TILES_DIR/admin.sqlite"
+  valhalla_build_admins -c "$OUT_ROOT/valhalla.json" "$OSM_FILE"
+}
+
+# ==========================
+# Transit (optionnel) : feeds + ingest + convert
+# ==========================
+stage_transit() {
+  rm -rf "$TRANSIT_FEEDS" "$TILES_DIR/transit_tiles"
+
+  if [ "$HAS_GTFS" -ne 1 ]; then
+    echo "ℹ️ Aucun GTFS détecté → build OSM-only (sans transit)"
+    return 0
+  fi
+
   echo "📦 GTFS détecté → activation du transit"
   mkdir -p "$TRANSIT_FEEDS"
   mkdir -p "$TILES_DIR/transit_tiles"
 
-  echo "📦 Copie des GTFS extraits…"
+  echo "📦 Mise en place des GTFS extraits (hardlinks, copie en repli)…"
   for FEED in "$GTFS_DIR"/*; do
     if [ -d "$FEED" ]; then
       NAME=$(basename "$FEED")
 
       # skip dossiers non-feeds (ex: vides)
-      if [ ! -f "$FEED/agency.txt" ] && [ ! -f "$FEED/stops.txt" ]; then
+      if ! is_valid_feed "$FEED"; then
         echo "  ↷ $NAME ignoré (pas un feed GTFS valide: agency.txt/stops.txt manquant)"
         continue
       fi
@@ -78,7 +137,11 @@ if [ "$HAS_GTFS" -eq 1 ]; then
       OUT_DIR="$TRANSIT_FEEDS/$NAME"
       echo "  → $NAME"
       rm -rf "$OUT_DIR"
-      cp -r "$FEED" "$OUT_DIR"
+      # Même volume que gtfs/ : hardlinks plutôt qu'une copie (repli : reflink si possible, sinon copie)
+      if ! cp -al "$FEED" "$OUT_DIR" 2>/dev/null; then
+        rm -rf "$OUT_DIR"
+        cp -r --reflink=auto "$FEED" "$OUT_DIR"
+      fi
 
       if [ ! -f "$OUT_DIR/agency.txt" ]; then
         echo "⚠️ $NAME ne contient pas agency.txt (peut être OK selon feed)"
@@ -89,72 +152,76 @@ if [ "$HAS_GTFS" -eq 1 ]; then
   # Si finalement aucun feed copié (ex: tous invalides), on désactive transit
   if ! find "$TRANSIT_FEEDS" -mindepth 1 -maxdepth 1 -type d | grep -q .; then
     echo "⚠️ Aucun feed GTFS copié au final → désactivation transit"
-    HAS_GTFS=0
     rm -rf "$TRANSIT_FEEDS" "$TILES_DIR/transit_tiles"
+    HAS_GTFS=0
+    return 0
   fi
-else
-  echo "ℹ️ Aucun GTFS détecté → build OSM-only (sans transit)"
-fi
-
-# ==========================
-# Timezones
-# ==========================
-echo "🕒 Construction timezones…"
-valhalla_build_timezones > "$TILES_DIR/tz.sqlite"
 
-# ==========================
-# Config Valhalla
-# ==========================
-echo "⚙️ Génération config…"
-
-if [ "$HAS_GTFS" -eq 1 ]; then
-  valhalla_build_config \
-    --mjolnir-tile-dir="$TILES_DIR/valhalla" \
-    --mjolnir-transit-dir="$TILES_DIR/transit_tiles" \
-    --mjolnir-transit-feeds-dir="$TRANSIT_FEEDS" \
-    --mjolnir-timezone="$TILES_DIR/tz.sqlite" \
-    --mjolnir-tile-extract="$TILES_DIR/valhalla_tiles.tar" \
-    --mjolnir-concurrency=${MJOLNIR_CONCURRENCY:-8} \
-    > "$GRAPH_ROOT/valhalla.json"
-else
-  # Pas de flags transit si pas de feeds
-  valhalla_build_config \
-    --mjolnir-tile-dir="$TILES_DIR/valhalla" \
-    --mjolnir-timezone="$TILES_DIR/tz.sqlite" \
-    --mjolnir-tile-extract="$TILES_DIR/valhalla_tiles.tar" \
-    --mjolnir-concurrency=${MJOLNIR_CONCURRENCY:-8} \
-    > "$GRAPH_ROOT/valhalla.json"
-fi
+  echo "🚍 Ingest transit…"
+  valhalla_ingest_transit -c "$OUT_ROOT/valhalla.json"
 
-# ==========================
-# Admins (admin.sqlite)
-# ==========================
-echo "🌍 Build admin.sqlite…"
-valhalla_build_admins -c "$GRAPH_ROOT/valhalla.json" "$OSM_FILE"
+  echo "🔄 Convert transit…"
+  valhalla_convert_transit -c "$OUT_ROOT/valhalla.json"
+}
 
 # ==========================
-# Transit (optionnel)
+# OSM tiles (jusqu'à "filter", sans transit)
 # ==========================
-if [ "$HAS_GTFS" -eq 1 ]; then
-  echo "🚍 Ingest transit…"
-  valhalla_ingest_transit -c "$GRAPH_ROOT/valhalla.json"
-
-  echo "🔄 Convert transit…"
-  valhalla_convert_transit -c "$GRAPH_ROOT/valhalla.json"
-else
-  echo "⏭ Transit désactivé (pas de GTFS)"
-fi
+# Le résultat (tuiles + fichiers .bin intermédiaires) est conservé dans
+# $STAGES_DIR/osm_base : un changement GTFS seul repart de cette base.
+stage_osm_tiles() {
+  echo "🗺 Build OSM tiles (initialize → filter)…"
+  rm -rf "$TILES_DIR/valhalla" "$STAGES_DIR/osm_base"
+  mkdir -p "$TILES_DIR/valhalla" "$STAGES_DIR"
+  valhalla_build_tiles -c "$OUT_ROOT/valhalla.json" -e filter "$OSM_FILE"
+  mv "$TILES_DIR/valhalla" "$STAGES_DIR/osm_base"
+}
 
 # ==========================
-# OSM tiles
+# Graph final (transit → cleanup) à partir de la base OSM
 # ==========================
-echo "🗺 Build OSM tiles…"
-valhalla_build_tiles -c "$GRAPH_ROOT/valhalla.json" "$OSM_FILE"
+stage_graph() {
+  if [ ! -d "$STAGES_DIR/osm_base" ]; then
+    echo "❌ Base OSM absente ($STAGES_DIR/osm_base) : relancer l'étape osm_tiles"
+    exit 1
+  fi
+  echo "🧱 Build graph (transit → cleanup)…"
+  rm -rf "$TILES_DIR/valhalla"
+  # Copie (reflink si possible) : les étapes suivantes réécrivent les tuiles en place
+  cp -a --reflink=auto "$STAGES_DIR/osm_base" "$TILES_DIR/valhalla"
+  valhalla_build_tiles -c "$OUT_ROOT/valhalla.json" -s transit -e cleanup "$OSM_FILE"
+}
 
 # ==========================
 # Extract final
 # ==========================
-echo "📦 Build extract…"
-valhalla_build_extract -c "$GRAPH_ROOT/valhalla.json"
-
-echo "🎉 Graph $GRAPH_NAME prêt !"
+stage_extract() {
+  echo "📦 Build extract…"
+  rm -f "$TILES_DIR/valhalla_tiles.tar"
+  valhalla_build_extract -c "$OUT_ROOT/valhalla.json"
+}
+
+case "$STAGE" in
+  all)
+    # Build complet : repart de zéro
+    mkdir -p "$OUT_ROOT"
+    rm -rf "$BUILD_DIR"
+    mkdir -p "$TILES_DIR/valhalla"
+    stage_timezones
+    stage_config
+    stage_admins
+    stage_transit
+    stage_osm_tiles
+    stage_graph
+    stage_extract
+    ;;
+  timezones|config|admins|transit|osm_tiles|graph|extract)
+    "stage_$STAGE"
+    ;;
+  *)
+    echo "❌ Étape inconnue : $STAGE"
+    exit 1
+    ;;
+esac
+
+echo "🎉 Graph $GRAPH_NAME : étape $STAGE terminée"
@@ -4,24 +4,10 @@ set -eu
 # Ensure base dir exists
 mkdir -p /data/graphs
 
-echo "[valhalla-toolbox] Ready. Following build logs under /data/graphs" >&2
+# Les builds sont lancés par `docker exec` depuis le worker : leur sortie complète est
+# archivée par tâche (/data/graphs/<graph>/logs/<task_id>/, segments gzip) et consultable
+# dans l'admin (graph/task/<id>/build-log/). Plus de build.log en clair à suivre ici.
+echo "[valhalla-toolbox] Ready. Build logs are archived under /data/graphs/<graph>/logs/" >&2
 
-# Track tailed files using marker files
-mkdir -p /tmp/valhalla-tail
-
-# Periodically discover new build.log files and tail them to stdout
-while :; do
-  # Search typical depths: /data/graphs/<graph>/build.log or nested /build/build.log
-  for f in /data/graphs/*/build.log /data/graphs/*/*/build.log; do
-    [ -f "$f" ] || continue
-    key="/tmp/valhalla-tail/$(echo "$f" | sed 's#[^A-Za-z0-9]#_#g')"
-    if [ ! -e "$key" ]; then
-      echo "[valhalla-toolbox] Following $f" >&2
-      : > "$key"
-      # Tail in background; output goes to container stdout/stderr
-      # -n 0: only new lines; -F: follow across rotations/moves
-      tail -n 0 -F "$f" 2>&1 &
-    fi
-  done
-  sleep 2
-done
+# Garder le container actif pour les `docker exec`
+exec tail -f /dev/null